@@ -0,0 +1,231 @@
+# Access Log Ingestion for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Group commit of access_logs and risk_assessments rows across request threads
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import mysql.connector
+from mysql.connector import errors
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_COLUMNS = ('student_id', 'card_id', 'location_id', 'access_type', 'access_time',
+                      'access_granted', 'denial_reason', 'ip_address', 'user_agent',
+                      'risk_score', 'requires_review')
+RISK_ASSESSMENT_COLUMNS = ('student_id', 'location_id', 'access_time', 'risk_score',
+                           'risk_level', 'risk_factors', 'action_taken')
+
+def multi_row_insert(table, columns, row_count, ignore=False):
+    """INSERT (or INSERT IGNORE) statement with ``row_count`` placeholder groups"""
+    group = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    return (f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) VALUES " +
+            ', '.join([group] * row_count))
+
+def auto_increment_step(conn):
+    """Server's auto_increment_increment: the gap between the ids of one multi-row INSERT"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT @@auto_increment_increment")
+        row = cursor.fetchone()
+        return int(row[0]) if row else 1
+    finally:
+        cursor.close()
+
+def insert_access_records(cursor, records, id_step=1):
+    """Insert access_logs + risk_assessments rows with one statement per table.
+
+    ``records`` are ``(access_log, risk_assessment)`` tuples of column
+    values in ``ACCESS_LOG_COLUMNS`` / ``RISK_ASSESSMENT_COLUMNS`` order.
+    Returns the new log_id of each record: InnoDB hands a multi-row INSERT
+    consecutive ids (``auto_increment_increment`` apart) and reports the
+    first one as ``lastrowid``. The caller owns the transaction.
+    """
+    cursor.execute(multi_row_insert('access_logs', ACCESS_LOG_COLUMNS, len(records)),
+                   [value for access_log, _ in records for value in access_log])
+    first_id = cursor.lastrowid
+    cursor.execute(multi_row_insert('risk_assessments', RISK_ASSESSMENT_COLUMNS, len(records)),
+                   [value for _, risk_assessment in records for value in risk_assessment])
+    return [first_id + index * id_step for index in range(len(records))]
+
+class AccessLogIngestor:
+    """Group commit for access_logs and risk_assessments.
+
+    Request threads call ``log()`` with a scan's rows and block until they
+    are committed. A single flusher thread collects the rows every request
+    thread submitted within ``max_wait_ms`` (up to ``max_batch_size``) and
+    writes them as one multi-row INSERT per table in one transaction, so a
+    busy scanner fleet pays one commit - one fsync - per batch instead of
+    one per tap. If a batch is rejected, its rows are retried one by one so
+    a single bad row cannot fail the others.
+    """
+
+    def __init__(self, connection_factory, max_batch_size=256, max_wait_ms=5,
+                 max_queue_size=10000, result_timeout=5.0):
+        self.connection_factory = connection_factory
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.result_timeout = result_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._id_step = None
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'batches': 0,
+            'rows': 0,
+            'max_batch': 0,
+            'total_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_wait_ms': 0.0,
+            'row_fallbacks': 0,
+            'errors': 0
+        }
+
+    def submit(self, access_log, risk_assessment):
+        """Queue one scan's rows; the Future resolves to its log_id"""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put((access_log, risk_assessment, future, time.perf_counter()),
+                            timeout=self.result_timeout)
+        except queue.Full:
+            future.set_exception(errors.OperationalError("Access log queue is full"))
+        return future
+
+    def log(self, access_log, risk_assessment):
+        """Write one scan's rows through the next group commit and return its log_id"""
+        try:
+            return self.submit(access_log, risk_assessment).result(timeout=self.result_timeout)
+        except FutureTimeout:
+            raise errors.OperationalError("Timed out waiting for the access log flush")
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher after it drains what is already queued"""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def metrics(self):
+        """Batch size and flush latency"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        batches = m['batches'] or 1
+        return {
+            'batches': m['batches'],
+            'rows': m['rows'],
+            'queued': self._queue.qsize(),
+            'avg_batch_size': round(m['rows'] / batches, 2),
+            'max_batch_size_seen': m['max_batch'],
+            'avg_flush_ms': round(m['total_flush_ms'] / batches, 3),
+            'max_flush_ms': round(m['max_flush_ms'], 3),
+            'avg_queue_wait_ms': round(m['total_wait_ms'] / (m['rows'] or 1), 3),
+            'row_fallbacks': m['row_fallbacks'],
+            'errors': m['errors'],
+            'config': {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms
+            }
+        }
+
+    def id_step(self, conn):
+        """Server's auto_increment_increment (the gap between multi-row INSERT ids)"""
+        if self._id_step is None:
+            self._id_step = auto_increment_step(conn)
+        return self._id_step
+
+    def _ensure_worker(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='access-log-ingest', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = first[3] + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        flushed_at = time.perf_counter()
+        conn = None
+        try:
+            conn = self.connection_factory()
+            if conn is None:
+                raise errors.InterfaceError("No database connection")
+            self.id_step(conn)
+            try:
+                log_ids = self._write(conn, [(item[0], item[1]) for item in batch])
+                for item, log_id in zip(batch, log_ids):
+                    item[2].set_result(log_id)
+            except mysql.connector.Error as err:
+                if len(batch) == 1:
+                    raise
+                logger.warning(f"Access log batch of {len(batch)} failed ({err}); retrying rows one by one")
+                with self._metrics_lock:
+                    self._metrics['row_fallbacks'] += 1
+                for item in batch:
+                    try:
+                        item[2].set_result(self._write(conn, [(item[0], item[1])])[0])
+                    except mysql.connector.Error as row_err:
+                        item[2].set_exception(row_err)
+        except Exception as err:
+            # Anything, not just database errors: the flusher must survive and
+            # no caller may be left waiting on a Future that never resolves
+            logger.error(f"Access log flush failed: {err}")
+            with self._metrics_lock:
+                self._metrics['errors'] += 1
+            failure = err if isinstance(err, mysql.connector.Error) else errors.OperationalError(
+                f"Access log flush failed: {err}")
+            for item in batch:
+                if not item[2].done():
+                    item[2].set_exception(failure)
+        finally:
+            if conn is not None:
+                conn.close()
+
+        flush_ms = (time.perf_counter() - flushed_at) * 1000
+        with self._metrics_lock:
+            m = self._metrics
+            m['batches'] += 1
+            m['rows'] += len(batch)
+            m['max_batch'] = max(m['max_batch'], len(batch))
+            m['total_flush_ms'] += flush_ms
+            m['max_flush_ms'] = max(m['max_flush_ms'], flush_ms)
+            m['total_wait_ms'] += sum((flushed_at - item[3]) * 1000 for item in batch)
+
+    def _write(self, conn, records):
+        """Insert records in one transaction and return their log_ids"""
+        conn.start_transaction()
+        cursor = conn.cursor()
+        try:
+            log_ids = insert_access_records(cursor, records, self._id_step)
+            conn.commit()
+            return log_ids
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
@@ -4,218 +4,397 @@
 
 import numpy as np
 import json
-import random
 from datetime import datetime, timedelta
 from collections import defaultdict
 import logging
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import DBSCAN
 import pickle
 import os
+import sys
+import time
+import threading
+import warnings
 from pathlib import Path
+from compiled_forest import CompiledForest, AffineScaler, save_runtime, load_runtime
 
 logger = logging.getLogger(__name__)
 
+# Bump when the layout of models/ai_models.pkl changes
+MODEL_FORMAT_VERSION = 2
+# Artifacts written before versioning share the current layout
+COMPATIBLE_FORMAT_VERSIONS = (1, 2)
+
+# Synthetic training data at scale=1 (generate_training_data multiplies these)
+SYNTHETIC_DATA_SIZES = {
+    'normal_access_days': 2000,   # Student-days of 1-3 normal accesses
+    'anomaly_events': 500,        # Anomalous episodes
+    'incident_days': 200,         # Days with an incident
+    'normal_days': 800,           # Days without one
+    'backup_runs': 100
+}
+
+# Deviation from the student's own baseline (student_profiles.py) at which
+# an access is flagged whatever the global model says (inclusive), and the
+# score given to an access right at it; larger deviations score lower
+BASELINE_DEVIATION_THRESHOLD = 0.7
+BASELINE_DEVIATION_SCORE = -0.05
+# Score given to a tap the card could not have walked to in time
+IMPOSSIBLE_TRAVEL_SCORE = -0.35
+
 class SecurityAIEngine:
     """Advanced AI Engine for Security Analysis and Prediction"""
     
-    def __init__(self):
-        self.models = {
+    def __init__(self, model_dir='models'):
+        # Models and scalers live in one tuple so a swap replaces both at once
+        self._live = ({
             'anomaly_detector': None,
             'incident_predictor': None,
             'backup_optimizer': None,
             'behavior_analyzer': None
-        }
-        self.scalers = {
-            'access_patterns': StandardScaler(),
-            'incident_features': StandardScaler()
-        }
-        self.training_data = {
-            'access_patterns': [],
-            'incidents': [],
-            'backup_patterns': []
-        }
-        self.model_dir = Path("models")
+        }, {
+            'access_patterns': None,
+            'incident_features': None
+        })
+        self._runtime_mtime = None
+        self._runtime_source = None  # source_created_at of the loaded runtime: which full train it came from
+        self.training_data = {}
+        self.model_dir = Path(model_dir)
         self.model_dir.mkdir(exist_ok=True)
+        self._training_thread = None
+        self._shadow = None
+        self._shadow_mtime = None
+    
+    @property
+    def models(self):
+        return self._live[0]
+    
+    @models.setter
+    def models(self, models):
+        self._live = (models, self._live[1])
+    
+    @property
+    def scalers(self):
+        return self._live[1]
+    
+    @scalers.setter
+    def scalers(self, scalers):
+        self._live = (self._live[0], scalers)
+    
+    def initialize(self, train_if_missing='background', prefer_compiled=True):
+        """Load the saved model artifact, deferring training if there is none
+
+        With ``prefer_compiled`` the NumPy-only models/ai_runtime.npz is
+        tried first, so scoring never imports scikit-learn; otherwise (or
+        if it is missing) models/ai_models.pkl is unpickled.
+        ``train_if_missing`` decides what happens when neither is usable:
+        'background' serves rule-based results while a daemon thread trains
+        and installs new models, 'sync' trains before returning, and 'never'
+        stays on the rule-based fallback until ``python ai_engine.py train``
+        has been run.
+        """
+        if prefer_compiled and self._load_runtime():
+            return True
+        if self._load_models():
+            return True
         
-        # Initialize with training data generation
-        self.generate_training_data()
+        if train_if_missing == 'sync':
+            self.retrain()
+        else:
+            self._initialize_fallback_models()
+            if train_if_missing == 'background':
+                self.start_background_training()
+        return False
+    
+    def retrain(self, scale=1.0, seed=None):
+        """Regenerate training data, train every model and save the artifact"""
+        self.generate_training_data(scale, seed)
         self.train_models()
     
-    def generate_training_data(self):
-        """Generate realistic training data for new system"""
+    def start_background_training(self):
+        """Train on a separate engine in a daemon thread, then install the result"""
+        if self._training_thread and self._training_thread.is_alive():
+            return self._training_thread
+        
+        def run():
+            trainer = SecurityAIEngine()
+            trainer.retrain()
+            if trainer.models['anomaly_detector'] != 'rule_based':
+                self._install_models(trainer.models, trainer.scalers)
+                logger.info("Background-trained AI models installed")
+        
+        self._training_thread = threading.Thread(target=run, name='ai-model-training', daemon=True)
+        self._training_thread.start()
+        return self._training_thread
+    
+    def _install_models(self, models, scalers):
+        """Replace the live models and scalers in one assignment"""
+        self._live = (models, scalers)
+    
+    def reload_if_changed(self):
+        """Hot-swap in models/ai_runtime.npz if it was rewritten since it was loaded"""
+        runtime_file = self.model_dir / 'ai_runtime.npz'
+        try:
+            mtime = runtime_file.stat().st_mtime
+        except OSError:
+            return False
+        if mtime == self._runtime_mtime:
+            return False
+        return self._load_runtime()
+    
+    def sync_shadow(self, candidate_dir=None, **shadow_options):
+        """Shadow-score with the candidate artifact in ``candidate_dir``, if there is one
+
+        Defaults to models/candidate/. Starts a ``ShadowScorer`` when a
+        candidate appears or is replaced by a new full train and stops it
+        when the candidate is removed. An online update of the same candidate
+        is loaded into the running scorer, which keeps the comparison it has
+        collected. Returns True while a shadow model is running.
+        """
+        candidate_dir = Path(candidate_dir) if candidate_dir else self.model_dir / 'candidate'
+        mtime = self._candidate_mtime(candidate_dir)
+        if mtime is None:
+            self.stop_shadow()
+            return False
+        if mtime == self._shadow_mtime:
+            return True
+        
+        shadow = self._shadow
+        if shadow is not None and shadow.source == str(candidate_dir):
+            candidate = shadow.candidate
+            source = candidate._runtime_source
+            if source is not None and candidate.reload_if_changed() and candidate._runtime_source == source:
+                self._shadow_mtime = mtime
+                logger.info(f"Shadow candidate in {candidate_dir} refreshed in place")
+                return True
+        
+        from shadow_scoring import ShadowScorer
+        candidate = SecurityAIEngine(candidate_dir)
+        if not candidate.initialize(train_if_missing='never'):
+            logger.warning(f"Ignoring unusable shadow candidate in {candidate_dir}")
+            self._shadow_mtime = mtime
+            self.stop_shadow(keep_mtime=True)
+            return False
+        
+        previous = self._shadow
+        self._shadow = ShadowScorer(candidate, source=str(candidate_dir), **shadow_options)
+        self._shadow_mtime = mtime
+        if previous is not None:
+            previous.stop()
+        logger.info(f"Shadow scoring started with the candidate models in {candidate_dir}")
+        return True
+    
+    def stop_shadow(self, keep_mtime=False):
+        """Stop shadow scoring (the candidate files are left alone)"""
+        shadow, self._shadow = self._shadow, None
+        if not keep_mtime:
+            self._shadow_mtime = None
+        if shadow is not None:
+            shadow.stop()
+            logger.info("Shadow scoring stopped")
+    
+    def shadow_report(self):
+        """Live vs candidate comparison, or None when no shadow model is running"""
+        shadow = self._shadow
+        return shadow.report() if shadow is not None else None
+    
+    def promote_shadow(self):
+        """Move the candidate artifact over the live one and load it
+
+        Other workers pick it up through ``reload_if_changed()``. Returns
+        False if there is no shadow candidate.
+        """
+        shadow = self._shadow
+        if shadow is None:
+            return False
+        candidate_dir = Path(shadow.source)
+        # The .pkl first: the .npz rename is what other workers notice
+        for name in ('ai_models.pkl', 'ai_runtime.npz'):
+            if (candidate_dir / name).exists():
+                os.replace(candidate_dir / name, self.model_dir / name)
+        self.stop_shadow()
+        promoted = self._load_runtime() or self._load_models()
+        logger.info(f"Shadow candidate from {candidate_dir} promoted to live")
+        return promoted
+    
+    def discard_shadow(self):
+        """Stop shadow scoring and delete the candidate artifact"""
+        shadow = self._shadow
+        if shadow is None:
+            return False
+        self.stop_shadow()
+        for name in ('ai_models.pkl', 'ai_runtime.npz'):
+            try:
+                os.remove(Path(shadow.source) / name)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Shadow candidate in {shadow.source} discarded")
+        return True
+    
+    @staticmethod
+    def _candidate_mtime(candidate_dir):
+        mtimes = []
+        for name in ('ai_runtime.npz', 'ai_models.pkl'):
+            try:
+                mtimes.append((candidate_dir / name).stat().st_mtime)
+            except OSError:
+                pass
+        return max(mtimes) if mtimes else None
+    
+    def generate_training_data(self, scale=1.0, seed=None):
+        """Generate realistic training data for new system
+
+        Every generator emits feature matrices directly. ``scale`` multiplies
+        the number of simulated days/events (the defaults give about 5,000
+        access rows); ``seed`` makes the data reproducible.
+        """
         logger.info("Generating AI training data...")
+        rng = np.random.default_rng(seed)
+        now = np.datetime64(datetime.now(), 's').astype(np.int64)
+        sizes = {name: max(1, int(round(count * scale))) for name, count in SYNTHETIC_DATA_SIZES.items()}
         
         # Generate synthetic access patterns (simulating 6 months of data)
-        self._generate_access_patterns()
+        access_features, access_is_anomaly = self._generate_access_patterns(
+            rng, now, sizes['normal_access_days'], sizes['anomaly_events'])
         
         # Generate incident scenarios
-        self._generate_incident_patterns()
+        incident_features, incident_labels = self._generate_incident_patterns(
+            rng, now, sizes['incident_days'], sizes['normal_days'])
         
         # Generate backup patterns
-        self._generate_backup_patterns()
+        backup_features, backup_optimal = self._generate_backup_patterns(rng, now, sizes['backup_runs'])
         
-        logger.info(f"Generated {len(self.training_data['access_patterns'])} access patterns, "
-                   f"{len(self.training_data['incidents'])} incidents, "
-                   f"{len(self.training_data['backup_patterns'])} backup scenarios")
+        self.training_data = {
+            'access_features': access_features,
+            'access_is_anomaly': access_is_anomaly,
+            'incident_features': incident_features,
+            'incident_labels': incident_labels,
+            'backup_features': backup_features,
+            'backup_optimal': backup_optimal
+        }
+        logger.info(f"Generated {len(access_features)} access patterns, "
+                   f"{len(incident_features)} incidents, "
+                   f"{len(backup_features)} backup scenarios")
     
-    def _generate_access_patterns(self):
-        """Generate realistic access pattern training data"""
-        students = ['BAIT/21D/U/F0069', 'BACS/22D/U/A0024', 'BAIT/23D/U/F0156', 'BCSE/20D/U/A0012', 'BAIT/22E/K/F0087']
-        locations = list(range(1, 13))  # 12 campus locations
+    @staticmethod
+    def _hour_and_weekday(seconds):
+        """Hour of day and weekday (Monday=0) of naive epoch seconds"""
+        days = seconds // 86400
+        return (seconds // 3600) % 24, (days + 3) % 7  # 1970-01-01 was a Thursday
+    
+    def _generate_access_patterns(self, rng, now, normal_days, anomaly_events):
+        """Generate realistic access pattern training data
+
+        Returns the N x 6 ``_access_feature_matrix`` layout and the anomaly
+        flag of each row.
+        """
+        # Normal patterns: students typically access 1-3 locations per day,
+        # during normal hours, some day in the last 6 months
+        per_day = rng.integers(1, 4, normal_days)
+        base_time = np.repeat(now - rng.integers(1, 181, normal_days) * 86400, per_day)
+        n = len(base_time)
+        access_time = base_time + rng.integers(8, 19, n) * 3600 + rng.integers(0, 60, n) * 60
+        hour, weekday = self._hour_and_weekday(access_time)
+        normal = np.column_stack([
+            hour, weekday, weekday >= 5,
+            np.ones(n),                   # locations_per_hour
+            rng.integers(30, 181, n),     # time_between_access (minutes)
+            rng.integers(1, 4, n)         # risk_score
+        ])
         
-        # Normal patterns (80% of data)
-        for _ in range(2000):
-            student = random.choice(students)
-            
-            # Normal daily pattern
-            base_time = datetime.now() - timedelta(days=random.randint(1, 180))
-            
-            # Students typically access 1-3 locations per day
-            daily_locations = random.sample(locations, random.randint(1, 3))
-            
-            for loc in daily_locations:
-                access_time = base_time + timedelta(
-                    hours=random.randint(8, 18),  # Normal hours
-                    minutes=random.randint(0, 59)
-                )
-                
-                pattern = {
-                    'student_id': student,
-                    'location_id': loc,
-                    'access_time': access_time,
-                    'hour': access_time.hour,
-                    'day_of_week': access_time.weekday(),
-                    'is_weekend': access_time.weekday() >= 5,
-                    'locations_per_hour': 1,
-                    'time_between_access': random.randint(30, 180),  # minutes
-                    'is_anomaly': False,
-                    'risk_score': random.randint(1, 3)
-                }
-                self.training_data['access_patterns'].append(pattern)
+        # Anomalous patterns: multiple_locations, off_hours, rapid_succession
+        # and unusual_pattern are equally likely; only the first two produce rows
+        anomaly_type = rng.integers(0, 4, anomaly_events)
+        base_time = now - rng.integers(1, 181, anomaly_events) * 86400
         
-        # Anomalous patterns (20% of data)
-        for _ in range(500):
-            student = random.choice(students)
-            base_time = datetime.now() - timedelta(days=random.randint(1, 180))
-            
-            # Anomaly types
-            anomaly_type = random.choice([
-                'multiple_locations',  # Many locations in short time
-                'off_hours',          # Access at unusual hours
-                'rapid_succession',   # Very fast access attempts
-                'unusual_pattern'     # Completely different from normal
-            ])
-            
-            if anomaly_type == 'multiple_locations':
-                # Student accessing many locations quickly
-                num_locations = random.randint(5, 10)
-                selected_locations = random.sample(locations, num_locations)
-                
-                for i, loc in enumerate(selected_locations):
-                    access_time = base_time + timedelta(minutes=i * random.randint(1, 10))
-                    pattern = {
-                        'student_id': student,
-                        'location_id': loc,
-                        'access_time': access_time,
-                        'hour': access_time.hour,
-                        'day_of_week': access_time.weekday(),
-                        'is_weekend': access_time.weekday() >= 5,
-                        'locations_per_hour': num_locations,
-                        'time_between_access': random.randint(1, 10),
-                        'is_anomaly': True,
-                        'risk_score': random.randint(7, 10)
-                    }
-                    self.training_data['access_patterns'].append(pattern)
-            
-            elif anomaly_type == 'off_hours':
-                # Access during unusual hours
-                unusual_hour = random.choice([0, 1, 2, 3, 22, 23])
-                access_time = base_time.replace(hour=unusual_hour, minute=random.randint(0, 59))
-                
-                pattern = {
-                    'student_id': student,
-                    'location_id': random.choice(locations),
-                    'access_time': access_time,
-                    'hour': access_time.hour,
-                    'day_of_week': access_time.weekday(),
-                    'is_weekend': access_time.weekday() >= 5,
-                    'locations_per_hour': 1,
-                    'time_between_access': random.randint(60, 300),
-                    'is_anomaly': True,
-                    'risk_score': random.randint(6, 9)
-                }
-                self.training_data['access_patterns'].append(pattern)
+        # Student accessing many locations quickly
+        burst_base = base_time[anomaly_type == 0]
+        num_locations = rng.integers(5, 11, len(burst_base))
+        starts = np.repeat(np.cumsum(num_locations) - num_locations, num_locations)
+        step = np.arange(num_locations.sum()) - starts
+        n = len(step)
+        access_time = np.repeat(burst_base, num_locations) + step * rng.integers(1, 11, n) * 60
+        hour, weekday = self._hour_and_weekday(access_time)
+        multiple_locations = np.column_stack([
+            hour, weekday, weekday >= 5,
+            np.repeat(num_locations, num_locations),
+            rng.integers(1, 11, n),
+            rng.integers(7, 11, n)
+        ])
+        
+        # Access during unusual hours (same day, hour and minute replaced)
+        off_hours_base = base_time[anomaly_type == 1]
+        n = len(off_hours_base)
+        _, weekday = self._hour_and_weekday(off_hours_base)
+        off_hours = np.column_stack([
+            rng.choice([0, 1, 2, 3, 22, 23], n), weekday, weekday >= 5,
+            np.ones(n),
+            rng.integers(60, 301, n),
+            rng.integers(6, 10, n)
+        ])
+        
+        features = np.vstack([normal, multiple_locations, off_hours]).astype(float)
+        is_anomaly = np.zeros(len(features), dtype=bool)
+        is_anomaly[len(normal):] = True
+        return features, is_anomaly
     
-    def _generate_incident_patterns(self):
-        """Generate incident pattern training data"""
-        incident_types = [
-            'unauthorized_access', 'lost_card_used', 'multiple_failed_attempts',
-            'tailgating', 'system_breach', 'policy_violation'
-        ]
+    def _generate_incident_patterns(self, rng, now, incident_days, normal_days):
+        """Generate incident pattern training data
+
+        Returns the M x 9 ``predict_incident_risk`` layout and whether an
+        incident occurred on each row.
+        """
+        def calendar(count):
+            hour, weekday = self._hour_and_weekday(now - rng.integers(1, 181, count) * 86400)
+            return hour, weekday, weekday >= 5
         
-        for _ in range(200):
-            incident_time = datetime.now() - timedelta(days=random.randint(1, 180))
-            
-            # Features that predict incidents
-            incident = {
-                'incident_type': random.choice(incident_types),
-                'hour': incident_time.hour,
-                'day_of_week': incident_time.weekday(),
-                'is_weekend': incident_time.weekday() >= 5,
-                'failed_attempts_before': random.randint(0, 10),
-                'unusual_access_patterns': random.randint(0, 5),
-                'off_hours_activity': random.randint(0, 3),
-                'multiple_locations_accessed': random.randint(0, 8),
-                'severity': random.choice(['low', 'medium', 'high', 'critical']),
-                'location_security_level': random.choice(['public', 'restricted', 'staff_only']),
-                'incident_occurred': True
-            }
-            self.training_data['incidents'].append(incident)
+        # Features that predict incidents
+        hour, weekday, weekend = calendar(incident_days)
+        level = rng.integers(0, 3, incident_days)  # public, restricted, staff_only
+        incidents = np.column_stack([
+            hour, weekday, weekend,
+            rng.integers(0, 11, incident_days),   # failed_attempts_before
+            rng.integers(0, 6, incident_days),    # unusual_access_patterns
+            rng.integers(0, 4, incident_days),    # off_hours_activity
+            rng.integers(0, 9, incident_days),    # multiple_locations_accessed
+            level == 2, level == 1
+        ])
         
         # Add non-incident data (normal days)
-        for _ in range(800):
-            normal_time = datetime.now() - timedelta(days=random.randint(1, 180))
-            
-            non_incident = {
-                'incident_type': 'none',
-                'hour': normal_time.hour,
-                'day_of_week': normal_time.weekday(),
-                'is_weekend': normal_time.weekday() >= 5,
-                'failed_attempts_before': random.randint(0, 2),
-                'unusual_access_patterns': random.randint(0, 1),
-                'off_hours_activity': 0,
-                'multiple_locations_accessed': random.randint(0, 2),
-                'severity': 'none',
-                'location_security_level': random.choice(['public', 'restricted']),
-                'incident_occurred': False
-            }
-            self.training_data['incidents'].append(non_incident)
+        hour, weekday, weekend = calendar(normal_days)
+        level = rng.integers(0, 2, normal_days)  # public, restricted
+        normal = np.column_stack([
+            hour, weekday, weekend,
+            rng.integers(0, 3, normal_days),
+            rng.integers(0, 2, normal_days),
+            np.zeros(normal_days),
+            rng.integers(0, 3, normal_days),
+            np.zeros(normal_days), level == 1
+        ])
+        
+        labels = np.concatenate([np.ones(incident_days), np.zeros(normal_days)])
+        return np.vstack([incidents, normal]).astype(float), labels
     
-    def _generate_backup_patterns(self):
-        """Generate backup optimization training data"""
-        for _ in range(100):
-            backup_time = datetime.now() - timedelta(days=random.randint(1, 90))
-            
-            pattern = {
-                'database_size_mb': random.randint(100, 2000),
-                'daily_log_count': random.randint(1000, 50000),
-                'backup_duration_minutes': random.randint(5, 60),
-                'day_of_week': backup_time.weekday(),
-                'hour': backup_time.hour,
-                'system_load': random.uniform(0.1, 0.9),
-                'available_storage_gb': random.randint(10, 100),
-                'backup_success': random.choice([True, True, True, False]),  # 75% success rate
-                'optimal_time': random.choice([True, False])
-            }
-            self.training_data['backup_patterns'].append(pattern)
+    def _generate_backup_patterns(self, rng, now, backup_runs):
+        """Generate backup optimization training data
+
+        Returns the normalised backup features and the optimal-time flags.
+        """
+        hour, weekday = self._hour_and_weekday(now - rng.integers(1, 91, backup_runs) * 86400)
+        features = np.column_stack([
+            rng.integers(100, 2001, backup_runs) / 1000,     # database_size_mb
+            rng.integers(1000, 50001, backup_runs) / 10000,  # daily_log_count
+            weekday, hour,
+            rng.uniform(0.1, 0.9, backup_runs),              # system_load
+            rng.integers(10, 101, backup_runs) / 100         # available_storage_gb
+        ])
+        return features, rng.random(backup_runs) < 0.5
     
     def train_models(self):
         """Train all AI models"""
         logger.info("Training AI models...")
         
         try:
+            self._reset_scalers()
+            
             # Train anomaly detection model
             self._train_anomaly_detector()
             
@@ -235,27 +414,52 @@ class SecurityAIEngine:
             # Use simple rule-based fallbacks
             self._initialize_fallback_models()
     
+    def train_from_features(self, access_features, normal_mask, incident_features, incident_labels):
+        """Train and save the models from prepared feature matrices
+
+        Used by the retraining pipeline (model_training.py) with rows taken
+        from real access history: ``access_features`` is N x 6 in the
+        ``_access_feature_matrix`` layout and ``incident_features`` is M x 9
+        in the ``predict_incident_risk`` layout.
+        """
+        logger.info(f"Training AI models on {len(access_features)} access rows "
+                    f"and {len(incident_features)} incident rows...")
+        
+        try:
+            self._reset_scalers()
+            self._fit_anomaly_detector(np.asarray(access_features, dtype=float),
+                                       np.asarray(normal_mask, dtype=bool))
+            self._fit_incident_predictor(np.asarray(incident_features, dtype=float),
+                                         np.asarray(incident_labels, dtype=float))
+            self._train_backup_optimizer()
+            self._save_models({
+                'source': 'access_history',
+                'access_patterns': len(access_features),
+                'incidents': len(incident_features)
+            })
+            logger.info("AI models trained successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Error training models: {e}")
+            self._initialize_fallback_models()
+            return False
+    
+    def _reset_scalers(self):
+        from sklearn.preprocessing import StandardScaler
+        self.scalers = {
+            'access_patterns': StandardScaler(),
+            'incident_features': StandardScaler()
+        }
+    
     def _train_anomaly_detector(self):
         """Train anomaly detection model"""
-        # Prepare features for anomaly detection
-        features = []
-        labels = []
-        
-        for pattern in self.training_data['access_patterns']:
-            feature_vector = [
-                pattern['hour'],
-                pattern['day_of_week'],
-                int(pattern['is_weekend']),
-                pattern['locations_per_hour'],
-                pattern['time_between_access'],
-                pattern['risk_score']
-            ]
-            features.append(feature_vector)
-            labels.append(pattern['is_anomaly'])
-        
-        # Convert to numpy arrays
-        X = np.array(features)
-        y = np.array(labels)
+        self._fit_anomaly_detector(self.training_data['access_features'],
+                                   ~self.training_data['access_is_anomaly'])
+    
+    def _fit_anomaly_detector(self, X, normal_mask, max_cluster_rows=5000):
+        """Fit the scaler, Isolation Forest and behaviour clusters on N x 6 features"""
+        from sklearn.ensemble import IsolationForest
+        from sklearn.cluster import DBSCAN
         
         # Scale features
         X_scaled = self.scalers['access_patterns'].fit_transform(X)
@@ -273,31 +477,19 @@ class SecurityAIEngine:
             eps=0.5,
             min_samples=5
         )
-        self.models['behavior_analyzer'].fit(X_scaled[y == False])  # Only normal patterns
+        normal = X_scaled[normal_mask]  # Only normal patterns
+        if len(normal) > max_cluster_rows:
+            # DBSCAN is quadratic in the worst case; cluster a sample of large histories
+            normal = normal[np.random.default_rng(42).choice(len(normal), max_cluster_rows, replace=False)]
+        self.models['behavior_analyzer'].fit(normal)
     
     def _train_incident_predictor(self):
         """Train incident prediction model"""
-        features = []
-        labels = []
-        
-        for incident in self.training_data['incidents']:
-            feature_vector = [
-                incident['hour'],
-                incident['day_of_week'],
-                int(incident['is_weekend']),
-                incident['failed_attempts_before'],
-                incident['unusual_access_patterns'],
-                incident['off_hours_activity'],
-                incident['multiple_locations_accessed'],
-                1 if incident['location_security_level'] == 'staff_only' else 0,
-                1 if incident['location_security_level'] == 'restricted' else 0
-            ]
-            features.append(feature_vector)
-            labels.append(int(incident['incident_occurred']))
-        
-        X = np.array(features)
-        y = np.array(labels)
-        
+        self._fit_incident_predictor(self.training_data['incident_features'],
+                                     self.training_data['incident_labels'])
+    
+    def _fit_incident_predictor(self, X, y):
+        """Fit the incident scaler and predictor on M x 9 features"""
         X_scaled = self.scalers['incident_features'].fit_transform(X)
         
         # Simple neural network simulation using weighted features
@@ -320,24 +512,6 @@ class SecurityAIEngine:
     
     def _train_backup_optimizer(self):
         """Train backup optimization model"""
-        features = []
-        labels = []
-        
-        for backup in self.training_data['backup_patterns']:
-            feature_vector = [
-                backup['database_size_mb'] / 1000,  # Normalize
-                backup['daily_log_count'] / 10000,  # Normalize
-                backup['day_of_week'],
-                backup['hour'],
-                backup['system_load'],
-                backup['available_storage_gb'] / 100  # Normalize
-            ]
-            features.append(feature_vector)
-            labels.append(int(backup['optimal_time']))
-        
-        X = np.array(features)
-        y = np.array(labels)
-        
         # Simple decision tree simulation
         self.models['backup_optimizer'] = {
             'optimal_hours': [2, 3, 4, 22, 23],  # Low activity hours
@@ -349,45 +523,118 @@ class SecurityAIEngine:
         """Sigmoid activation function"""
         return 1 / (1 + np.exp(-np.clip(x, -500, 500)))
     
-    def _save_models(self):
+    def _save_models(self, training_stats=None):
         """Save trained models to disk"""
         try:
+            import sklearn
             model_data = {
+                'format_version': MODEL_FORMAT_VERSION,
+                'sklearn_version': sklearn.__version__,
+                'created_at': datetime.now().isoformat(),
                 'models': self.models,
                 'scalers': self.scalers,
-                'training_stats': {
-                    'access_patterns': len(self.training_data['access_patterns']),
-                    'incidents': len(self.training_data['incidents']),
-                    'backup_patterns': len(self.training_data['backup_patterns'])
+                'training_stats': training_stats or {
+                    'source': 'synthetic',
+                    'access_patterns': len(self.training_data.get('access_features', ())),
+                    'incidents': len(self.training_data.get('incident_features', ())),
+                    'backup_patterns': len(self.training_data.get('backup_features', ()))
                 }
             }
             
-            with open(self.model_dir / 'ai_models.pkl', 'wb') as f:
+            # Write to a temp file first so readers never see a partial artifact
+            model_file = self.model_dir / 'ai_models.pkl'
+            tmp_file = model_file.with_suffix('.pkl.tmp')
+            with open(tmp_file, 'wb') as f:
                 pickle.dump(model_data, f)
+            os.replace(tmp_file, model_file)
+            
+            self._save_runtime(model_data['created_at'])
             
             logger.info("AI models saved successfully")
             
         except Exception as e:
             logger.error(f"Error saving models: {e}")
     
+    def _save_runtime(self, source_created_at=None):
+        """Compile the fitted models into models/ai_runtime.npz"""
+        import sklearn
+        forest = CompiledForest.from_sklearn(self.models['anomaly_detector'],
+                                             self.scalers['access_patterns'])
+        save_runtime(self.model_dir / 'ai_runtime.npz', forest,
+                     self.models['incident_predictor'],
+                     AffineScaler.from_sklearn(self.scalers['incident_features']),
+                     self.models['backup_optimizer'],
+                     {'source_created_at': source_created_at,
+                      'sklearn_version': sklearn.__version__})
+    
+    def _load_runtime(self):
+        """Load the compiled NumPy-only models if they are present"""
+        runtime_file = self.model_dir / 'ai_runtime.npz'
+        if not runtime_file.exists():
+            return False
+        try:
+            mtime = runtime_file.stat().st_mtime
+            models, scalers, meta = load_runtime(runtime_file)
+        except Exception as e:
+            logger.warning(f"Ignoring compiled model runtime: {e}")
+            return False
+        
+        self._install_models(models, scalers)
+        self._runtime_mtime = mtime
+        self._runtime_source = meta.get('source_created_at')
+        logger.info(f"Compiled AI models loaded from {runtime_file} "
+                    f"(source artifact created {meta.get('source_created_at') or 'unknown'})")
+        return True
+    
     def _load_models(self):
-        """Load trained models from disk"""
+        """Load trained models from disk if the artifact is compatible"""
         try:
             model_file = self.model_dir / 'ai_models.pkl'
             if model_file.exists():
-                with open(model_file, 'rb') as f:
-                    model_data = pickle.load(f)
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always')
+                    with open(model_file, 'rb') as f:
+                        model_data = pickle.load(f)
                 
-                self.models = model_data['models']
-                self.scalers = model_data['scalers']
+                problem = self._check_artifact(model_data, caught)
+                if problem:
+                    logger.warning(f"Ignoring incompatible model artifact: {problem}")
+                    return False
                 
-                logger.info("AI models loaded successfully")
+                self._install_models(model_data['models'], model_data['scalers'])
+                
+                logger.info(f"AI models loaded successfully "
+                            f"(format v{model_data.get('format_version', 1)})")
                 return True
         except Exception as e:
             logger.error(f"Error loading models: {e}")
         
         return False
     
+    def _check_artifact(self, model_data, caught_warnings):
+        """Return why a loaded artifact cannot be used, or None if it can"""
+        import sklearn
+        version = model_data.get('format_version', 1)
+        if version not in COMPATIBLE_FORMAT_VERSIONS:
+            return f"format version {version} is not supported"
+        
+        saved_sklearn = model_data.get('sklearn_version')
+        if saved_sklearn and saved_sklearn.split('.')[:2] != sklearn.__version__.split('.')[:2]:
+            return f"trained with scikit-learn {saved_sklearn}, running {sklearn.__version__}"
+        for warning in caught_warnings:
+            if type(warning.message).__name__ == 'InconsistentVersionWarning':
+                return f"pickled with a different scikit-learn version (running {sklearn.__version__})"
+        
+        models = model_data.get('models', {})
+        scalers = model_data.get('scalers', {})
+        if not hasattr(models.get('anomaly_detector'), 'decision_function'):
+            return "anomaly detector missing"
+        if not isinstance(models.get('incident_predictor'), dict):
+            return "incident predictor missing"
+        if not all(hasattr(scalers.get(name), 'mean_') for name in ('access_patterns', 'incident_features')):
+            return "feature scalers are not fitted"
+        return None
+    
     def _initialize_fallback_models(self):
         """Initialize simple rule-based models as fallback"""
         self.models = {
@@ -400,38 +647,114 @@ class SecurityAIEngine:
     
     def detect_anomaly(self, access_data):
         """AI-powered anomaly detection"""
+        return self.split_anomaly_results(self.detect_anomalies([access_data]))[0]
+    
+    @staticmethod
+    def split_anomaly_results(results):
+        """Turn ``detect_anomalies()`` output into one plain dict per access"""
+        return [{
+            'is_anomaly': bool(results['is_anomaly'][index]),
+            'anomaly_score': float(results['anomaly_score'][index]),
+            'confidence': float(results['confidence'][index]),
+            'risk_level': str(results['risk_level'][index]),
+            'explanation': results['explanation'][index]
+        } for index in range(len(results['explanation']))]
+    
+    def detect_anomalies(self, batch):
+        """Score many accesses with one vectorised model call
+
+        ``batch`` is a sequence of access_data dicts (same keys as
+        ``detect_anomaly``). Returns a dict of arrays aligned with the
+        batch: 'is_anomaly' (bool), 'anomaly_score' and 'confidence'
+        (float), 'risk_level' (str) plus a list of 'explanation' strings.
+        """
+        batch = list(batch)
+        if not batch:
+            return self._empty_anomaly_results()
+        
+        shadow = self._shadow
+        if shadow is None:
+            return self._score_anomalies(batch)
+        
+        # Time the live call so the shadow report can compare latency
+        started = time.perf_counter()
+        results = self._score_anomalies(batch)
+        shadow.submit(batch, results, (time.perf_counter() - started) * 1000)
+        return results
+    
+    def _score_anomalies(self, batch):
+        """detect_anomalies() for a non-empty list, with the live models"""
         try:
-            if self.models['anomaly_detector'] == 'rule_based':
-                return self._rule_based_anomaly_detection(access_data)
-            
-            # Prepare features
-            features = np.array([[
-                access_data.get('hour', 12),
-                access_data.get('day_of_week', 1),
-                int(access_data.get('is_weekend', False)),
-                access_data.get('locations_per_hour', 1),
-                access_data.get('time_between_access', 60),
-                access_data.get('current_risk_score', 3)
-            ]])
+            # One read of the live state, so a hot swap can't pair old and new
+            models, scalers = self._live
+            detector = models['anomaly_detector']
+            if detector == 'rule_based':
+                return self._rule_based_anomaly_batch(batch)
             
-            # Scale features
-            features_scaled = self.scalers['access_patterns'].transform(features)
+            features = self._access_feature_matrix(batch)
+            if not isinstance(detector, CompiledForest):
+                # The compiled forest has the scaler folded in
+                features = scalers['access_patterns'].transform(features)
             
-            # Predict anomaly
-            anomaly_score = self.models['anomaly_detector'].decision_function(features_scaled)[0]
-            is_anomaly = self.models['anomaly_detector'].predict(features_scaled)[0] == -1
+            # predict() is just decision_function() < 0, so walk the forest once
+            scores = self._apply_behaviour_checks(detector.decision_function(features), batch)
+            is_anomaly = scores < 0
             
             return {
                 'is_anomaly': is_anomaly,
-                'anomaly_score': float(anomaly_score),
-                'confidence': min(abs(anomaly_score) * 20, 100),  # Convert to percentage
-                'risk_level': self._calculate_risk_level(anomaly_score),
-                'explanation': self._explain_anomaly(access_data, is_anomaly)
+                'anomaly_score': scores.astype(float),
+                'confidence': np.minimum(np.abs(scores) * 20, 100),  # Convert to percentage
+                'risk_level': self._calculate_risk_levels(scores),
+                'explanation': [self._explain_anomaly(access_data, flagged)
+                                for access_data, flagged in zip(batch, is_anomaly)]
             }
             
         except Exception as e:
-            logger.error(f"Error in anomaly detection: {e}")
-            return self._rule_based_anomaly_detection(access_data)
+            logger.error(f"Error in batch anomaly detection: {e}")
+            return self._rule_based_anomaly_batch(batch)
+    
+    @staticmethod
+    def _apply_behaviour_checks(scores, batch):
+        """Push scores below zero for impossible trips and accesses far from the student's baseline"""
+        deviations = np.array([access_data.get('baseline_deviation') or 0.0 for access_data in batch])
+        flagged = deviations >= BASELINE_DEVIATION_THRESHOLD
+        capped = BASELINE_DEVIATION_SCORE - (deviations - BASELINE_DEVIATION_THRESHOLD)
+        scores = np.where(flagged, np.minimum(scores, capped), scores)
+        impossible = np.array([bool(access_data.get('impossible_travel')) for access_data in batch])
+        return np.where(impossible, np.minimum(scores, IMPOSSIBLE_TRAVEL_SCORE), scores)
+    
+    @staticmethod
+    def _access_feature_matrix(batch):
+        """Build the N x 6 anomaly feature matrix from access_data dicts"""
+        return np.array([[
+            access_data.get('hour', 12),
+            access_data.get('day_of_week', 1),
+            int(access_data.get('is_weekend', False)),
+            access_data.get('locations_per_hour', 1),
+            access_data.get('time_between_access', 60),
+            access_data.get('current_risk_score', 3)
+        ] for access_data in batch], dtype=float)
+    
+    def _rule_based_anomaly_batch(self, batch):
+        """Rule-based fallback for a batch, packed like detect_anomalies()"""
+        results = [self._rule_based_anomaly_detection(access_data) for access_data in batch]
+        return {
+            'is_anomaly': np.array([r['is_anomaly'] for r in results], dtype=bool),
+            'anomaly_score': np.array([r['anomaly_score'] for r in results], dtype=float),
+            'confidence': np.array([r['confidence'] for r in results], dtype=float),
+            'risk_level': np.array([r['risk_level'] for r in results]),
+            'explanation': [r['explanation'] for r in results]
+        }
+    
+    @staticmethod
+    def _empty_anomaly_results():
+        return {
+            'is_anomaly': np.zeros(0, dtype=bool),
+            'anomaly_score': np.zeros(0),
+            'confidence': np.zeros(0),
+            'risk_level': np.array([], dtype=str),
+            'explanation': []
+        }
     
     def _rule_based_anomaly_detection(self, access_data):
         """Simple rule-based anomaly detection"""
@@ -459,6 +782,16 @@ class SecurityAIEngine:
             anomaly_factors.append("Weekend access to restricted area")
             risk_score += 1
         
+        # Check the student's own baseline
+        if (access_data.get('baseline_deviation') or 0) >= BASELINE_DEVIATION_THRESHOLD:
+            anomaly_factors.append("Unusual for this student")
+            risk_score += 3
+        
+        # Check whether the card could have got here since its last tap
+        if access_data.get('impossible_travel'):
+            anomaly_factors.append("Card seen elsewhere too recently")
+            risk_score += 3
+        
         is_anomaly = risk_score >= 3
         
         return {
@@ -471,45 +804,71 @@ class SecurityAIEngine:
     
     def predict_incident_risk(self, current_conditions):
         """AI-powered incident risk prediction"""
+        results = self.predict_incident_risks([current_conditions])
+        return {
+            'incident_probability': float(results['incident_probability'][0]),
+            'risk_level': str(results['risk_level'][0]),
+            'confidence': float(results['confidence'][0]),
+            'recommendation': results['recommendation'][0],
+            'factors': results['factors'][0]
+        }
+    
+    def predict_incident_risks(self, batch):
+        """Score many sets of conditions with one matrix multiply
+
+        ``batch`` is a sequence of condition dicts (same keys as
+        ``predict_incident_risk``). Returns a dict aligned with the batch:
+        'incident_probability' and 'confidence' (float arrays), 'risk_level'
+        (str array) plus lists of 'recommendation' strings and 'factors'.
+        """
+        batch = list(batch)
         try:
-            if self.models['incident_predictor'] == 'rule_based':
-                return self._rule_based_incident_prediction(current_conditions)
-            
-            # Prepare features
-            features = np.array([[
-                current_conditions.get('hour', 12),
-                current_conditions.get('day_of_week', 1),
-                int(current_conditions.get('is_weekend', False)),
-                current_conditions.get('failed_attempts_recent', 0),
-                current_conditions.get('unusual_patterns_detected', 0),
-                current_conditions.get('off_hours_activity', 0),
-                current_conditions.get('multiple_locations_accessed', 0),
-                1 if current_conditions.get('location_security_level') == 'staff_only' else 0,
-                1 if current_conditions.get('location_security_level') == 'restricted' else 0
-            ]])
-            
-            # Scale features
-            features_scaled = self.scalers['incident_features'].transform(features)
+            models, scalers = self._live
+            predictor = models['incident_predictor']
+            if predictor == 'rule_based':
+                return self._rule_based_incident_batch(batch)
             
-            # Predict
-            prediction = self._sigmoid(
-                features_scaled @ self.models['incident_predictor']['weights'] + 
-                self.models['incident_predictor']['bias']
-            )[0]
-            
-            risk_level = self._calculate_incident_risk_level(prediction)
+            features = scalers['incident_features'].transform(self._incident_feature_matrix(batch))
+            probabilities = self._sigmoid(features @ predictor['weights'] + predictor['bias'])
             
             return {
-                'incident_probability': float(prediction),
-                'risk_level': risk_level,
-                'confidence': min(abs(prediction - 0.5) * 200, 100),
-                'recommendation': self._get_incident_recommendation(prediction, current_conditions),
-                'factors': self._identify_risk_factors(current_conditions)
+                'incident_probability': probabilities,
+                'risk_level': self._calculate_incident_risk_levels(probabilities),
+                'confidence': np.minimum(np.abs(probabilities - 0.5) * 200, 100),
+                'recommendation': [self._get_incident_recommendation(probability, conditions)
+                                   for probability, conditions in zip(probabilities, batch)],
+                'factors': [self._identify_risk_factors(conditions) for conditions in batch]
             }
             
         except Exception as e:
             logger.error(f"Error in incident prediction: {e}")
-            return self._rule_based_incident_prediction(current_conditions)
+            return self._rule_based_incident_batch(batch)
+    
+    @staticmethod
+    def _incident_feature_matrix(batch):
+        """Build the M x 9 incident feature matrix from condition dicts"""
+        return np.array([[
+            conditions.get('hour', 12),
+            conditions.get('day_of_week', 1),
+            int(conditions.get('is_weekend', False)),
+            conditions.get('failed_attempts_recent', 0),
+            conditions.get('unusual_patterns_detected', 0),
+            conditions.get('off_hours_activity', 0),
+            conditions.get('multiple_locations_accessed', 0),
+            1 if conditions.get('location_security_level') == 'staff_only' else 0,
+            1 if conditions.get('location_security_level') == 'restricted' else 0
+        ] for conditions in batch], dtype=float).reshape(len(batch), 9)
+    
+    def _rule_based_incident_batch(self, batch):
+        """Rule-based fallback for a batch, packed like predict_incident_risks()"""
+        results = [self._rule_based_incident_prediction(conditions) for conditions in batch]
+        return {
+            'incident_probability': np.array([r['incident_probability'] for r in results], dtype=float),
+            'risk_level': np.array([r['risk_level'] for r in results], dtype=str),
+            'confidence': np.array([r['confidence'] for r in results], dtype=float),
+            'recommendation': [r['recommendation'] for r in results],
+            'factors': [r['factors'] for r in results]
+        }
     
     def _rule_based_incident_prediction(self, conditions):
         """Rule-based incident risk prediction"""
@@ -620,6 +979,23 @@ class SecurityAIEngine:
         else:
             return 'low'
     
+    def _calculate_risk_levels(self, scores):
+        """Vectorised _calculate_risk_level for an array of anomaly scores"""
+        abs_scores = np.abs(scores)
+        return np.select(
+            [abs_scores > 0.5, abs_scores > 0.3, abs_scores > 0.1],
+            ['critical', 'high', 'medium'],
+            default='low'
+        )
+    
+    def _calculate_incident_risk_levels(self, probabilities):
+        """Vectorised _calculate_incident_risk_level for an array of probabilities"""
+        return np.select(
+            [probabilities > 0.7, probabilities > 0.5, probabilities > 0.3],
+            ['critical', 'high', 'medium'],
+            default='low'
+        )
+    
     def _calculate_incident_risk_level(self, probability):
         """Calculate incident risk level from probability"""
         if probability > 0.7:
@@ -648,6 +1024,13 @@ class SecurityAIEngine:
         if access_data.get('time_between_access', 60) < 10:
             explanations.append("Rapid successive access attempts")
         
+        if (access_data.get('baseline_deviation') or 0) >= BASELINE_DEVIATION_THRESHOLD:
+            factors = access_data.get('baseline_factors') or ['access unlike this student\'s history']
+            explanations.append("Unusual for this student: " + ', '.join(factors))
+        
+        if access_data.get('impossible_travel'):
+            explanations.append("Impossible travel: card seen at another location too recently (possible clone)")
+        
         return '; '.join(explanations) if explanations else "Unusual access pattern detected"
     
     def _get_incident_recommendation(self, probability, conditions):
@@ -712,9 +1095,70 @@ class SecurityAIEngine:
         
         return f"{estimated_size:.1f} MB"
 
-# Global AI engine instance
-ai_engine = SecurityAIEngine()
+# Global AI engine instance, created on first use
+_ai_engine = None
+_ai_engine_lock = threading.Lock()
 
 def get_ai_engine():
-    """Get the global AI engine instance"""
-    return ai_engine
\ No newline at end of file
+    """Get the global AI engine instance, loading models on first call"""
+    global _ai_engine
+    if _ai_engine is None:
+        with _ai_engine_lock:
+            if _ai_engine is None:
+                engine = SecurityAIEngine()
+                engine.initialize()
+                _ai_engine = engine
+    return _ai_engine
+
+def main(argv=None):
+    """Command line entry point: ``python ai_engine.py [train|compile|info]``"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Manage the Smart Campus AI models")
+    parser.add_argument('command', choices=['train', 'compile', 'info'],
+                        help="'train' retrains and saves models/ai_models.pkl, "
+                             "'compile' rebuilds models/ai_runtime.npz from it, "
+                             "'info' checks the saved artifacts")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="synthetic training data size multiplier for 'train'")
+    parser.add_argument('--seed', type=int, help="seed for the synthetic training data")
+    parser.add_argument('--model-dir', default='models',
+                        help="where the artifacts live (models/candidate for a shadow candidate)")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = SecurityAIEngine(args.model_dir)
+    model_file = engine.model_dir / 'ai_models.pkl'
+    runtime_file = engine.model_dir / 'ai_runtime.npz'
+    
+    if args.command == 'train':
+        engine.retrain(args.scale, args.seed)
+        if engine.models['anomaly_detector'] == 'rule_based':
+            print("❌ Training failed - see log for details")
+            return 1
+        print(f"✅ Models trained and saved to {model_file} and {runtime_file}")
+        return 0
+    
+    if args.command == 'compile':
+        if not engine._load_models():
+            print(f"❌ No usable artifact at {model_file} - run: python ai_engine.py train")
+            return 1
+        engine._save_runtime()
+        print(f"✅ Compiled {model_file} into {runtime_file}")
+        return 0
+    
+    status = 0
+    if engine._load_models():
+        print(f"✅ {model_file} is present and compatible")
+    else:
+        print(f"❌ No usable artifact at {model_file} - run: python ai_engine.py train")
+        status = 1
+    if engine._load_runtime():
+        print(f"✅ {runtime_file} is present and compatible")
+    else:
+        print(f"❌ No compiled runtime at {runtime_file} - run: python ai_engine.py compile")
+        status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
@@ -2,11 +2,12 @@
 # St. Lawrence University - Cybersecurity Club
 # Enhanced Flask Web Application with Authentication & Advanced Security
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, flash
 import mysql.connector
 from datetime import datetime, timedelta
 import secrets
 import hashlib
+import hmac
 import json
 from functools import wraps
 import logging
@@ -15,9 +16,23 @@ from auth import (
     log_security_event, policy_engine, ROLES
 )
 from ai_engine import get_ai_engine
+from card_directory import card_directory, revoked_cards
+from behaviour_state import access_state
+from scoring_queue import AnomalyScoringBatcher
+from model_training import ModelRetrainer
+from access_ingest import AccessLogIngestor, insert_access_records
+from edge_snapshot import EdgeSnapshotStore
+from risk_heatmap import CampusRiskHeatmap
+from student_profiles import StudentProfileStore
+from impossible_travel import ImpossibleTravelDetector, TransitMatrix
+from session_store import session_store_from_config, load_secret_key
+from data_cipher import create_cipher
+import audit_writer
+import schema_migrations
+import audit_index
+import db_pool
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
 
 # Enhanced logging configuration
 logging.basicConfig(
@@ -30,6 +45,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Sessions, lockouts and signing keys shared by every worker process
+SESSION_STORE_CONFIG = {                  # The section named by 'backend' goes to that backend's constructor
+    'backend': 'sqlite',                  # 'memory' keeps sessions per process
+    'sqlite': {
+        'path': 'instance/sessions.db',   # SQLite file all workers on this node share
+        'purge_interval': 60,             # Seconds between deleting expired rows
+        'max_attempt_keys': 100000,       # Usernames/IPs with failed logins kept (least recently failed go first)
+        'attempts_per_key': 10            # Failed-login times kept per username/IP
+    },
+    'memory': {
+        'max_attempt_keys': 100000,
+        'attempts_per_key': 10
+    }
+}
+SECRET_KEY_FILE = 'instance/secret_key'   # Created on first start; SMARTSCAN_SECRET_KEY overrides
+AUDIT_CIPHER = 'rot13'                    # 'aesgcm' for real AES-256-GCM (needs cryptography)
+
+app.secret_key = load_secret_key(SECRET_KEY_FILE)
+# Tokens are signed with a key derived from the shared secret, not the cookie key itself
+security_manager.configure(
+    store=session_store_from_config(SESSION_STORE_CONFIG),
+    secret_key=hmac.new(app.secret_key.encode(), b'session-tokens', hashlib.sha256).hexdigest(),
+    cipher=create_cipher(AUDIT_CIPHER, key=hmac.new(app.secret_key.encode(), b'audit-details',
+                                                    hashlib.sha256).digest())
+)
+# Audit keywords are stored as HMACs so the index does not reveal encrypted details
+audit_index.init_indexer(hmac.new(app.secret_key.encode(), b'audit-keywords', hashlib.sha256).digest())
+
 # Database configuration
 DB_CONFIG = {
     'host': 'localhost',
@@ -39,99 +82,234 @@ DB_CONFIG = {
     'autocommit': True
 }
 
+# Connection pool configuration
+DB_POOL_CONFIG = {
+    'pool_size': 10,              # Max connections held by this process
+    'checkout_timeout': 5,        # Seconds to wait for a free connection
+    'max_lifetime': 1800,         # Recycle connections older than 30 minutes
+    'health_check_interval': 30   # Ping connections idle longer than this
+}
+
+# Separate connections for the access log ingestor and audit writer flushers
+DB_BACKGROUND_POOL_CONFIG = {
+    'pool_size': 4,               # One per flusher and the profile refresher, plus a spare
+    'checkout_timeout': 5,
+    'max_lifetime': 1800,
+    'health_check_interval': 30
+}
+
+db_pool.init_pool(DB_CONFIG, **DB_POOL_CONFIG)
+db_pool.init_background_pool(DB_CONFIG, **DB_BACKGROUND_POOL_CONFIG)
+db_pool.init_app(app)
+
+# Write-behind batching of security_audit_log inserts
+AUDIT_WRITER_CONFIG = {
+    'batch_size': 200,            # Flush once this many events are queued
+    'flush_interval_ms': 200,     # ...or once the batch has waited this long
+    'max_queue_size': 10000,      # Beyond this, events spill to disk
+    'spool_dir': 'audit_spool'    # Where spilled events wait for the database
+}
+
+audit_writer.init_writer(db_pool.get_background_connection, security_manager.encrypt_data, **AUDIT_WRITER_CONFIG)
+
+@app.before_request
+def migrate_schema():
+    """Bring a database created from an older setup script up to date on this worker's first request.
+
+    Audit events written before then fail on the missing columns and are
+    spilled, then replayed once the migration has run.
+    """
+    schema_migrations.ensure_migrated(DB_CONFIG)
+
+# Group commit of access_logs / risk_assessments rows across request threads
+ACCESS_INGEST_CONFIG = {
+    'max_batch_size': 256,   # Rows written per multi-row INSERT at most
+    'max_wait_ms': 5,        # How long the first row waits for company
+    'result_timeout': 5.0    # Seconds a scan waits for its commit
+}
+
+access_ingestor = AccessLogIngestor(db_pool.get_background_connection, **ACCESS_INGEST_CONFIG)
+
+# Micro-batching of AI anomaly scoring across concurrent scans
+SCORING_BATCH_CONFIG = {
+    'max_batch_size': 64,   # Flush once this many scans are waiting
+    'max_wait_ms': 3        # ...or once the oldest has waited this long
+}
+
+anomaly_batcher = AnomalyScoringBatcher(get_ai_engine, **SCORING_BATCH_CONFIG)
+
+# Bulk replay of buffered taps from door controllers
+BULK_SCAN_CONFIG = {
+    'max_taps': 20000,            # Larger replays are rejected with 413
+    'insert_chunk_size': 1000     # access_logs rows per multi-row INSERT
+}
+
+# Decision snapshots exported to card readers for offline operation
+EDGE_SNAPSHOT_CONFIG = {
+    'directory': 'edge_snapshots',
+    'keep_versions': 48,          # Readers this many versions behind still get a delta
+    'min_rebuild_interval': 30    # Seconds a built snapshot is served before rebuilding
+}
+
+edge_snapshots = EdgeSnapshotStore(**EDGE_SNAPSHOT_CONFIG)
+
+# Campus-wide incident risk per location
+RISK_HEATMAP_CONFIG = {
+    'window_minutes': 60,   # access_logs history each location is scored on
+    'cache_seconds': 60     # How long a built heatmap is served before rebuilding
+}
+
+risk_heatmap = CampusRiskHeatmap(get_ai_engine, **RISK_HEATMAP_CONFIG)
+
+# Per-student behavioural baselines scored against each scan
+STUDENT_PROFILE_CONFIG = {
+    'lookback_days': 30,      # History a fresh worker builds the profiles from
+    'refresh_interval': 10,   # Seconds between folding in new access_logs rows
+    'min_accesses': 20,       # Profiles with fewer accesses are not scored
+    'top_locations': 8        # Usual locations remembered per student
+}
+
+student_profiles = StudentProfileStore(db_pool.get_background_connection, **STUDENT_PROFILE_CONFIG)
+student_profiles.init_app(app)
+
+# Impossible travel (cloned card) checks from a location transit-time matrix
+TRANSIT_MATRIX_CONFIG = {
+    'same_building_seconds': 30,      # Fastest move between rooms of one building
+    'floor_seconds': 20,              # Added per floor climbed
+    'between_buildings_seconds': 180, # Fastest walk between any two buildings
+    'building_seconds': {}            # (building, building) -> seconds, for known pairs
+}
+IMPOSSIBLE_TRAVEL_CONFIG = {
+    'tolerance': 0.8,         # Flag trips faster than this share of the transit time
+    'refresh_interval': 5,    # Seconds between pulling other workers' taps
+    'reload_interval': 300    # Seconds between rebuilding the matrix
+}
+
+travel_detector = ImpossibleTravelDetector(TransitMatrix(**TRANSIT_MATRIX_CONFIG), **IMPOSSIBLE_TRAVEL_CONFIG)
+
+# Background retraining of the AI models from real access history
+MODEL_RETRAINING_CONFIG = {
+    'enabled': True,
+    'interval_hours': 24,           # Retrain once the saved models are this old
+    'lookback_days': 180,           # History window to learn from
+    'chunk_size': 5000,             # access_logs rows read per query
+    'max_training_rows': 200000,    # Uniform sample size kept for fitting
+    'min_training_rows': 1000,      # Keep the current models below this
+    'online_interval': 300,         # Seconds between online updates from new accesses (0 = off)
+    'online_window_rows': 20000,    # Recent accesses the refreshed trees are grown on
+    'online_trees_per_update': 10,  # Oldest forest trees replaced per update
+    'online_min_new_rows': 200,     # New accesses needed before an update
+    'shadow_candidate_dir': None    # e.g. 'models/candidate': retrains wait there in shadow mode until promoted
+}
+
+# Where the admin shadow scoring routes look for a candidate, also one placed by hand
+SHADOW_CANDIDATE_DIR = MODEL_RETRAINING_CONFIG['shadow_candidate_dir'] or 'models/candidate'
+
+model_retrainer = ModelRetrainer(get_ai_engine, DB_CONFIG, **MODEL_RETRAINING_CONFIG)
+model_retrainer.init_app(app)
+
 def get_db_connection():
-    """Create and return database connection"""
+    """Check out a pooled database connection (reused for the whole request)"""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_connection()
     except mysql.connector.Error as err:
         logger.error(f"Database connection error: {err}")
         return None
 
 def enhanced_log_access_attempt(student_id, card_id, location_id, access_type, granted=True, 
-                              denial_reason=None, risk_assessment=None):
-    """Enhanced access logging with risk assessment"""
-    conn = get_db_connection()
-    if not conn:
-        return False
+                              denial_reason=None, risk_assessment=None, conn=None, access_time=None):
+    """Enhanced access logging with risk assessment
+
+    The access_logs and risk_assessments rows go through the group-commit
+    ingestor and the call returns the new log_id once they are committed.
+    When ``conn`` is given the writes join the caller's transaction instead:
+    nothing is committed here and database errors are re-raised to the caller.
+    """
+    risk_assessment, access_log_row, risk_row = build_access_records(
+        student_id, card_id, location_id, access_type, granted, denial_reason,
+        risk_assessment, access_time)
     
     try:
-        cursor = conn.cursor()
-        
-        # Calculate risk score if not provided
-        if not risk_assessment:
-            risk_assessment = policy_engine.assess_access_risk(student_id, location_id)
-        
-        # Log to access_logs table
-        query = """
-            INSERT INTO access_logs (student_id, card_id, location_id, access_type, 
-                                   access_granted, denial_reason, ip_address, user_agent,
-                                   risk_score, requires_review)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        cursor.execute(query, (
-            student_id, card_id, location_id, access_type,
-            granted, denial_reason, 
-            request.remote_addr if request else 'simulation',
-            request.headers.get('User-Agent') if request else 'virtual_scanner',
-            risk_assessment['risk_score'],
-            risk_assessment['requires_additional_auth']
-        ))
-        
-        access_log_id = cursor.lastrowid
-        
-        # Log to risk_assessments table
-        risk_query = """
-            INSERT INTO risk_assessments (student_id, location_id, access_time, risk_score, 
-                                        risk_level, risk_factors, action_taken)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        cursor.execute(risk_query, (
-            student_id, location_id, datetime.now(),
-            risk_assessment['risk_score'],
-            risk_assessment['risk_level'],
-            json.dumps(risk_assessment['risk_factors']),
-            'allowed' if granted else 'denied'
-        ))
-        
-        # Log security event for audit trail
-        event_details = {
-            'access_log_id': access_log_id,
-            'student_id': student_id,
-            'card_id': card_id,
-            'location_id': location_id,
-            'access_type': access_type,
-            'granted': granted,
-            'risk_level': risk_assessment['risk_level'],
-            'denial_reason': denial_reason
-        }
-        
-        log_security_event(
-            'access_attempt',
-            json.dumps(event_details),
-            user_id=getattr(request, 'current_user', {}).get('user_id') if hasattr(request, 'current_user') else None
-        )
-        
-        conn.commit()
-        logger.info(f"Access attempt logged: Student {student_id}, Location {location_id}, Granted: {granted}")
-        return True
-        
+        if conn is None:
+            access_log_id = access_ingestor.log(access_log_row, risk_row)
+        else:
+            cursor = conn.cursor()
+            try:
+                access_log_id = insert_access_records(cursor, [(access_log_row, risk_row)])[0]
+            finally:
+                cursor.close()
     except mysql.connector.Error as err:
         logger.error(f"Error logging enhanced access: {err}")
+        if conn is not None:
+            raise
         return False
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+    
+    log_access_event(access_log_id, student_id, card_id, location_id, access_type,
+                     granted, risk_assessment, denial_reason)
+    
+    logger.info(f"Access attempt logged: Student {student_id}, Location {location_id}, Granted: {granted}")
+    return access_log_id
+
+def build_access_records(student_id, card_id, location_id, access_type, granted=True,
+                         denial_reason=None, risk_assessment=None, access_time=None):
+    """Build the access_logs and risk_assessments column values for one access.
+
+    Returns ``(risk_assessment, access_log_row, risk_row)``; the risk
+    assessment is computed here when the caller has none.
+    """
+    access_time = access_time or datetime.now()
+    # Calculate risk score if not provided
+    if not risk_assessment:
+        risk_assessment = policy_engine.assess_access_risk(student_id, location_id, access_time)
+    
+    access_log_row = (
+        student_id, card_id, location_id, access_type, access_time,
+        granted, denial_reason, 
+        request.remote_addr if request else 'simulation',
+        request.headers.get('User-Agent') if request else 'virtual_scanner',
+        risk_assessment['risk_score'],
+        risk_assessment['requires_additional_auth']
+    )
+    risk_row = (
+        student_id, location_id, access_time,
+        risk_assessment['risk_score'],
+        risk_assessment['risk_level'],
+        json.dumps(risk_assessment['risk_factors']),
+        'allowed' if granted else 'denied'
+    )
+    return risk_assessment, access_log_row, risk_row
+
+def log_access_event(access_log_id, student_id, card_id, location_id, access_type,
+                     granted, risk_assessment, denial_reason=None):
+    """Audit trail entry for a logged access (through the write-behind writer)"""
+    event_details = {
+        'access_log_id': access_log_id,
+        'student_id': student_id,
+        'card_id': card_id,
+        'location_id': location_id,
+        'access_type': access_type,
+        'granted': granted,
+        'risk_level': risk_assessment['risk_level'],
+        'denial_reason': denial_reason
+    }
+    
+    log_security_event(
+        'access_attempt',
+        json.dumps(event_details),
+        user_id=getattr(request, 'current_user', {}).get('user_id') if hasattr(request, 'current_user') else None
+    )
 
 def create_enhanced_security_alert(alert_type, severity, location_id, student_id=None, 
-                                 card_id=None, message="", auto_escalate=True):
-    """Create enhanced security alert with auto-escalation"""
-    conn = get_db_connection()
-    if not conn:
-        return False
+                                 card_id=None, message="", auto_escalate=True, conn=None):
+    """Create enhanced security alert with auto-escalation
+
+    When ``conn`` is given the alert joins the caller's transaction.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if not conn:
+            return False
     
     try:
         cursor = conn.cursor()
@@ -164,18 +342,106 @@ def create_enhanced_security_alert(alert_type, severity, location_id, student_id
             
             logger.warning(f"Security incident auto-created for alert {alert_id}")
         
-        conn.commit()
+        if own_conn:
+            conn.commit()
         logger.warning(f"Security alert created: Type {alert_type}, Severity {severity}")
         return alert_id
         
     except mysql.connector.Error as err:
         logger.error(f"Error creating enhanced alert: {err}")
+        if not own_conn:
+            raise
         return False
     finally:
-        if conn.is_connected():
-            cursor.close()
+        cursor.close()
+        if own_conn and conn.is_connected():
             conn.close()
 
+def record_scan_outcome(conn, alerts, access_log):
+    """Write everything a scan decided.
+
+    A scan with alerts writes them (and any incidents they escalate to)
+    together with its access log and risk assessment in one transaction on
+    the request's connection, so an alert is never committed without the
+    access it is about. A scan without alerts only has the access log to
+    write, which joins the next group commit of the access log ingestor.
+    Either way the audit event is queued after the commit.
+    """
+    if alerts:
+        if access_log:
+            risk_assessment, access_log_row, risk_row = build_access_records(**access_log)
+        conn.start_transaction()
+        cursor = conn.cursor()
+        try:
+            for alert in alerts:
+                create_enhanced_security_alert(conn=conn, **alert)
+            if access_log:
+                access_log_id = insert_access_records(cursor, [(access_log_row, risk_row)])[0]
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        if access_log:
+            log_access_event(access_log_id, access_log['student_id'], access_log['card_id'],
+                             access_log['location_id'], access_log['access_type'],
+                             access_log.get('granted', True), risk_assessment, access_log.get('denial_reason'))
+    elif access_log:
+        if enhanced_log_access_attempt(**access_log) is False:
+            raise mysql.connector.errors.OperationalError("Access log could not be written")
+    
+    if access_log and access_log.get('student_id'):
+        access_state.record(access_log['student_id'], access_log['location_id'],
+                            access_log.get('access_time'))
+        travel_detector.record(access_log['card_id'], access_log['location_id'],
+                               access_log.get('access_time'))
+
+def record_bulk_scan_outcome(conn, outcomes):
+    """Write everything a bulk scan decided in one transaction.
+
+    ``outcomes`` are ``evaluate_card_scans_bulk`` results. Alerts go in one
+    by one (each may escalate to an incident); the access logs and risk
+    assessments go in as multi-row INSERTs of ``insert_chunk_size`` rows.
+    Audit events are queued, and the taps recorded in the shared behaviour
+    and travel state, once the transaction has committed.
+    """
+    records, logged = [], []
+    for _, _, access_log in outcomes:
+        if access_log:
+            risk_assessment, access_log_row, risk_row = build_access_records(**access_log)
+            records.append((access_log_row, risk_row))
+            logged.append((access_log, risk_assessment))
+    
+    chunk_size = BULK_SCAN_CONFIG['insert_chunk_size']
+    id_step = access_ingestor.id_step(conn)
+    conn.start_transaction()
+    cursor = conn.cursor()
+    try:
+        for _, alerts, _ in outcomes:
+            for alert in alerts:
+                create_enhanced_security_alert(conn=conn, **alert)
+        log_ids = []
+        for start in range(0, len(records), chunk_size):
+            log_ids.extend(insert_access_records(cursor, records[start:start + chunk_size], id_step))
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    
+    for log_id, (access_log, risk_assessment) in zip(log_ids, logged):
+        log_access_event(log_id, access_log['student_id'], access_log['card_id'],
+                         access_log['location_id'], access_log['access_type'],
+                         access_log['granted'], risk_assessment, access_log.get('denial_reason'))
+        if access_log.get('student_id'):
+            access_state.record(access_log['student_id'], access_log['location_id'],
+                                access_log.get('access_time'))
+            travel_detector.record(access_log['card_id'], access_log['location_id'],
+                                   access_log.get('access_time'))
+    logger.info(f"Bulk scan logged {len(log_ids)} access attempts")
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Enhanced login with security features"""
@@ -265,6 +531,8 @@ def logout():
     username = session.get('username')
     
     if user_id:
+        # Revoke the token in every worker, not just this browser's cookie
+        security_manager.end_session(user_id)
         log_security_event('logout', f'User {username} logged out', user_id)
     
     # Clear session
@@ -331,7 +599,12 @@ def index():
 
 @app.route('/scan_card', methods=['POST'])
 def scan_card():
-    """Enhanced card scanning with advanced security checks"""
+    """Enhanced card scanning with advanced security checks
+
+    Reads and checks run first; the writes the decision produces are then
+    recorded by ``record_scan_outcome`` (alerts and the access log in one
+    transaction, or the access log alone through the group-commit ingestor).
+    """
     data = request.get_json()
     card_id = data.get('card_id')
     location_id = data.get('location_id')
@@ -346,182 +619,439 @@ def scan_card():
     
     try:
         cursor = conn.cursor(dictionary=True)
+        response, alerts, access_log = evaluate_card_scan(cursor, card_id, location_id, access_type)
         
-        # Check if card exists and get student info
-        cursor.execute("SELECT * FROM students WHERE card_id = %s", (card_id,))
-        student = cursor.fetchone()
+        if alerts or access_log:
+            record_scan_outcome(conn, alerts, access_log)
         
-        # Debug logging for student data
-        logger.info(f"Student query for card {card_id}: {student}")
+        return jsonify(response)
         
-        if not student:
-            # Unknown card - create enhanced alert
-            create_enhanced_security_alert('unauthorized_access', 'high', location_id, 
-                                          card_id=card_id, 
-                                          message=f'Unknown card {card_id} attempted access at location {location_id}')
-            enhanced_log_access_attempt(None, card_id, location_id, access_type, False, 'Unknown card')
-            
-            return jsonify({
-                'success': False, 
-                'message': 'ACCESS DENIED: Unknown card',
-                'alert': True,
-                'alert_type': 'unauthorized_access',
-                'risk_level': 'high'
-            })
-        
-        # Get location info first (needed for AI analysis)
-        cursor.execute("SELECT * FROM campus_locations WHERE location_id = %s", (location_id,))
-        location = cursor.fetchone()
+    except mysql.connector.Error as err:
+        logger.error(f"Database error during enhanced card scan: {err}")
+        return jsonify({'success': False, 'message': 'System error occurred'})
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@app.route('/scan_cards/bulk', methods=['POST'])
+def scan_cards_bulk():
+    """Replay taps a door controller buffered while offline
+
+    Accepts a JSON array of taps (or ``{"taps": [...]}``), or one tap per
+    line with ``Content-Type: application/x-ndjson``. Each tap has
+    ``card_id``, ``location_id``, optional ``access_type`` and the
+    ``timestamp`` it happened at (ISO 8601 or epoch seconds). All taps are
+    decided together and written in one transaction; the response lists
+    one result per tap, in the order they were sent.
+    """
+    try:
+        taps = parse_bulk_taps(request)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid tap batch: {e}'}), 400
+    
+    if len(taps) > BULK_SCAN_CONFIG['max_taps']:
+        return jsonify({
+            'success': False,
+            'message': f"Too many taps ({len(taps)}); send at most {BULK_SCAN_CONFIG['max_taps']} per request"
+        }), 413
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'message': 'Database connection failed'})
+    
+    try:
+        cursor = conn.cursor(dictionary=True)
+        outcomes = evaluate_card_scans_bulk(cursor, taps)
+        record_bulk_scan_outcome(conn, outcomes)
         
-        # Debug logging for location data
-        logger.info(f"Location query for ID {location_id}: {location}")
+        return jsonify({
+            'success': True,
+            'count': len(outcomes),
+            'results': [response for response, _, _ in outcomes]
+        })
         
-        if not location:
-            logger.warning(f"Location not found for ID: {location_id}")
+    except mysql.connector.Error as err:
+        logger.error(f"Database error during bulk card scan: {err}")
+        return jsonify({'success': False, 'message': 'System error occurred'})
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+def parse_bulk_taps(req):
+    """List of tap dicts from a JSON array/object or an NDJSON body"""
+    if req.mimetype == 'application/x-ndjson':
+        taps = []
+        for line_number, line in enumerate(req.stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                taps.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f'line {line_number} is not valid JSON')
+    else:
+        data = req.get_json(silent=True)
+        taps = data.get('taps') if isinstance(data, dict) else data
+    
+    if not isinstance(taps, list) or not all(isinstance(tap, dict) for tap in taps):
+        raise ValueError('expected a list of tap objects')
+    return taps
+
+def parse_tap_time(value):
+    """Local naive datetime for a tap timestamp (ISO 8601 or epoch seconds)"""
+    if value is None:
+        return datetime.now()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value)
+    if isinstance(value, str):
+        tap_time = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        if tap_time.tzinfo is not None:
+            tap_time = tap_time.astimezone().replace(tzinfo=None)
+        return tap_time
+    raise ValueError(f'unsupported timestamp {value!r}')
+
+def evaluate_card_scans_bulk(cursor, taps):
+    """Decide a batch of taps without writing anything.
+
+    Same decisions as ``evaluate_card_scan``, but the cards and locations
+    are loaded with one prefetch, taps are evaluated in time order so each
+    sees the ones before it, and every tap that reaches the AI is scored in
+    a single ``detect_anomalies`` call. Returns one ``(response, alerts,
+    access_log)`` tuple per tap, in the order given.
+    """
+    outcomes = [None] * len(taps)
+    valid = []
+    for index, tap in enumerate(taps):
+        if (not tap.get('card_id') or not tap.get('location_id') or
+                not isinstance(tap['card_id'], (str, int)) or not isinstance(tap['location_id'], (str, int))):
+            outcomes[index] = ({'success': False, 'message': 'Missing card ID or location ID'}, [], None)
+            continue
+        try:
+            tap_time = parse_tap_time(tap.get('timestamp'))
+        except (ValueError, TypeError, OverflowError, OSError):
+            outcomes[index] = ({'success': False, 'message': 'Invalid tap timestamp'}, [], None)
+            continue
+        valid.append((tap_time, index, tap))
+    
+    card_directory.prefetch(cursor, {tap['card_id'] for _, _, tap in valid},
+                            {tap['location_id'] for _, _, tap in valid})
+    
+    # Later taps in the batch see this one; the shared state only once the batch commits
+    batch_state, batch_travel = access_state.pending(), travel_detector.pending()
+    pending = []
+    for tap_time, index, tap in sorted(valid, key=lambda item: (item[0], item[1])):
+        outcome, scan = prepare_card_scan(cursor, tap['card_id'], tap['location_id'],
+                                          tap.get('access_type', 'entry'), tap_time,
+                                          list_locations=False, state=batch_state, travel=batch_travel)
+        if outcome is not None:
+            outcomes[index] = outcome
+            continue
+        batch_state.record(scan['student']['student_id'], scan['location_id'], tap_time)
+        batch_travel.record(scan['card_id'], scan['location_id'], tap_time)
+        pending.append((index, scan))
+    
+    ai_results = [None] * len(pending)
+    if pending:
+        try:
+            engine = get_ai_engine()
+            ai_results = engine.split_anomaly_results(
+                engine.detect_anomalies([scan['analysis_data'] for _, scan in pending]))
+        except Exception as ai_error:
+            logger.error(f"AI analysis error: {ai_error}")
+    
+    for (index, scan), ai_analysis in zip(pending, ai_results):
+        outcomes[index] = finish_card_scan(cursor, scan, ai_analysis)
+    return outcomes
+
+def evaluate_card_scan(cursor, card_id, location_id, access_type):
+    """Decide a card scan without writing anything.
+
+    Returns ``(response, alerts, access_log)``: the JSON response body, a
+    list of keyword arguments for ``create_enhanced_security_alert`` and the
+    keyword arguments for ``enhanced_log_access_attempt`` (or None).
+    """
+    outcome, pending = prepare_card_scan(cursor, card_id, location_id, access_type)
+    if outcome is not None:
+        return outcome
+    
+    # Get AI anomaly detection results (batched with concurrent scans)
+    try:
+        ai_analysis = anomaly_batcher.score(pending['analysis_data'])
+    except Exception as ai_error:
+        logger.error(f"AI analysis error: {ai_error}")
+        ai_analysis = None
+    
+    return finish_card_scan(cursor, pending, ai_analysis)
+
+def prepare_card_scan(cursor, card_id, location_id, access_type, tap_time=None, list_locations=True,
+                      state=None, travel=None):
+    """Run the checks that come before AI scoring.
+
+    Returns ``(outcome, None)`` when the scan is decided without the AI
+    (unknown card or location), otherwise ``(None, pending)`` where
+    ``pending['analysis_data']`` is the input for anomaly scoring and
+    ``pending`` is handed to ``finish_card_scan`` with the result.
+    ``state`` and ``travel`` default to the shared ``access_state`` and
+    ``travel_detector``; a bulk batch passes its pending views of them.
+    """
+    tap_time = tap_time or datetime.now()
+    state = state or access_state
+    travel = travel or travel_detector
+    
+    # Check if card exists and get student info (cached reference data)
+    student = card_directory.get_student_by_card(cursor, card_id)
+    logger.debug(f"Student query for card {card_id}: {student}")
+    
+    if not student:
+        # Unknown card - create enhanced alert
+        alerts = [{
+            'alert_type': 'unauthorized_access', 'severity': 'high', 'location_id': location_id,
+            'card_id': card_id,
+            'message': f'Unknown card {card_id} attempted access at location {location_id}'
+        }]
+        access_log = {
+            'student_id': None, 'card_id': card_id, 'location_id': location_id,
+            'access_type': access_type, 'granted': False, 'denial_reason': 'Unknown card',
+            'access_time': tap_time
+        }
+        return ({
+            'success': False, 
+            'message': 'ACCESS DENIED: Unknown card',
+            'alert': True,
+            'alert_type': 'unauthorized_access',
+            'risk_level': 'high'
+        }, alerts, access_log), None
+    
+    # Get location info first (needed for AI analysis)
+    location = card_directory.get_location(cursor, location_id)
+    logger.debug(f"Location query for ID {location_id}: {location}")
+    
+    if not location:
+        logger.warning(f"Location not found for ID: {location_id}")
+        response = {
+            'success': False,
+            'message': 'ACCESS DENIED: Invalid location',
+            'error_detail': f'Location ID {location_id} not found'
+        }
+        if list_locations:
             # Check if location exists at all
             cursor.execute("SELECT location_id, location_name FROM campus_locations WHERE is_active = TRUE")
             available_locations = cursor.fetchall()
             logger.info(f"Available locations: {available_locations}")
-            
-            return jsonify({
-                'success': False,
-                'message': 'ACCESS DENIED: Invalid location',
-                'error_detail': f'Location ID {location_id} not found',
-                'available_locations': [{'id': loc['location_id'], 'name': loc['location_name']} for loc in available_locations] if available_locations else []
-            })
-        
-        # Perform risk assessment with AI enhancement
-        risk_assessment = policy_engine.assess_access_risk(student['student_id'], location_id)
-        
-        # AI-powered anomaly detection
-        ai_engine = get_ai_engine()
-        
-        # Prepare data for AI analysis
-        access_analysis_data = {
-            'student_id': student['student_id'],
-            'location_id': location_id,
-            'hour': datetime.now().hour,
-            'day_of_week': datetime.now().weekday(),
-            'is_weekend': datetime.now().weekday() >= 5,
-            'current_risk_score': risk_assessment['risk_score'],
-            'time_between_access': get_time_since_last_access(student['student_id']),
-            'locations_per_hour': get_recent_location_count(student['student_id']),
-            'location_security_level': location.get('access_level', 'public') if location else 'public'
-        }
-        
-        # Get AI anomaly detection results
-        try:
-            ai_analysis = ai_engine.detect_anomaly(access_analysis_data)
-        except Exception as ai_error:
-            logger.error(f"AI analysis error: {ai_error}")
-            # Fallback AI response
-            ai_analysis = {
-                'is_anomaly': False,
-                'anomaly_score': 1,
-                'confidence': 85,
-                'risk_level': 'low',
-                'explanation': 'AI analysis using fallback mode'
-            }
-        
-        # Ensure AI analysis has all required fields and JSON-serializable types
+            response['available_locations'] = [{'id': loc['location_id'], 'name': loc['location_name']} for loc in available_locations] if available_locations else []
+        return (response, [], None), None
+    
+    # Could the card physically have got here since its last tap?
+    impossible_trip = None
+    if travel.ensure_fresh(cursor):
+        impossible_trip = travel.check(card_id, location_id, tap_time)
+    
+    # Perform risk assessment with AI enhancement
+    risk_assessment = policy_engine.assess_access_risk(student['student_id'], location_id, tap_time,
+                                                       impossible_trip)
+    
+    # Behavioural features come from the in-memory state store when it is warm
+    if state.ensure_fresh(cursor):
+        # A replayed tap can be older than accesses already recorded
+        time_between_access = max(0, state.minutes_since_last_access(student['student_id'], tap_time))
+        locations_per_hour = state.locations_in_window(student['student_id'], tap_time)
+    else:
+        time_between_access = get_time_since_last_access(student['student_id'])
+        locations_per_hour = get_recent_location_count(student['student_id'])
+    
+    # Deviation from the student's own baseline (None until established)
+    baseline = student_profiles.deviation(student['student_id'], location_id, tap_time)
+    
+    # Prepare data for AI analysis
+    access_analysis_data = {
+        'student_id': student['student_id'],
+        'location_id': location_id,
+        'hour': tap_time.hour,
+        'day_of_week': tap_time.weekday(),
+        'is_weekend': tap_time.weekday() >= 5,
+        'current_risk_score': risk_assessment['risk_score'],
+        'time_between_access': time_between_access,
+        'locations_per_hour': locations_per_hour,
+        'location_security_level': location.get('access_level', 'public') if location else 'public',
+        'baseline_deviation': baseline['score'] if baseline else None,
+        'baseline_factors': baseline['factors'] if baseline else [],
+        'impossible_travel': impossible_trip is not None
+    }
+    
+    return None, {
+        'student': student, 'location': location, 'card_id': card_id,
+        'location_id': location_id, 'access_type': access_type, 'tap_time': tap_time,
+        'risk_assessment': risk_assessment, 'analysis_data': access_analysis_data,
+        'impossible_trip': impossible_trip
+    }
+
+def finish_card_scan(cursor, pending, ai_analysis):
+    """Decide a scan from ``prepare_card_scan`` output and its AI analysis.
+
+    ``ai_analysis`` may be None when scoring failed; the fallback analysis
+    is used then. Returns ``(response, alerts, access_log)`` like
+    ``evaluate_card_scan``.
+    """
+    student, location = pending['student'], pending['location']
+    card_id, location_id = pending['card_id'], pending['location_id']
+    access_type, risk_assessment = pending['access_type'], pending['risk_assessment']
+    
+    if ai_analysis is None:
+        # Fallback AI response
         ai_analysis = {
-            'is_anomaly': bool(ai_analysis.get('is_anomaly', False)),
-            'anomaly_score': float(ai_analysis.get('anomaly_score', 1)),
-            'confidence': float(ai_analysis.get('confidence', 85)),
-            'risk_level': str(ai_analysis.get('risk_level', 'low')),
-            'explanation': str(ai_analysis.get('explanation', 'Normal access pattern'))
+            'is_anomaly': False,
+            'anomaly_score': 1,
+            'confidence': 85,
+            'risk_level': 'low',
+            'explanation': 'AI analysis using fallback mode'
         }
-        
-        # Enhance risk assessment with AI insights
-        if ai_analysis['is_anomaly']:
-            risk_assessment['risk_score'] = max(risk_assessment['risk_score'], int(ai_analysis['anomaly_score']))
-            risk_assessment['risk_level'] = ai_analysis['risk_level']
-            risk_assessment['ai_detected'] = True
-            risk_assessment['ai_explanation'] = ai_analysis['explanation']
-        else:
-            risk_assessment['ai_detected'] = False
-            risk_assessment['ai_explanation'] = 'Normal behavior pattern'
-        
-        # Check if student is active
-        if student['status'] != 'active':
-            enhanced_log_access_attempt(student['student_id'], card_id, location_id, access_type, 
-                                      False, f'Student status: {student["status"]}', risk_assessment)
-            return jsonify({
-                'success': False, 
-                'message': f'ACCESS DENIED: Student status is {student["status"]}',
-                'student_name': student['full_name'],
-                'risk_level': risk_assessment['risk_level'],
-                'ai_analysis': ai_analysis
-            })
-        
-        # Check if card is lost or stolen
-        cursor.execute("SELECT COUNT(*) as count FROM lost_stolen_cards WHERE card_id = %s AND status = 'active'", (card_id,))
-        lost_stolen_count = cursor.fetchone()['count']
-        
-        if lost_stolen_count > 0:
-            create_enhanced_security_alert('lost_card_used', 'critical', location_id, 
-                                          student['student_id'], card_id,
-                                          message=f'Lost/stolen card used by {student["full_name"]} at location {location_id}')
-            enhanced_log_access_attempt(student['student_id'], card_id, location_id, access_type, 
-                                      False, 'Card reported as lost/stolen', risk_assessment)
-            return jsonify({
-                'success': False, 
-                'message': 'ACCESS DENIED: Card reported as lost/stolen',
-                'alert': True,
-                'alert_type': 'lost_card_used',
-                'student_name': student['full_name'],
-                'risk_level': 'critical'
-            })
-        
-        # Location info already retrieved above for AI analysis
-        
-        # Check access level permissions
-        if location and location['access_level'] == 'staff_only':
-            enhanced_log_access_attempt(student['student_id'], card_id, location_id, access_type, 
-                                      False, 'Insufficient access level - staff only', risk_assessment)
-            return jsonify({
-                'success': False, 
-                'message': 'ACCESS DENIED: Staff access required',
-                'student_name': student['full_name'],
-                'location_name': location['location_name'],
-                'risk_level': risk_assessment['risk_level']
-            })
-        
-        # Check if additional authentication is required based on risk
-        if risk_assessment['requires_additional_auth']:
-            # In a real system, this would trigger additional authentication
-            create_enhanced_security_alert('high_risk_access', 'medium', location_id,
-                                          student['student_id'], card_id,
-                                          message=f'High-risk access attempt by {student["full_name"]} requires additional verification')
-        
-        # Access granted - log successful entry
-        enhanced_log_access_attempt(student['student_id'], card_id, location_id, access_type, True, 
-                                  risk_assessment=risk_assessment)
-        
-        return jsonify({
-            'success': True, 
-            'message': f'ACCESS GRANTED',
+    
+    # Ensure AI analysis has all required fields and JSON-serializable types
+    ai_analysis = {
+        'is_anomaly': bool(ai_analysis.get('is_anomaly', False)),
+        'anomaly_score': float(ai_analysis.get('anomaly_score', 1)),
+        'confidence': float(ai_analysis.get('confidence', 85)),
+        'risk_level': str(ai_analysis.get('risk_level', 'low')),
+        'explanation': str(ai_analysis.get('explanation', 'Normal access pattern'))
+    }
+    
+    # Enhance risk assessment with AI insights
+    if ai_analysis['is_anomaly']:
+        risk_assessment['risk_score'] = max(risk_assessment['risk_score'], int(ai_analysis['anomaly_score']))
+        risk_assessment['risk_level'] = ai_analysis['risk_level']
+        risk_assessment['ai_detected'] = True
+        risk_assessment['ai_explanation'] = ai_analysis['explanation']
+    else:
+        risk_assessment['ai_detected'] = False
+        risk_assessment['ai_explanation'] = 'Normal behavior pattern'
+    
+    access_log = {
+        'student_id': student['student_id'], 'card_id': card_id, 'location_id': location_id,
+        'access_type': access_type, 'risk_assessment': risk_assessment,
+        'access_time': pending['tap_time']
+    }
+    
+    # Check if student is active
+    if student['status'] != 'active':
+        access_log.update(granted=False, denial_reason=f'Student status: {student["status"]}')
+        return {
+            'success': False, 
+            'message': f'ACCESS DENIED: Student status is {student["status"]}',
             'student_name': student['full_name'],
-            'student_id': student['student_id'],
-            'location_name': location['location_name'] if location else 'Unknown Location',
-            'access_type': access_type.upper(),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'risk_level': risk_assessment['risk_level'],
-            'additional_auth_required': risk_assessment['requires_additional_auth'],
-            'photo_url': student.get('photo_url'),
-            'program': student.get('program'),
-            'year_of_study': student.get('year_of_study'),
-            'ai_analysis': ai_analysis,
-            'ai_confidence': ai_analysis.get('confidence', 0)
+            'ai_analysis': ai_analysis
+        }, [], access_log
+    
+    # Check if card is lost or stolen (by the stored id, not however the reader sent it)
+    if card_directory.is_card_reported(cursor, student['card_id']):
+        alerts = [{
+            'alert_type': 'lost_card_used', 'severity': 'critical', 'location_id': location_id,
+            'student_id': student['student_id'], 'card_id': card_id,
+            'message': f'Lost/stolen card used by {student["full_name"]} at location {location_id}'
+        }]
+        access_log.update(granted=False, denial_reason='Card reported as lost/stolen')
+        return {
+            'success': False, 
+            'message': 'ACCESS DENIED: Card reported as lost/stolen',
+            'alert': True,
+            'alert_type': 'lost_card_used',
+            'student_name': student['full_name'],
+            'risk_level': 'critical'
+        }, alerts, access_log
+    
+    # Check access level permissions
+    if location and location['access_level'] == 'staff_only':
+        access_log.update(granted=False, denial_reason='Insufficient access level - staff only')
+        return {
+            'success': False, 
+            'message': 'ACCESS DENIED: Staff access required',
+            'student_name': student['full_name'],
+            'location_name': location['location_name'],
+            'risk_level': risk_assessment['risk_level']
+        }, [], access_log
+    
+    alerts = []
+    
+    impossible_trip = pending.get('impossible_trip')
+    if impossible_trip:
+        alerts.append({
+            'alert_type': 'high_risk_access', 'severity': 'high', 'location_id': location_id,
+            'student_id': student['student_id'], 'card_id': card_id,
+            'message': (f'Possible cloned card {card_id}: used at {impossible_trip["to_location"]} '
+                        f'{impossible_trip["elapsed_seconds"]:.0f}s after {impossible_trip["from_location"]} '
+                        f'(walk takes about {impossible_trip["required_seconds"]:.0f}s)')
         })
-        
-    except mysql.connector.Error as err:
-        logger.error(f"Database error during enhanced card scan: {err}")
-        return jsonify({'success': False, 'message': 'System error occurred'})
+    
+    # Check if additional authentication is required based on risk
+    if risk_assessment['requires_additional_auth']:
+        # In a real system, this would trigger additional authentication
+        alerts.append({
+            'alert_type': 'high_risk_access', 'severity': 'medium', 'location_id': location_id,
+            'student_id': student['student_id'], 'card_id': card_id,
+            'message': f'High-risk access attempt by {student["full_name"]} requires additional verification'
+        })
+    
+    # Access granted - log successful entry
+    access_log.update(granted=True)
+    
+    return {
+        'success': True, 
+        'message': f'ACCESS GRANTED',
+        'student_name': student['full_name'],
+        'student_id': student['student_id'],
+        'location_name': location['location_name'] if location else 'Unknown Location',
+        'access_type': access_type.upper(),
+        'timestamp': pending['tap_time'].strftime('%Y-%m-%d %H:%M:%S'),
+        'risk_level': risk_assessment['risk_level'],
+        'additional_auth_required': risk_assessment['requires_additional_auth'],
+        'photo_url': student.get('photo_url'),
+        'program': student.get('program'),
+        'year_of_study': student.get('year_of_study'),
+        'ai_analysis': ai_analysis,
+        'ai_confidence': ai_analysis.get('confidence', 0)
+    }, alerts, access_log
+
+@app.route('/api/edge/snapshot')
+@require_api_auth('manage_cards')
+def edge_snapshot():
+    """Binary decision snapshot for card readers that decide offline
+
+    Without ``since`` the full snapshot is returned. With ``since=<version>``
+    a reader gets only the changes since the version it holds, or the full
+    snapshot if that version is no longer kept, or 304 if it is current.
+    ``X-Snapshot-Kind`` and ``X-Snapshot-Version`` describe the body.
+    """
+    since = request.args.get('since', type=int)
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'message': 'Database connection failed'}), 503
+    
+    try:
+        version = edge_snapshots.refresh(conn)
+    except (mysql.connector.Error, OSError) as err:
+        logger.error(f"Edge snapshot build failed: {err}")
+        version = edge_snapshots.latest_version()
+        if version is None:
+            return jsonify({'success': False, 'message': 'Snapshot unavailable'}), 503
     finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+        conn.close()
+    
+    if since == version:
+        return Response(status=304, headers={'X-Snapshot-Version': str(version)})
+    
+    data = edge_snapshots.delta(since, version) if since else None
+    kind = 'delta'
+    if data is None:
+        data, kind = edge_snapshots.read(version), 'full'
+    
+    return Response(data, mimetype='application/octet-stream', headers={
+        'X-Snapshot-Kind': kind,
+        'X-Snapshot-Version': str(version),
+        'Content-Disposition': f'attachment; filename=edge-snapshot-{version}-{kind}.bin'
+    })
 
 def get_time_since_last_access(student_id):
     """Get minutes since student's last access attempt"""
@@ -908,6 +1438,7 @@ def add_student():
                                  request.current_user['user_id'])
                 
                 conn.commit()
+                card_directory.invalidate_card(card_id)
                 flash(f'Student {data.get("full_name")} added successfully! Card ID: {card_id}', 'success')
                 
                 if request.is_json:
@@ -972,12 +1503,14 @@ def add_location():
                     data.get('access_level'),
                     True
                 ))
+                location_id = cursor.lastrowid
                 
                 log_security_event('location_added', 
                                  f'New location added: {data.get("location_name")} in {data.get("building")}',
                                  request.current_user['user_id'])
                 
                 conn.commit()
+                card_directory.invalidate_location(location_id)
                 flash(f'Location {data.get("location_name")} added successfully!', 'success')
                 
                 if request.is_json:
@@ -1374,6 +1907,94 @@ def admin_system_stats():
         logger.error(f"Error in admin_system_stats: {e}")
         return jsonify({'success': False, 'error': 'Internal server error'})
 
+@app.route('/admin/api/performance_metrics')
+@require_auth('admin')
+def admin_performance_metrics():
+    """Runtime metrics for the scan pipeline in this worker process"""
+    pool = db_pool.get_pool()
+    return jsonify({
+        'success': True,
+        'db_pool': pool.stats() if pool else None,
+        'db_background_pool': db_pool.get_background_pool().stats() if db_pool.get_background_pool() else None,
+        'card_directory': card_directory.stats(),
+        'access_state': access_state.stats(),
+        'student_profiles': student_profiles.stats(),
+        'token_cache': security_manager.token_cache_stats(),
+        'failed_attempts': security_manager.store.attempt_stats(),
+        'impossible_travel': travel_detector.stats(),
+        'anomaly_scoring': anomaly_batcher.metrics(),
+        'audit_log': audit_writer.get_writer().metrics(),
+        'access_ingest': access_ingestor.metrics(),
+        'model_retraining': model_retrainer.status(),
+        'edge_snapshot': edge_snapshots.metrics(),
+        'risk_heatmap': risk_heatmap.stats()
+    })
+
+@app.route('/admin/api/risk_heatmap')
+@require_auth('all')
+def admin_risk_heatmap():
+    """Incident risk for every active location (cached; ?refresh=1 rebuilds)"""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'success': False, 'error': 'Database connection failed'})
+    
+    try:
+        cursor = conn.cursor(dictionary=True)
+        heatmap = risk_heatmap.get(cursor, refresh=request.args.get('refresh') == '1')
+        return jsonify({'success': True, **heatmap})
+        
+    except mysql.connector.Error as err:
+        logger.error(f"Risk heatmap error: {err}")
+        return jsonify({'success': False, 'error': 'Failed to build risk heatmap'})
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+@app.route('/admin/api/retrain_models', methods=['POST'])
+@require_auth('admin')
+def admin_retrain_models():
+    """Start retraining the AI models from access history in the background"""
+    if not model_retrainer.trigger():
+        return jsonify({'success': False, 'error': 'Model retraining is already running'})
+    
+    log_security_event('ai_models_retrain_requested',
+                     'AI model retraining from access history requested',
+                     session.get('user_id'))
+    return jsonify({'success': True, 'message': 'Model retraining started'})
+
+@app.route('/admin/api/shadow_scoring')
+@require_auth('admin')
+def admin_shadow_scoring():
+    """Compare the shadow candidate with the live models on this worker's traffic"""
+    engine = get_ai_engine()
+    engine.sync_shadow(SHADOW_CANDIDATE_DIR)
+    report = engine.shadow_report()
+    if report is None:
+        return jsonify({'success': False,
+                        'error': f"No candidate models in {SHADOW_CANDIDATE_DIR}"})
+    return jsonify({'success': True, 'report': report})
+
+@app.route('/admin/api/shadow_scoring/<action>', methods=['POST'])
+@require_auth('admin')
+def admin_shadow_scoring_action(action):
+    """Promote the shadow candidate to live, or discard it"""
+    done_message = {'promote': 'promoted', 'discard': 'discarded'}.get(action)
+    if done_message is None:
+        return jsonify({'success': False, 'error': 'Unknown action'}), 404
+    
+    engine = get_ai_engine()
+    engine.sync_shadow(SHADOW_CANDIDATE_DIR)
+    report = engine.shadow_report()
+    done = engine.promote_shadow() if action == 'promote' else engine.discard_shadow()
+    if not done:
+        return jsonify({'success': False, 'error': 'No usable shadow candidate'})
+    
+    log_security_event(f'ai_models_shadow_{action}',
+                       f"Shadow candidate models {done_message} after {report['accesses'] if report else 0} accesses",
+                       session.get('user_id'))
+    return jsonify({'success': True, 'message': f'Shadow candidate {done_message}'})
+
 @app.route('/admin/get_basic_stats')
 @require_auth('admin')
 def admin_basic_stats():
@@ -1618,6 +2239,7 @@ def renew_student_card():
                              session.get('user_id'))
             
             conn.commit()
+            card_directory.invalidate_card(card_id)
             logger.info(f"Card renewed for student {student_id} by user {session.get('user_id')}")
             
             return jsonify({
@@ -1708,6 +2330,8 @@ def report_lost_stolen_card():
                              session.get('user_id'))
             
             conn.commit()
+            revoked_cards.add(card_id)
+            card_directory.invalidate_card(card_id)
             logger.info(f"Card {card_id} reported as {report_type} for student {student_id} by user {session.get('user_id')}")
             
             return jsonify({
@@ -1742,76 +2366,45 @@ def get_filtered_security_events():
         try:
             cursor = conn.cursor(dictionary=True)
             
-            # Base query
-            base_query = """
-                SELECT log_id, event_type, event_details, user_id, timestamp,
-                       'medium' as risk_level
-                FROM security_audit_log
-            """
-            
-            # Apply filter conditions
-            if filter_type == 'all':
-                query = base_query + " ORDER BY timestamp DESC LIMIT %s"
-                cursor.execute(query, (limit,))
-            
-            elif filter_type == 'critical':
-                query = base_query + """
-                    WHERE event_type IN ('security_breach', 'unauthorized_access', 'policy_violation', 'system_compromise')
-                    OR event_details LIKE '%critical%' OR event_details LIKE '%urgent%'
-                    ORDER BY timestamp DESC LIMIT %s
-                """
-                cursor.execute(query, (limit,))
-            
-            elif filter_type == 'failed_access':
-                query = base_query + """
-                    WHERE event_type IN ('access_denied', 'login_failed', 'unauthorized_access')
-                    OR event_details LIKE '%denied%' OR event_details LIKE '%failed%'
-                    ORDER BY timestamp DESC LIMIT %s
-                """
-                cursor.execute(query, (limit,))
-            
-            elif filter_type == 'policy_violations':
-                query = base_query + """
-                    WHERE event_type IN ('policy_violation', 'rule_breach')
-                    OR event_details LIKE '%violation%' OR event_details LIKE '%policy%'
-                    ORDER BY timestamp DESC LIMIT %s
-                """
-                cursor.execute(query, (limit,))
-            
-            elif filter_type == 'user_activity':
-                query = base_query + """
-                    WHERE event_type IN ('login', 'logout', 'session_start', 'session_end', 'user_action')
-                    OR event_details LIKE '%login%' OR event_details LIKE '%session%'
-                    ORDER BY timestamp DESC LIMIT %s
-                """
-                cursor.execute(query, (limit,))
-            
-            elif filter_type == 'system_events':
-                query = base_query + """
-                    WHERE event_type IN ('system_startup', 'system_shutdown', 'service_restart', 'database_maintenance')
-                    OR event_details LIKE '%system%' OR event_details LIKE '%server%'
-                    ORDER BY timestamp DESC LIMIT %s
-                """
-                cursor.execute(query, (limit,))
-            
+            # Presets are pre-computed at write time (audit_index.py): one
+            # descending range scan of security_audit_keywords' primary key
+            if filter_type in audit_index.FILTER_PRESETS:
+                cursor.execute("""
+                    SELECT a.log_id, a.event_type, a.event_details, a.user_id, a.timestamp,
+                           a.category, a.risk_level
+                    FROM security_audit_keywords k
+                    JOIN security_audit_log a ON a.log_id = k.log_id
+                    WHERE k.keyword = %s
+                    ORDER BY k.log_id DESC
+                    LIMIT %s
+                """, (audit_index.get_indexer().preset_keyword(filter_type), limit))
             else:
-                # Default to all events for unknown filter
-                query = base_query + " ORDER BY timestamp DESC LIMIT %s"
-                cursor.execute(query, (limit,))
+                # 'all', and the default for unknown filters
+                cursor.execute("""
+                    SELECT log_id, event_type, event_details, user_id, timestamp, category, risk_level
+                    FROM security_audit_log
+                    ORDER BY timestamp DESC LIMIT %s
+                """, (limit,))
             
             events = cursor.fetchall()
             
             # Process events for frontend
             processed_events = []
             for event in events:
+                details = security_manager.decrypt_data(event['event_details']) if event['event_details'] else None
                 processed_event = {
                     'log_id': event['log_id'],
                     'event_type': event['event_type'],
-                    'description': event['event_details'][:100] if event['event_details'] else 'No description',
+                    'description': details[:100] if details else 'No description',
                     'user_id': event['user_id'],
                     'timestamp': event['timestamp'].isoformat() if event['timestamp'] else None,
-                    'risk_level': determine_risk_level(event['event_type'], event['event_details'])
+                    'category': event['category'],
+                    'risk_level': event['risk_level']
                 }
+                if event['category'] is None:
+                    # Written before the index existed (python audit_index.py reindex)
+                    processed_event['category'], processed_event['risk_level'], _ = \
+                        audit_index.get_indexer().classify(event['event_type'], details)
                 processed_events.append(processed_event)
             
             logger.info(f"Filtered security events: {filter_type}, returned {len(processed_events)} events")
@@ -1835,22 +2428,6 @@ def get_filtered_security_events():
         logger.error(f"Error in get_filtered_security_events: {e}")
         return jsonify({'success': False, 'error': 'Internal server error'})
 
-def determine_risk_level(event_type, event_details):
-    """Determine risk level based on event type and details"""
-    high_risk_events = ['security_breach', 'unauthorized_access', 'system_compromise', 'data_breach']
-    medium_risk_events = ['policy_violation', 'access_denied', 'login_failed', 'rule_breach']
-    
-    if event_type in high_risk_events:
-        return 'high'
-    elif event_type in medium_risk_events:
-        return 'medium'
-    elif event_details and any(keyword in event_details.lower() for keyword in ['critical', 'urgent', 'breach', 'attack']):
-        return 'critical'
-    elif event_details and any(keyword in event_details.lower() for keyword in ['failed', 'denied', 'violation']):
-        return 'medium'
-    else:
-        return 'low'
-
 @app.route('/admin/cards')
 @require_auth('all')
 def admin_cards():
@@ -1938,6 +2515,7 @@ def block_card(card_id):
                                  request.current_user['user_id'])
                 
                 conn.commit()
+                card_directory.invalidate_card(card_id)
                 flash(f'Card {card_id} has been blocked successfully!', 'success')
             else:
                 flash('Card not found!', 'error')
@@ -1972,6 +2550,7 @@ def activate_card(card_id):
                                  request.current_user['user_id'])
                 
                 conn.commit()
+                card_directory.invalidate_card(card_id)
                 flash(f'Card {card_id} has been activated successfully!', 'success')
             else:
                 flash('Card not found!', 'error')
@@ -0,0 +1,224 @@
+# Audit Log Index for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Write-time category, risk level and keyword index for encrypted audit events
+
+import re
+import sys
+import hmac
+import json
+import hashlib
+import threading
+import logging
+import mysql.connector
+from access_ingest import multi_row_insert
+
+logger = logging.getLogger(__name__)
+
+AUDIT_LOG_COLUMNS = ('event_type', 'event_details', 'user_id', 'ip_address', 'user_agent', 'timestamp',
+                     'category', 'risk_level')
+
+# Filter presets of /api/security_events: event types that always match, and
+# words that match when a word of the details starts with them
+FILTER_PRESETS = {
+    'critical': {
+        'event_types': ('security_breach', 'unauthorized_access', 'policy_violation', 'system_compromise'),
+        'words': ('critical', 'urgent')
+    },
+    'failed_access': {
+        'event_types': ('access_denied', 'login_failed', 'unauthorized_access'),
+        'words': ('denied', 'failed')
+    },
+    'policy_violations': {
+        'event_types': ('policy_violation', 'rule_breach'),
+        'words': ('violation', 'policy')
+    },
+    'user_activity': {
+        'event_types': ('login', 'logout', 'session_start', 'session_end', 'user_action'),
+        'words': ('login', 'session')
+    },
+    'system_events': {
+        'event_types': ('system_startup', 'system_shutdown', 'service_restart', 'database_maintenance'),
+        'words': ('system', 'server')
+    }
+}
+
+HIGH_RISK_EVENTS = ('security_breach', 'unauthorized_access', 'system_compromise', 'data_breach')
+MEDIUM_RISK_EVENTS = ('policy_violation', 'access_denied', 'login_failed', 'rule_breach')
+RISK_LEVELS = ('low', 'medium', 'high', 'critical')
+
+_WORD = re.compile(r'[a-z0-9]{3,40}')
+
+class AuditIndexer:
+    """Derives what the audit log is searched by while the details are still plain text.
+
+    ``classify()`` gives each event a ``category`` (the first filter preset
+    it matches, else 'general'), a ``risk_level`` and its index keywords:
+    ``preset:<name>`` for every preset it matches, ``type:<event_type>``
+    and up to ``max_words`` distinct words of the details. With a ``key``
+    the keywords are stored as truncated HMAC-SHA256 digests, so the index
+    does not hand out the words the encryption hides; ``keyword()`` maps a
+    search term the same way.
+    """
+
+    def __init__(self, key=None, max_words=48):
+        self.key = key
+        self.max_words = max_words
+
+    def keyword(self, term):
+        """The stored form of an index term"""
+        term = term.lower()
+        if self.key is None:
+            return term[:64]
+        return hmac.new(self.key, term.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def preset_keyword(self, preset):
+        return self.keyword(f'preset:{preset}')
+
+    def classify(self, event_type, details):
+        """(category, risk_level, keywords) for one event"""
+        text = str(details) if details is not None else ''
+        words = list(dict.fromkeys(_WORD.findall(text.lower())))
+        fields = _json_fields(text)
+
+        presets = [name for name, preset in FILTER_PRESETS.items()
+                   if event_type in preset['event_types']
+                   or any(word.startswith(prefix) for word in words for prefix in preset['words'])]
+        if fields.get('granted') is False and 'failed_access' not in presets:
+            # Denied scans are audited as JSON with "granted": false
+            presets.append('failed_access')
+
+        terms = [f'preset:{name}' for name in presets] + [f'type:{event_type}'] + words[:self.max_words]
+        keywords = list(dict.fromkeys(self.keyword(term) for term in terms))
+        category = presets[0] if presets else 'general'
+        return category, self._risk_level(event_type, text.lower(), fields), keywords
+
+    @staticmethod
+    def _risk_level(event_type, text, fields):
+        if event_type in HIGH_RISK_EVENTS:
+            level = 'high'
+        elif event_type in MEDIUM_RISK_EVENTS:
+            level = 'medium'
+        elif any(word in text for word in ('critical', 'urgent', 'breach', 'attack')):
+            level = 'critical'
+        elif any(word in text for word in ('failed', 'denied', 'violation')):
+            level = 'medium'
+        else:
+            level = 'low'
+        # Access events carry the risk assessment's own level
+        assessed = fields.get('risk_level')
+        if assessed in RISK_LEVELS and RISK_LEVELS.index(assessed) > RISK_LEVELS.index(level):
+            level = assessed
+        return level
+
+def _json_fields(text):
+    if not text.startswith('{'):
+        return {}
+    try:
+        fields = json.loads(text)
+    except ValueError:
+        return {}
+    return fields if isinstance(fields, dict) else {}
+
+def insert_audit_events(cursor, rows, id_step=1):
+    """Insert classified audit rows and their keywords; returns the new log_ids.
+
+    ``rows`` are ``AUDIT_LOG_COLUMNS`` values followed by the keyword list.
+    Like ``insert_access_records()`` this relies on a multi-row INSERT
+    getting consecutive ids; the caller owns the transaction.
+    """
+    cursor.execute(multi_row_insert('security_audit_log', AUDIT_LOG_COLUMNS, len(rows)),
+                   [value for row in rows for value in row[:len(AUDIT_LOG_COLUMNS)]])
+    first_id = cursor.lastrowid
+    log_ids = [first_id + index * id_step for index in range(len(rows))]
+    insert_keywords(cursor, [(log_id, row[len(AUDIT_LOG_COLUMNS)]) for log_id, row in zip(log_ids, rows)])
+    return log_ids
+
+def insert_keywords(cursor, indexed, chunk_size=5000):
+    """Add ``(log_id, keywords)`` pairs to security_audit_keywords"""
+    pairs = [(keyword, log_id) for log_id, keywords in indexed for keyword in keywords]
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        cursor.execute(multi_row_insert('security_audit_keywords', ('keyword', 'log_id'), len(chunk), ignore=True),
+                       [value for pair in chunk for value in pair])
+
+def reindex(conn, decrypt, indexer=None, batch_size=500):
+    """Classify and index audit rows written before the index existed (category IS NULL)"""
+    indexer = indexer or get_indexer()
+    cursor = conn.cursor(dictionary=True)
+    total = 0
+    try:
+        while True:
+            # idx_category is (category, log_id) in InnoDB, so each batch is a range scan
+            cursor.execute("""
+                SELECT log_id, event_type, event_details
+                FROM security_audit_log
+                WHERE category IS NULL
+                ORDER BY log_id
+                LIMIT %s
+            """, (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            conn.start_transaction()
+            try:
+                updates, indexed = [], []
+                for row in rows:
+                    details = decrypt(row['event_details']) if row['event_details'] else ''
+                    category, risk_level, keywords = indexer.classify(row['event_type'], details)
+                    updates.append((category, risk_level, row['log_id']))
+                    indexed.append((row['log_id'], keywords))
+                cursor.executemany("UPDATE security_audit_log SET category = %s, risk_level = %s "
+                                   "WHERE log_id = %s", updates)
+                insert_keywords(cursor, indexed)
+                conn.commit()
+            except mysql.connector.Error:
+                conn.rollback()
+                raise
+            total += len(rows)
+            logger.info(f"Indexed {total} older audit events")
+    finally:
+        cursor.close()
+    return total
+
+# Global indexer, configured once by the application
+_indexer = AuditIndexer()
+_indexer_lock = threading.Lock()
+
+def init_indexer(key=None, **indexer_config):
+    """Replace the global indexer (``key`` turns on hashed keywords) and return it"""
+    global _indexer
+    with _indexer_lock:
+        _indexer = AuditIndexer(key, **indexer_config)
+    return _indexer
+
+def get_indexer():
+    """The global indexer (plain-text keywords until the application configures one)"""
+    return _indexer
+
+def main(argv=None):
+    """Command line entry point: ``python audit_index.py reindex``"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the security audit log index")
+    parser.add_argument('command', choices=['reindex'],
+                        help="'reindex' classifies and indexes audit rows written before the index existed")
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from app import get_db_connection  # Configures the cipher and indexer keys the app uses
+    from auth import security_manager
+
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed")
+        return 1
+    try:
+        total = reindex(conn, security_manager.decrypt_data, batch_size=args.batch_size)
+    finally:
+        conn.close()
+    print(f"✅ Indexed {total} audit events")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,451 @@
+# Audit Log Writer for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Write-behind batching of security_audit_log inserts with disk spill
+
+import os
+import json
+import glob
+import queue
+import atexit
+import threading
+import time
+import logging
+from datetime import datetime
+import mysql.connector
+from mysql.connector import errors, errorcode
+import audit_index
+from access_ingest import auto_increment_step
+
+logger = logging.getLogger(__name__)
+
+class _FlushRequest:
+    """Queue marker asking the flusher to write everything before it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class AuditLogWriter:
+    """Write-behind queue in front of ``security_audit_log``.
+
+    ``submit()`` only puts the event on a bounded in-memory queue. A flusher
+    thread classifies and indexes each event (``audit_index.py``) while its
+    details are still plain text, encrypts them and writes the queued
+    events and their keywords with one multi-row INSERT per table every
+    ``batch_size`` events or ``flush_interval_ms``, whichever comes first.
+    Events that cannot go to the database right away - the queue is full,
+    or the INSERT failed - are appended to a spool file under ``spool_dir``
+    (already encrypted) and replayed once the database accepts writes
+    again. Events the database rejects on their own merits, and spool lines
+    that cannot be read back, go to a dead-letter file in ``spool_dir``
+    instead. ``stop()`` drains the queue and is registered to run at
+    interpreter exit.
+    """
+
+    def __init__(self, connection_factory, encrypt=None, batch_size=200, flush_interval_ms=200,
+                 max_queue_size=10000, spool_dir='audit_spool', replay_interval=30):
+        self.connection_factory = connection_factory
+        self.encrypt = encrypt
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.spool_dir = spool_dir
+        self.replay_interval = replay_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._last_replay = 0.0
+        self._id_step = None
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'submitted': 0,
+            'written': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'total_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'spilled': 0,
+            'replayed': 0,
+            'write_errors': 0,
+            'row_fallbacks': 0,
+            'dead_lettered': 0,
+            'corrupt_spool_lines': 0
+        }
+
+    def submit(self, event_type, details, user_id=None, ip_address='system',
+               user_agent='system', timestamp=None):
+        """Queue one audit event; never blocks on the database"""
+        self._ensure_worker()
+        row = (event_type, details, user_id, ip_address, user_agent, timestamp or datetime.now())
+        with self._metrics_lock:
+            self._metrics['submitted'] += 1
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Keep the event rather than block the request or drop it
+            self._spill([self._encode(row)])
+        return True
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far; True if it finished in time"""
+        if self._worker is None or not self._worker.is_alive():
+            return self._queue.empty()
+        marker = _FlushRequest()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher after it drains the queue"""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        # Anything still queued (e.g. the worker never started) goes out now
+        leftover = self._drain_nowait()
+        if leftover:
+            self._write_or_spill(self._encode_rows(leftover))
+
+    def metrics(self):
+        """Queue depth, batch size and flush latency"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        batches = m['batches'] or 1
+        return {
+            'queued': self._queue.qsize(),
+            'submitted': m['submitted'],
+            'written': m['written'],
+            'batches': m['batches'],
+            'avg_batch_size': round(m['written'] / batches, 2),
+            'max_batch_size_seen': m['max_batch'],
+            'avg_flush_ms': round(m['total_flush_ms'] / batches, 3),
+            'max_flush_ms': round(m['max_flush_ms'], 3),
+            'spilled': m['spilled'],
+            'replayed': m['replayed'],
+            'write_errors': m['write_errors'],
+            'row_fallbacks': m['row_fallbacks'],
+            'dead_lettered': m['dead_lettered'],
+            'corrupt_spool_lines': m['corrupt_spool_lines'],
+            'spool_files': len(self._spool_files()),
+            'config': {
+                'batch_size': self.batch_size,
+                'flush_interval_ms': self.flush_interval_ms
+            }
+        }
+
+    def _ensure_worker(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                self._maybe_replay()
+                continue
+
+            batch, markers = [], []
+            item = first
+            deadline = time.perf_counter() + self.flush_interval_ms / 1000.0
+            while True:
+                if isinstance(item, _FlushRequest):
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            encoded = []
+            try:
+                if batch:
+                    encoded = self._encode_rows(batch)
+                    self._write_or_spill(encoded)
+            except Exception as e:
+                # Whatever one batch does, the flusher keeps running and the events are kept
+                logger.error(f"Audit log flush of {len(batch)} events failed: {e}")
+                self._spill(encoded)
+            for marker in markers:
+                marker.done.set()
+            self._maybe_replay()
+
+    def _encode(self, row):
+        event_type, details, user_id, ip_address, user_agent, timestamp = row
+        category, risk_level, keywords = audit_index.get_indexer().classify(event_type, details)
+        if self.encrypt is not None:
+            details = self.encrypt(details)
+        return (event_type, details, user_id, ip_address, user_agent, timestamp,
+                category, risk_level, keywords)
+
+    def _encode_rows(self, rows):
+        """Encode each event; one that cannot be is dead-lettered without its (plain text) details"""
+        encoded = []
+        for row in rows:
+            try:
+                encoded.append(self._encode(row))
+            except Exception as e:
+                logger.error(f"Could not encode audit event {row[0]}: {e}")
+                self._dead_letter([row[:1] + (None,) + row[2:] + (None, None, [])], f"encode failed: {e}")
+        return encoded
+
+    def _write_or_spill(self, rows):
+        unwritten = self._write(rows)
+        if unwritten:
+            self._spill(unwritten)
+
+    def _write(self, rows):
+        """Write encoded events; returns those to spill because the database is unavailable.
+
+        The batch goes in with one multi-row INSERT per table. If the
+        database rejects it for any other reason (a value too long, a
+        constraint) the rows are retried one by one, and those that fail on
+        their own go to the dead-letter file instead of the spool, so they
+        are not replayed forever and do not hold back the rest.
+        """
+        if not rows:
+            return []
+        started = time.perf_counter()
+        conn = None
+        handled = inserted = 0
+        try:
+            conn = self.connection_factory()
+            if conn is None:
+                raise mysql.connector.errors.InterfaceError("No database connection")
+            if self._id_step is None:
+                self._id_step = auto_increment_step(conn)
+            try:
+                self._insert(conn, rows)
+                handled = inserted = len(rows)
+            except mysql.connector.Error as err:
+                if _is_unavailable(err):
+                    raise
+                logger.warning(f"Audit log batch of {len(rows)} events failed ({err}); retrying rows one by one")
+                with self._metrics_lock:
+                    self._metrics['row_fallbacks'] += 1
+                for row in rows:
+                    try:
+                        self._insert(conn, [row])
+                        inserted += 1
+                    except mysql.connector.Error as row_err:
+                        if _is_unavailable(row_err):
+                            raise
+                        self._dead_letter([row], row_err)
+                    handled += 1
+        except Exception as err:
+            logger.error(f"Audit log batch of {len(rows)} events failed: {err}")
+            with self._metrics_lock:
+                self._metrics['write_errors'] += 1
+            return rows[handled:]
+        finally:
+            if conn is not None:
+                conn.close()
+
+        flush_ms = (time.perf_counter() - started) * 1000
+        with self._metrics_lock:
+            m = self._metrics
+            m['written'] += inserted
+            m['batches'] += 1
+            m['max_batch'] = max(m['max_batch'], len(rows))
+            m['total_flush_ms'] += flush_ms
+            m['max_flush_ms'] = max(m['max_flush_ms'], flush_ms)
+        return []
+
+    def _insert(self, conn, rows):
+        """Insert rows and their keywords in one transaction"""
+        conn.start_transaction()
+        cursor = conn.cursor()
+        try:
+            audit_index.insert_audit_events(cursor, rows, self._id_step)
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, f"audit-{os.getpid()}.jsonl")
+
+    def _dead_letter_path(self):
+        # Not matched by _spool_files(): nothing here is replayed automatically
+        return os.path.join(self.spool_dir, f"dead-letter-{os.getpid()}.jsonl")
+
+    def _spool_files(self):
+        return (glob.glob(os.path.join(self.spool_dir, 'audit-*.jsonl')) +
+                glob.glob(os.path.join(self.spool_dir, 'audit-*.jsonl.replaying')))
+
+    def _spill(self, rows):
+        """Append encoded events to this process's spool file and fsync it"""
+        if not rows:
+            return
+        if not self._append(self._spool_path(), [self._line(row) for row in rows]):
+            logger.critical(f"Could not spill {len(rows)} audit events to disk")
+            return
+        with self._metrics_lock:
+            self._metrics['spilled'] += len(rows)
+        logger.warning(f"Spilled {len(rows)} audit events to {self._spool_path()}")
+
+    def _dead_letter(self, rows, error):
+        """Set aside encoded events the database will not take, with the reason"""
+        lines = [json.dumps({'error': str(error), 'event': json.loads(self._line(row))}) for row in rows]
+        if not self._append(self._dead_letter_path(), lines):
+            logger.critical(f"Could not dead-letter {len(rows)} audit events")
+            return
+        with self._metrics_lock:
+            self._metrics['dead_lettered'] += len(rows)
+        logger.error(f"Dead-lettered {len(rows)} audit events to {self._dead_letter_path()}: {error}")
+
+    def _append(self, path, lines):
+        """Append lines to a file and fsync it; False if that failed"""
+        with self._spool_lock:
+            try:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                with open(path, 'a', encoding='utf-8') as f:
+                    for line in lines:
+                        f.write(line + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.critical(f"Could not write to {path}: {e}")
+                return False
+        return True
+
+    @staticmethod
+    def _line(row):
+        return json.dumps(list(row[:5]) + [row[5].isoformat()] + list(row[6:]), default=str)
+
+    def _maybe_replay(self):
+        """Move spooled events into the database once it accepts writes"""
+        if time.monotonic() - self._last_replay < self.replay_interval:
+            return
+        self._last_replay = time.monotonic()
+        for path in self._spool_files():
+            try:
+                if not self._replay(path):
+                    return  # Still down: try again later
+            except Exception as e:
+                logger.error(f"Replaying {path} failed: {e}")
+
+    def _replay(self, path):
+        """Replay one spool file; False if the database is still unavailable"""
+        claimed = self._claim(path)
+        if claimed is None:
+            return True
+        rows = []
+        with open(claimed, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(self._decode(line))
+                except (ValueError, TypeError, IndexError) as e:
+                    # e.g. the last line of a spill cut short by a crash
+                    logger.error(f"Skipping corrupt line {number} of {path}: {e}")
+                    with self._metrics_lock:
+                        self._metrics['corrupt_spool_lines'] += 1
+                    self._append(self._dead_letter_path(),
+                                 [json.dumps({'error': f"corrupt spool line: {e}", 'line': line.rstrip('\n')})])
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            unwritten = self._write(chunk)
+            if unwritten:
+                # Put the rest back and try again later
+                self._spill(unwritten + rows[start + len(chunk):])
+                os.remove(claimed)
+                return False
+            with self._metrics_lock:
+                self._metrics['replayed'] += len(chunk)
+        os.remove(claimed)
+        logger.info(f"Replayed {len(rows)} spooled audit events from {path}")
+        return True
+
+    def _claim(self, path):
+        """Take over a spool file no other process is using; returns its new path"""
+        name = os.path.basename(path)
+        try:
+            pid = int(name[len('audit-'):name.index('.jsonl')])
+        except ValueError:
+            return None
+        if path.endswith('.replaying'):
+            # Left behind by a replay that died part way; some rows may repeat
+            return path if pid != os.getpid() and not _pid_alive(pid) else None
+        if pid == os.getpid():
+            with self._spool_lock:
+                return self._rename(path)
+        if _pid_alive(pid):
+            return None  # Its owner replays it
+        return self._rename(path)
+
+    @staticmethod
+    def _rename(path):
+        try:
+            os.replace(path, path + '.replaying')
+            return path + '.replaying'
+        except OSError:
+            return None  # Claimed by another process first
+
+    @staticmethod
+    def _decode(line):
+        fields = json.loads(line)
+        fields[5] = datetime.fromisoformat(fields[5])
+        if len(fields) == 6:
+            # Spooled before events were indexed: left for audit_index.py reindex
+            fields += [None, None, []]
+        return tuple(fields)
+
+    def _drain_nowait(self):
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            else:
+                rows.append(item)
+
+def _is_unavailable(err):
+    """True for errors that say nothing about the rows: spill them and replay later"""
+    if isinstance(err, (errors.InterfaceError, errors.OperationalError, errors.PoolError)):
+        return True
+    # Transient locking, or a schema not migrated yet (schema_migrations.py)
+    return err.errno in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT,
+                         errorcode.ER_BAD_FIELD_ERROR, errorcode.ER_NO_SUCH_TABLE)
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        return True  # No cheap check; leave other processes' spools alone
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Global writer, configured once by the application
+_writer = None
+_writer_lock = threading.Lock()
+
+def init_writer(connection_factory, encrypt=None, **writer_config):
+    """Create the global audit writer if it does not exist yet and return it"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditLogWriter(connection_factory, encrypt, **writer_config)
+            atexit.register(_writer.stop)
+    return _writer
+
+def get_writer():
+    """Get the global audit writer (None until the application configures one)"""
+    return _writer
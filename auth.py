@@ -3,28 +3,56 @@
 
 import hashlib
 import secrets
+import threading
 import time
+import logging
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import session, request, jsonify, redirect, url_for
+import audit_writer
+import audit_index
+from session_store import MemorySessionStore
+from data_cipher import Rot13Cipher, decrypt_with
+
+logger = logging.getLogger(__name__)
 
 class SecurityManager:
     """Advanced security management for the campus system"""
     
-    def __init__(self):
-        self.secret_key = secrets.token_hex(32)
-        self.failed_attempts = {}  # Track failed login attempts
-        self.active_sessions = {}  # Track active user sessions
+    def __init__(self, store=None, secret_key=None, token_cache_size=4096, cipher=None):
+        # Per-process defaults; the application shares both across workers via configure()
+        self.secret_key = secret_key or secrets.token_hex(32)
+        self.store = store or MemorySessionStore()  # Active sessions and failed login attempts
+        self.cipher = cipher or Rot13Cipher()  # Used by encrypt_data(); see data_cipher.py
+        # sha256(token) -> decoded payload, most recently used last
+        self.token_cache_size = token_cache_size
+        self._token_cache = OrderedDict()
+        self._token_cache_lock = threading.Lock()
+        self._token_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
         self.security_policies = {
             'max_failed_attempts': 3,
             'lockout_duration': 300,  # 5 minutes
             'session_timeout': 1800,  # 30 minutes
+            'activity_write_interval': 60,  # Record last activity at most this often
             'password_min_length': 8,
             'require_2fa': False,
             'encryption_enabled': True
         }
     
+    def configure(self, store=None, secret_key=None, cipher=None):
+        """Swap in a shared session store, token signing key and data cipher"""
+        if store is not None:
+            self.store = store
+        if cipher is not None:
+            self.cipher = cipher
+        if secret_key is not None:
+            self.secret_key = secret_key
+            # Payloads verified with the old key must be checked again
+            with self._token_cache_lock:
+                self._token_cache.clear()
+    
     def hash_password(self, password, salt=None):
         """Secure password hashing with salt"""
         if not salt:
@@ -65,27 +93,36 @@ class SecurityManager:
         }
         
         token = jwt.encode(payload, self.secret_key, algorithm='HS256')
-        self.active_sessions[user_id] = {
+        now = time.time()
+        self.store.put_session(user_id, {
             'token': token,
-            'created': datetime.utcnow(),
-            'last_activity': datetime.utcnow(),
+            'created': now,
+            'last_activity': now,
             'ip_address': request.remote_addr if request else 'unknown'
-        }
+        }, self.security_policies['session_timeout'])
         
         return token
     
     def verify_session_token(self, token):
-        """Verify and decode session token"""
+        """Verify and decode session token
+
+        Tokens whose signature was already verified are answered from a
+        bounded LRU cache (keyed by the token's SHA-256) until they expire.
+        The session store is still consulted on every call, so a session
+        ended by logout in any worker rejects the token at once.
+        """
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+            payload = self._cached_payload(token)
             user_id = payload['user_id']
             
             # Check if session is still active
-            if user_id in self.active_sessions:
-                session_info = self.active_sessions[user_id]
-                
-                # Update last activity
-                session_info['last_activity'] = datetime.utcnow()
+            session_info = self.store.get_session(user_id)
+            if session_info is not None:
+                # Update last activity (not on every request: the store may be shared)
+                now = time.time()
+                if now - session_info.get('last_activity', 0) >= self.security_policies['activity_write_interval']:
+                    self.store.touch_session(user_id, self.security_policies['session_timeout'],
+                                             last_activity=now)
                 
                 return payload
             
@@ -95,70 +132,65 @@ class SecurityManager:
         except jwt.InvalidTokenError:
             return None
     
+    def end_session(self, user_id):
+        """Revoke the user's session so their token stops working"""
+        self.store.delete_session(user_id)
+        with self._token_cache_lock:
+            for digest in [d for d, payload in self._token_cache.items() if payload['user_id'] == user_id]:
+                del self._token_cache[digest]
+    
+    def token_cache_stats(self):
+        """Hit/miss counters of the verified-token cache"""
+        with self._token_cache_lock:
+            stats = dict(self._token_cache_stats)
+            stats['size'] = len(self._token_cache)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['max_size'] = self.token_cache_size
+        return stats
+    
+    def _cached_payload(self, token):
+        """Decoded payload of a token, verifying the signature only on a cache miss"""
+        digest = hashlib.sha256(token.encode() if isinstance(token, str) else token).digest()
+        now = time.time()
+        with self._token_cache_lock:
+            payload = self._token_cache.get(digest)
+            if payload is not None:
+                if payload.get('exp', 0) > now:
+                    self._token_cache.move_to_end(digest)
+                    self._token_cache_stats['hits'] += 1
+                    return dict(payload)
+                del self._token_cache[digest]
+            self._token_cache_stats['misses'] += 1
+        
+        # Raises ExpiredSignatureError / InvalidTokenError for bad tokens
+        payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+        with self._token_cache_lock:
+            self._token_cache[digest] = payload
+            if len(self._token_cache) > self.token_cache_size:
+                self._token_cache.popitem(last=False)
+                self._token_cache_stats['evictions'] += 1
+        return dict(payload)
+    
     def track_failed_attempt(self, identifier):
         """Track failed login attempts"""
-        current_time = time.time()
-        
-        if identifier not in self.failed_attempts:
-            self.failed_attempts[identifier] = []
-        
-        # Remove old attempts (older than lockout duration)
-        self.failed_attempts[identifier] = [
-            attempt for attempt in self.failed_attempts[identifier]
-            if current_time - attempt < self.security_policies['lockout_duration']
-        ]
-        
-        # Add current attempt
-        self.failed_attempts[identifier].append(current_time)
+        # Attempts older than the lockout duration no longer count
+        self.store.add_attempt(identifier, self.security_policies['lockout_duration'])
     
     def is_account_locked(self, identifier):
         """Check if account is locked due to failed attempts"""
-        if identifier not in self.failed_attempts:
-            return False
-        
-        current_time = time.time()
-        recent_attempts = [
-            attempt for attempt in self.failed_attempts[identifier]
-            if current_time - attempt < self.security_policies['lockout_duration']
-        ]
-        
-        return len(recent_attempts) >= self.security_policies['max_failed_attempts']
+        recent_attempts = self.store.count_attempts(identifier, self.security_policies['lockout_duration'])
+        return recent_attempts >= self.security_policies['max_failed_attempts']
     
     def encrypt_data(self, data):
-        """Simple encryption simulation for educational purposes"""
+        """Encrypt data with the configured cipher (ROT13 demo unless configured)"""
         if not self.security_policies['encryption_enabled']:
             return data
-        
-        # Simple Caesar cipher for demonstration (NOT secure for real use)
-        key = 13  # ROT13
-        encrypted = ""
-        
-        for char in str(data):
-            if char.isalpha():
-                ascii_offset = ord('a') if char.islower() else ord('A')
-                encrypted += chr((ord(char) - ascii_offset + key) % 26 + ascii_offset)
-            else:
-                encrypted += char
-        
-        return f"ENCRYPTED:{encrypted}"
+        return self.cipher.encrypt(str(data))
     
     def decrypt_data(self, encrypted_data):
-        """Decrypt data (educational simulation)"""
-        if not encrypted_data.startswith("ENCRYPTED:"):
-            return encrypted_data
-        
-        data = encrypted_data[10:]  # Remove "ENCRYPTED:" prefix
-        key = -13  # Reverse ROT13
-        decrypted = ""
-        
-        for char in data:
-            if char.isalpha():
-                ascii_offset = ord('a') if char.islower() else ord('A')
-                decrypted += chr((ord(char) - ascii_offset + key) % 26 + ascii_offset)
-            else:
-                decrypted += char
-        
-        return decrypted
+        """Decrypt data written by the configured cipher or an earlier one"""
+        return decrypt_with(self.cipher, encrypted_data)
 
 # Global security manager instance
 security_manager = SecurityManager()
@@ -183,6 +215,22 @@ ROLES = {
     }
 }
 
+# Every permission named in ROLES gets one bit; a role's mask ORs its bits
+PERMISSION_BITS = {permission: 1 << index for index, permission in
+                   enumerate(sorted({p for role in ROLES.values() for p in role['permissions'] if p != 'all'}))}
+ROLE_PERMISSION_MASKS = {
+    role: -1 if 'all' in info['permissions'] else
+          sum(PERMISSION_BITS[permission] for permission in set(info['permissions']))
+    for role, info in ROLES.items()
+}
+
+def has_permission(role, permission):
+    """True if ``role`` grants ``permission`` (roles with 'all' grant everything)"""
+    mask = ROLE_PERMISSION_MASKS.get(role, 0)
+    if mask == -1:
+        return True
+    return bool(mask & PERMISSION_BITS.get(permission, 0))
+
 def require_auth(required_permission=None):
     """Decorator to require authentication and optional permission"""
     def decorator(f):
@@ -199,12 +247,8 @@ def require_auth(required_permission=None):
                 return redirect(url_for('login'))
             
             # Check permissions if required
-            if required_permission:
-                user_role = token_data.get('role')
-                role_permissions = ROLES.get(user_role, {}).get('permissions', [])
-                
-                if 'all' not in role_permissions and required_permission not in role_permissions:
-                    return jsonify({'error': 'Insufficient permissions'}), 403
+            if required_permission and not has_permission(token_data.get('role'), required_permission):
+                return jsonify({'error': 'Insufficient permissions'}), 403
             
             # Store user info in request context
             request.current_user = token_data
@@ -230,51 +274,70 @@ def require_api_auth(required_permission=None):
                 return jsonify({'error': 'Invalid or expired token'}), 401
             
             # Check permissions
-            if required_permission:
-                user_role = token_data.get('role')
-                role_permissions = ROLES.get(user_role, {}).get('permissions', [])
-                
-                if 'all' not in role_permissions and required_permission not in role_permissions:
-                    return jsonify({'error': 'Insufficient permissions'}), 403
+            if required_permission and not has_permission(token_data.get('role'), required_permission):
+                return jsonify({'error': 'Insufficient permissions'}), 403
             
             request.current_user = token_data
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
-def log_security_event(event_type, details, user_id=None):
-    """Log security events for audit trail"""
-    from app import get_db_connection  # Import here to avoid circular imports
+def log_security_event(event_type, details, user_id=None, conn=None):
+    """Log security events for audit trail
+
+    Without ``conn`` the event goes to the write-behind audit writer when the
+    application has started one, so the caller never waits on the database.
+    Pass ``conn`` to write the event inside the caller's transaction; the
+    caller then owns the commit and any database error is re-raised.
+    """
+    ip_address = request.remote_addr if request else 'system'
+    user_agent = request.headers.get('User-Agent') if request else 'system'
     
-    conn = get_db_connection()
-    if not conn:
-        return False
+    own_conn = conn is None
+    if own_conn:
+        writer = audit_writer.get_writer()
+        if writer is not None:
+            return writer.submit(event_type, details, user_id, ip_address, user_agent)
+        
+        from app import get_db_connection  # Import here to avoid circular imports
+        
+        conn = get_db_connection()
+        if not conn:
+            return False
     
+    cursor = None
     try:
         cursor = conn.cursor()
-        query = """
-            INSERT INTO security_audit_log (event_type, event_details, user_id, 
-                                           ip_address, user_agent, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        
-        cursor.execute(query, (
+        if own_conn and not conn.in_transaction:
+            conn.start_transaction()  # The event and its keywords go in together
+        # Classified and indexed before the details are encrypted
+        category, risk_level, keywords = audit_index.get_indexer().classify(event_type, details)
+        audit_index.insert_audit_events(cursor, [(
             event_type,
             security_manager.encrypt_data(details),  # Encrypt sensitive details
             user_id,
-            request.remote_addr if request else 'system',
-            request.headers.get('User-Agent') if request else 'system',
-            datetime.now()
-        ))
+            ip_address,
+            user_agent,
+            datetime.now(),
+            category,
+            risk_level,
+            keywords
+        )])
         
-        conn.commit()
+        if own_conn:
+            conn.commit()
         return True
     except Exception as e:
-        print(f"Error logging security event: {e}")
+        logger.error(f"Error logging security event: {e}")
+        if not own_conn:
+            raise
+        if conn.in_transaction:
+            conn.rollback()
         return False
     finally:
-        if conn.is_connected():
+        if cursor is not None:
             cursor.close()
+        if own_conn and conn.is_connected():
             conn.close()
 
 class SecurityPolicyEngine:
@@ -294,14 +357,22 @@ class SecurityPolicyEngine:
                 'high_security_locations': [5, 10],  # Cybersecurity Lab, ICT Office
                 'require_additional_auth': True
             },
+            'impossible_travel': {
+                'enabled': True,
+                'risk_points': 4  # Card seen elsewhere too recently (possible clone)
+            },
             'risk_assessment': {
                 'enabled': True,
                 'factors': ['time', 'location', 'user_behavior', 'access_pattern']
             }
         }
     
-    def assess_access_risk(self, student_id, location_id, access_time=None):
-        """Assess risk level of access attempt"""
+    def assess_access_risk(self, student_id, location_id, access_time=None, impossible_travel=None):
+        """Assess risk level of access attempt
+
+        ``impossible_travel`` is the trip reported by
+        ``ImpossibleTravelDetector.check()`` for this tap, if any.
+        """
         if not access_time:
             access_time = datetime.now()
         
@@ -321,6 +392,11 @@ class SecurityPolicyEngine:
                 risk_score += 3
                 risk_factors.append('high_security_location')
         
+        # Physical plausibility of the card's last two positions
+        if self.policies['impossible_travel']['enabled'] and impossible_travel:
+            risk_score += self.policies['impossible_travel']['risk_points']
+            risk_factors.append('impossible_travel')
+        
         # Determine risk level
         if risk_score <= 1:
             risk_level = 'low'
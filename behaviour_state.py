@@ -0,0 +1,243 @@
+# Behavioural State Store for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Incremental per-student access state for AI feature extraction
+
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+class _StudentWindow:
+    """Last access time plus the recent accesses"""
+
+    __slots__ = ('last_access', 'events')
+
+    def __init__(self):
+        self.last_access = None
+        self.events = deque()  # (timestamp, location_id), oldest first
+
+class AccessStateStore:
+    """Sliding-window access state per student, kept up to date in memory.
+
+    Replaces the per-scan ``ORDER BY access_time DESC LIMIT 1`` and
+    ``COUNT(DISTINCT location_id)`` queries: ``record()`` is called as each
+    access is logged, and the two AI features are read back from memory.
+
+    Both features are taken relative to the tap's own time, so a backdated
+    bulk tap or one that arrives out of order is scored against the window
+    that ended at it. Each student keeps the accesses from
+    ``window_seconds + late_tap_seconds`` before their newest one.
+
+    On first use the store warms itself from ``access_logs`` (last access
+    per student via the ``idx_student_time`` index, plus the rows inside the
+    window). Rows written by other worker processes are pulled in with a
+    ``log_id > last seen`` query every ``refresh_interval`` seconds.
+    Cursors passed in must be dictionary cursors.
+    """
+
+    def __init__(self, window_seconds=3600, refresh_interval=5, late_tap_seconds=3600):
+        self.window_seconds = window_seconds
+        self.refresh_interval = refresh_interval
+        self.late_tap_seconds = late_tap_seconds
+        self._students = {}
+        self._max_log_id = 0
+        self._warm = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_warm(self):
+        return self._warm
+
+    def ensure_fresh(self, cursor):
+        """Warm on first use, then pull other workers' rows when due"""
+        try:
+            if not self._warm:
+                self.warm(cursor)
+            elif time.monotonic() - self._last_refresh >= self.refresh_interval:
+                self.refresh(cursor)
+        except mysql.connector.Error as err:
+            logger.error(f"Access state refresh failed: {err}")
+        return self._warm
+
+    def warm(self, cursor):
+        """Rebuild the store from access_logs"""
+        cursor.execute("SELECT COALESCE(MAX(log_id), 0) AS max_log_id FROM access_logs")
+        max_log_id = cursor.fetchone()['max_log_id']
+
+        # Loose index scan over idx_student_time (student_id, access_time)
+        cursor.execute("""
+            SELECT student_id, MAX(access_time) AS last_access
+            FROM access_logs
+            WHERE student_id IS NOT NULL
+            GROUP BY student_id
+        """)
+        last_access_rows = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT student_id, location_id, access_time
+            FROM access_logs
+            WHERE access_time >= %s AND student_id IS NOT NULL
+            ORDER BY access_time
+        """, (datetime.now() - timedelta(seconds=self.window_seconds + self.late_tap_seconds),))
+        window_rows = cursor.fetchall()
+
+        with self._lock:
+            self._students = {}
+            for row in last_access_rows:
+                state = self._students.setdefault(row['student_id'], _StudentWindow())
+                state.last_access = row['last_access'].timestamp()
+            for row in window_rows:
+                self._record_locked(row['student_id'], row['location_id'], row['access_time'].timestamp())
+            self._max_log_id = max(self._max_log_id, max_log_id)
+            self._warm = True
+            self._last_refresh = time.monotonic()
+
+        logger.info(f"Access state warmed for {len(last_access_rows)} students "
+                    f"({len(window_rows)} accesses in window)")
+
+    def refresh(self, cursor, batch_size=5000):
+        """Fold in access_logs rows written since the last warm/refresh"""
+        while True:
+            cursor.execute("""
+                SELECT log_id, student_id, location_id, access_time
+                FROM access_logs
+                WHERE log_id > %s
+                ORDER BY log_id
+                LIMIT %s
+            """, (self._max_log_id, batch_size))
+            rows = cursor.fetchall()
+
+            with self._lock:
+                for row in rows:
+                    # Rows this process already recorded are harmless repeats:
+                    # the distinct-location count and last access are unchanged
+                    if row['student_id'] and row['access_time']:
+                        self._record_locked(row['student_id'], row['location_id'],
+                                            row['access_time'].timestamp())
+                    self._max_log_id = max(self._max_log_id, row['log_id'])
+                self._last_refresh = time.monotonic()
+
+            if len(rows) < batch_size:
+                break
+
+    def record(self, student_id, location_id, access_time=None):
+        """Record an access as it is logged"""
+        if not student_id:
+            return
+        access_time = access_time or datetime.now()
+        with self._lock:
+            self._record_locked(student_id, location_id, access_time.timestamp())
+
+    def minutes_since_last_access(self, student_id, now=None):
+        """Minutes since the student's last access before ``now`` (120 if never seen)"""
+        now_ts = (now or datetime.now()).timestamp()
+        previous = self._previous_access(student_id, now_ts)
+        if previous is None:
+            return 120  # No previous access, return 2 hours
+        return int((now_ts - previous) / 60)
+
+    def locations_in_window(self, student_id, now=None):
+        """Distinct locations the student accessed in the window ending at ``now``"""
+        return len(self._locations_in_window(student_id, (now or datetime.now()).timestamp()))
+
+    def pending(self):
+        """A ``PendingAccessState`` for a batch of taps not committed yet"""
+        return PendingAccessState(self)
+
+    def stats(self):
+        """Return store size counters"""
+        with self._lock:
+            return {
+                'warm': self._warm,
+                'students': len(self._students),
+                'events_retained': sum(len(s.events) for s in self._students.values()),
+                'max_log_id': self._max_log_id
+            }
+
+    def _previous_access(self, student_id, now_ts):
+        """Timestamp of the student's last access at or before ``now_ts``, or None"""
+        with self._lock:
+            state = self._students.get(student_id)
+            if state is None or state.last_access is None:
+                return None
+            if state.last_access <= now_ts:
+                return state.last_access
+            # A late tap: measure from the access before it, not the newest one
+            return next((ts for ts, _ in reversed(state.events) if ts <= now_ts), None)
+
+    def _locations_in_window(self, student_id, end):
+        with self._lock:
+            state = self._students.get(student_id)
+            if state is None:
+                return set()
+            start = end - self.window_seconds
+            locations = set()
+            for ts, location_id in reversed(state.events):
+                if ts <= start:
+                    break
+                if ts <= end:
+                    locations.add(location_id)
+            return locations
+
+    def _record_locked(self, student_id, location_id, ts):
+        state = self._students.get(student_id)
+        if state is None:
+            state = self._students[student_id] = _StudentWindow()
+        if state.last_access is None or ts > state.last_access:
+            state.last_access = ts
+
+        # Pruned against the student's newest tap, not the wall clock, so
+        # backdated taps keep the history their own window needs
+        cutoff = state.last_access - self.window_seconds - self.late_tap_seconds
+        events = state.events
+        while events and events[0][0] <= cutoff:
+            events.popleft()
+        if ts <= cutoff:
+            return
+
+        # Rows normally arrive in time order; walk back for the odd late one
+        index = len(events)
+        while index and events[index - 1][0] > ts:
+            index -= 1
+        events.insert(index, (ts, location_id))
+
+class PendingAccessState:
+    """A bulk batch's own taps layered over an ``AccessStateStore``.
+
+    Taps in a batch are evaluated in time order and each should see the
+    ones before it, but the shared store only learns of them once the batch
+    has committed. ``record()`` keeps them here, and the features are read
+    from both.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._batch = AccessStateStore(store.window_seconds, late_tap_seconds=store.late_tap_seconds)
+
+    def ensure_fresh(self, cursor):
+        return self.store.ensure_fresh(cursor)
+
+    def record(self, student_id, location_id, access_time=None):
+        """Record a tap of this batch"""
+        self._batch.record(student_id, location_id, access_time)
+
+    def minutes_since_last_access(self, student_id, now=None):
+        now_ts = (now or datetime.now()).timestamp()
+        previous = [ts for ts in (self.store._previous_access(student_id, now_ts),
+                                  self._batch._previous_access(student_id, now_ts)) if ts is not None]
+        if not previous:
+            return 120
+        return int((now_ts - max(previous)) / 60)
+
+    def locations_in_window(self, student_id, now=None):
+        end = (now or datetime.now()).timestamp()
+        return len(self.store._locations_in_window(student_id, end) |
+                   self._batch._locations_in_window(student_id, end))
+
+# Global access state store
+access_state = AccessStateStore()
@@ -0,0 +1,303 @@
+# Card Directory Cache for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# In-process read-through cache for card, student and location lookups
+
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+def card_key(card_id):
+    """The form a card id is cached and compared in.
+
+    Matches how MySQL's default collation compares ``card_id``: case and
+    trailing spaces are ignored, and a bulk tap may send the id as an int.
+    """
+    return str(card_id).rstrip(' ').lower()
+
+class CardDirectory:
+    """Read-through cache of the reference data a card scan needs.
+
+    Students (by card) and locations change rarely, so they are held in
+    memory for ``ttl`` seconds. Admin routes that change them call the
+    ``invalidate_*`` hooks so this process sees the change immediately.
+    Student changes made by other worker processes (a card blocked,
+    suspended or renewed) are picked up by polling ``students.last_updated``
+    every ``refresh_interval`` seconds; looking back ``change_slack``
+    seconds past the newest change seen covers transactions that commit
+    late. If that poll fails (no ``last_updated`` column) students are not
+    cached at all rather than served stale. Misses are cached too, so
+    repeated taps of an unknown card stay cheap. Lost/stolen checks are
+    answered by the exact ``RevocationSet``.
+    """
+
+    def __init__(self, revocations, ttl=300, max_entries=50000, refresh_interval=5, change_slack=30):
+        self.revocations = revocations
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.change_slack = change_slack
+        self._students = {}   # card_key(card_id) -> (student row or None, expires_at)
+        self._locations = {}  # location_id -> (location row or None, expires_at)
+        self._changes_since = None  # Newest students.last_updated seen (database clock)
+        self._change_feed = True
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'change_polls': 0}
+
+    def get_student_by_card(self, cursor, card_id):
+        """Student row for a card, or None if the card is unknown"""
+        self._poll_student_changes(cursor)
+        if not self._change_feed:
+            return self._copy(self._load_student(cursor, card_id))
+        return self._read_through(self._students, card_key(card_id), lambda: self._load_student(cursor, card_id))
+
+    def get_location(self, cursor, location_id):
+        """Location row, or None if the location does not exist"""
+        return self._read_through(self._locations, str(location_id),
+                                  lambda: self._load_location(cursor, location_id))
+
+    def prefetch(self, cursor, card_ids=(), location_ids=(), chunk_size=1000):
+        """Load every uncached card and location with one IN query per chunk"""
+        self._poll_student_changes(cursor)
+        if self._change_feed:
+            self._prefetch(self._students, {card_key(card_id): card_id for card_id in card_ids},
+                           "SELECT * FROM students WHERE card_id IN ({})", 'card_id', card_key,
+                           cursor, chunk_size)
+        self._prefetch(self._locations, {str(location_id): location_id for location_id in location_ids},
+                       "SELECT * FROM campus_locations WHERE location_id IN ({})", 'location_id', str,
+                       cursor, chunk_size)
+
+    def is_card_reported(self, cursor, card_id):
+        """True if the card has an active lost/stolen report"""
+        return self.revocations.contains(cursor, card_id)
+
+    def invalidate_card(self, card_id):
+        """Forget everything cached about a card"""
+        with self._lock:
+            self._students.pop(card_key(card_id), None)
+            self._stats['invalidations'] += 1
+
+    def invalidate_location(self, location_id=None):
+        """Forget one cached location, or all of them"""
+        with self._lock:
+            if location_id is None:
+                self._locations.clear()
+            else:
+                self._locations.pop(str(location_id), None)
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Drop the whole cache"""
+        with self._lock:
+            self._students.clear()
+            self._locations.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """Return hit/miss counters and current sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'change_feed': self._change_feed,
+                'students': len(self._students),
+                'locations': len(self._locations),
+                'revoked_cards': len(self.revocations)
+            })
+        return stats
+
+    def _poll_student_changes(self, cursor):
+        """Drop cached students another process changed since the last poll"""
+        now = time.monotonic()
+        if not self._change_feed or now - self._last_poll < self.refresh_interval:
+            return
+        self._last_poll = now
+        try:
+            if self._changes_since is None:
+                cursor.execute("SELECT MAX(last_updated) AS changed FROM students")
+                row = cursor.fetchone()
+                changed = row['changed'] if isinstance(row, dict) else row[0]
+                with self._lock:
+                    # Anything changed before this first poll is loaded fresh anyway
+                    self._students.clear()
+                    self._changes_since = changed or datetime(1970, 1, 1)
+                return
+            cursor.execute("SELECT card_id, last_updated FROM students WHERE last_updated >= %s",
+                           (self._changes_since - timedelta(seconds=self.change_slack),))
+            rows = cursor.fetchall()
+        except mysql.connector.Error as err:
+            logger.error(f"Student change poll failed, caching students disabled: {err}")
+            with self._lock:
+                self._change_feed = False
+                self._students.clear()
+            return
+
+        with self._lock:
+            self._stats['change_polls'] += 1
+            for row in rows:
+                card_id, changed = (row['card_id'], row['last_updated']) if isinstance(row, dict) else row[:2]
+                if self._students.pop(card_key(card_id), None) is not None:
+                    self._stats['invalidations'] += 1
+                if changed and changed > self._changes_since:
+                    self._changes_since = changed
+
+    def _read_through(self, table, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            cached = table.get(key)
+            if cached is not None and cached[1] > now:
+                self._stats['hits'] += 1
+                return self._copy(cached[0])
+            self._stats['misses'] += 1
+
+        value = loader()
+
+        with self._lock:
+            if len(table) >= self.max_entries:
+                self._evict(table, now)
+            table[key] = (value, now + self.ttl)
+        return self._copy(value)
+
+    def _prefetch(self, table, keys, query, key_column, key_of, cursor, chunk_size):
+        """Cache rows (and misses) for ``keys`` (cache key -> query value) not already cached"""
+        now = time.monotonic()
+        with self._lock:
+            missing = [(key, value) for key, value in keys.items()
+                       if key not in table or table[key][1] <= now]
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            cursor.execute(query.format(', '.join(['%s'] * len(chunk))), [value for _, value in chunk])
+            found = {key_of(row[key_column]): row for row in cursor.fetchall()}
+            with self._lock:
+                self._stats['misses'] += len(chunk)
+                if len(table) + len(chunk) > self.max_entries:
+                    self._evict(table, now)
+                for key, _ in chunk:
+                    table[key] = (found.get(key), now + self.ttl)
+
+    def _evict(self, table, now):
+        """Drop expired entries, then the oldest ones if still full"""
+        for key in [k for k, (_, expires_at) in table.items() if expires_at <= now]:
+            del table[key]
+        while len(table) >= self.max_entries:
+            del table[next(iter(table))]
+
+    @staticmethod
+    def _copy(value):
+        # Callers mutate the rows they get back; never hand out the cached dict
+        return dict(value) if isinstance(value, dict) else value
+
+    @staticmethod
+    def _load_student(cursor, card_id):
+        cursor.execute("SELECT * FROM students WHERE card_id = %s", (card_id,))
+        return cursor.fetchone()
+
+    @staticmethod
+    def _load_location(cursor, location_id):
+        cursor.execute("SELECT * FROM campus_locations WHERE location_id = %s", (location_id,))
+        return cursor.fetchone()
+
+class RevocationSet:
+    """In-memory set of cards with an active lost/stolen report.
+
+    Loaded from ``lost_stolen_cards`` on first use, so a revoked-card check
+    is a set probe rather than a query. Cards are held as ``card_key()``,
+    so the probe agrees with the database's comparison. Reports filed
+    through this process are added immediately with ``add()``. Reports
+    filed by other workers are picked up by a cheap ``report_id`` range
+    query every ``refresh_interval`` seconds; looking back ``report_slack``
+    ids past the newest report seen covers a report whose transaction
+    commits after one with a higher id. A full reload every
+    ``full_reload_interval`` seconds drops resolved reports. If the table
+    cannot be loaded the check falls back to querying the database, so a
+    revoked card is never accepted because the set is missing.
+    """
+
+    def __init__(self, refresh_interval=5, full_reload_interval=300, report_slack=1000):
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.report_slack = report_slack
+        self._cards = set()
+        self._max_report_id = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._last_full_load = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __contains__(self, card_id):
+        return card_key(card_id) in self._cards
+
+    def contains(self, cursor, card_id):
+        """True if the card is revoked, refreshing the set when it is due"""
+        now = time.monotonic()
+        try:
+            if not self._loaded or now - self._last_full_load >= self.full_reload_interval:
+                self.load(cursor)
+            elif now - self._last_refresh >= self.refresh_interval:
+                self._refresh(cursor)
+        except mysql.connector.Error as err:
+            logger.error(f"Revocation set refresh failed: {err}")
+
+        if not self._loaded:
+            return self._query_card(cursor, card_id)
+        return card_key(card_id) in self._cards
+
+    def add(self, card_id):
+        """Record a new lost/stolen report filed by this process"""
+        with self._lock:
+            self._cards.add(card_key(card_id))
+
+    def load(self, cursor):
+        """(Re)build the set from every active report"""
+        cursor.execute("SELECT report_id, card_id FROM lost_stolen_cards WHERE status = 'active'")
+        cards = set()
+        max_report_id = 0
+        for row in cursor.fetchall():
+            report_id, card_id = self._unpack(row)
+            cards.add(card_key(card_id))
+            max_report_id = max(max_report_id, report_id)
+
+        now = time.monotonic()
+        with self._lock:
+            self._cards = cards
+            self._max_report_id = max_report_id
+            self._loaded = True
+            self._last_full_load = now
+            self._last_refresh = now
+        logger.info(f"Revocation set loaded with {len(cards)} lost/stolen cards")
+
+    def _refresh(self, cursor):
+        """Pick up reports filed since the last load or refresh, and any that committed late"""
+        cursor.execute("""
+            SELECT report_id, card_id FROM lost_stolen_cards
+            WHERE report_id > %s AND status = 'active'
+        """, (max(self._max_report_id - self.report_slack, 0),))
+        rows = cursor.fetchall()
+        with self._lock:
+            for row in rows:
+                report_id, card_id = self._unpack(row)
+                self._cards.add(card_key(card_id))
+                self._max_report_id = max(self._max_report_id, report_id)
+            self._last_refresh = time.monotonic()
+
+    @staticmethod
+    def _query_card(cursor, card_id):
+        cursor.execute("SELECT COUNT(*) as count FROM lost_stolen_cards WHERE card_id = %s AND status = 'active'", (card_id,))
+        row = cursor.fetchone()
+        return (row['count'] if isinstance(row, dict) else row[0]) > 0
+
+    @staticmethod
+    def _unpack(row):
+        if isinstance(row, dict):
+            return row['report_id'], row['card_id']
+        return row[0], row[1]
+
+# Global instances
+revoked_cards = RevocationSet()
+card_directory = CardDirectory(revoked_cards)
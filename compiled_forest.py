@@ -0,0 +1,275 @@
+# Compiled Model Runtime for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# NumPy-only inference for the trained anomaly detector and incident predictor
+
+import os
+import json
+from pathlib import Path
+import numpy as np
+
+# Bump when the layout of models/ai_runtime.npz changes
+RUNTIME_FORMAT_VERSION = 1
+
+def average_path_length(n_samples):
+    """Expected isolation depth of an n-sample tree (sklearn's c(n))"""
+    n = np.asarray(n_samples, dtype=float)
+    result = np.zeros(n.shape)
+    result[n == 2] = 1.0
+    large = n > 2
+    result[large] = (2.0 * (np.log(n[large] - 1.0) + np.euler_gamma)
+                     - 2.0 * (n[large] - 1.0) / n[large])
+    return result
+
+class AffineScaler:
+    """Fitted StandardScaler reduced to its mean and scale"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=float)
+        self.scale_ = np.asarray(scale, dtype=float)
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        return cls(scaler.mean_, scaler.scale_)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+class CompiledForest:
+    """IsolationForest flattened into NumPy arrays.
+
+    Every tree's nodes live in one set of arrays and ``roots`` holds each
+    tree's first node. Leaves point back at themselves, so all samples take
+    ``max_depth`` steps down every tree at once with no per-node Python.
+    ``path_lengths`` holds the depth of each leaf plus the expected extra
+    depth for the training samples that ended there, which is what sklearn
+    adds up per tree. The StandardScaler fitted in front of the forest is
+    folded into ``weight``/``bias``, so inputs are raw feature vectors.
+    """
+
+    def __init__(self, feature, threshold, left, right, path_lengths, roots,
+                 max_depth, max_samples, offset, weight, bias):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=float)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.path_lengths = np.asarray(path_lengths, dtype=float)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.max_samples = int(max_samples)
+        self.offset = float(offset)
+        self.weight = np.asarray(weight, dtype=float)
+        self.bias = np.asarray(bias, dtype=float)
+        # children[2 * node + went_left] is the next node
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+        self.denominator = len(self.roots) * float(average_path_length([self.max_samples])[0])
+
+    @classmethod
+    def from_sklearn(cls, forest, scaler=None):
+        """Compile a fitted IsolationForest (and the scaler feeding it)"""
+        n_features = forest.n_features_in_
+        subsampled = forest.max_features_ != n_features if hasattr(forest, 'max_features_') else False
+
+        features, thresholds, lefts, rights, path_lengths, roots = [], [], [], [], [], []
+        node_offset = 0
+        max_depth = 0
+        for estimator, estimator_features in zip(forest.estimators_, forest.estimators_features_):
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left < 0
+
+            # Nodes are stored depth-first, so a parent always precedes its children
+            depth = np.zeros(n_nodes, dtype=np.intp)
+            for node in range(n_nodes):
+                if not is_leaf[node]:
+                    depth[tree.children_left[node]] = depth[node] + 1
+                    depth[tree.children_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+            node_ids = np.arange(n_nodes)
+            feature = np.where(is_leaf, 0, tree.feature)
+            if subsampled:
+                feature = np.asarray(estimator_features)[feature]
+
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + node_offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + node_offset)
+            path_lengths.append(depth + average_path_length(tree.n_node_samples))
+            roots.append(node_offset)
+            node_offset += n_nodes
+
+        if scaler is not None:
+            weight = 1.0 / np.asarray(scaler.scale_, dtype=float)
+            bias = -np.asarray(scaler.mean_, dtype=float) * weight
+        else:
+            weight, bias = np.ones(n_features), np.zeros(n_features)
+
+        return cls(np.concatenate(features), np.concatenate(thresholds),
+                   np.concatenate(lefts), np.concatenate(rights),
+                   np.concatenate(path_lengths), roots, max_depth,
+                   forest._max_samples, forest.offset_, weight, bias)
+
+    @classmethod
+    def grow(cls, X, n_trees, max_samples, weight, bias, offset=-0.5, rng=None):
+        """Grow ``n_trees`` isolation trees on raw features ``X`` without sklearn.
+
+        Same construction as sklearn's: each tree isolates a random
+        subsample of ``max_samples`` rows with uniform random splits, down
+        to a depth of log2(max_samples). ``weight``/``bias`` fold the
+        scaler in, as in ``from_sklearn``.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        weight = np.asarray(weight, dtype=float)
+        bias = np.asarray(bias, dtype=float)
+        X_scaled = (np.asarray(X, dtype=float) * weight + bias).astype(np.float32)
+        depth_limit = int(np.ceil(np.log2(max(max_samples, 2))))
+
+        features, thresholds, lefts, rights, path_lengths, roots = [], [], [], [], [], []
+        max_depth = 0
+        for _ in range(n_trees):
+            sample = X_scaled[rng.choice(len(X_scaled), min(max_samples, len(X_scaled)), replace=False)]
+            roots.append(len(features))
+            # Nodes are appended depth-first: (rows, depth, node id)
+            stack = [(sample, 0, len(features))]
+            features.append(0); thresholds.append(0.0); lefts.append(0); rights.append(0); path_lengths.append(0.0)
+            while stack:
+                rows, depth, node = stack.pop()
+                low, high = rows.min(axis=0), rows.max(axis=0)
+                splittable = np.flatnonzero(high > low)
+                if len(rows) <= 1 or depth >= depth_limit or not len(splittable):
+                    lefts[node] = rights[node] = node
+                    path_lengths[node] = depth + float(average_path_length([len(rows)])[0])
+                    max_depth = max(max_depth, depth)
+                    continue
+                feature = int(rng.choice(splittable))
+                threshold = float(rng.uniform(low[feature], high[feature]))
+                go_left = rows[:, feature] <= threshold
+                features[node], thresholds[node] = feature, threshold
+                for child_rows, side in ((rows[~go_left], rights), (rows[go_left], lefts)):
+                    side[node] = len(features)
+                    features.append(0); thresholds.append(0.0); lefts.append(0); rights.append(0); path_lengths.append(0.0)
+                    stack.append((child_rows, depth + 1, side[node]))
+
+        return cls(features, thresholds, lefts, rights, path_lengths, roots,
+                   max_depth, max_samples, offset, weight, bias)
+
+    def replace_oldest_trees(self, new_trees):
+        """New forest with the first (oldest) trees swapped for ``new_trees``.
+
+        The forest keeps its size; replaced trees are dropped from the front
+        and the new ones appended, so repeated calls rotate through every
+        tree. Both forests must fold in the same scaler.
+        """
+        if not (np.allclose(self.weight, new_trees.weight) and np.allclose(self.bias, new_trees.bias)):
+            raise ValueError("new trees were grown with a different scaler")
+        count = min(len(new_trees.roots), len(self.roots))
+        start = self.roots[count] if count < len(self.roots) else len(self.feature)
+        kept_nodes = len(self.feature) - start
+        return CompiledForest(
+            np.concatenate([self.feature[start:], new_trees.feature]),
+            np.concatenate([self.threshold[start:], new_trees.threshold]),
+            np.concatenate([self.left[start:] - start, new_trees.left + kept_nodes]),
+            np.concatenate([self.right[start:] - start, new_trees.right + kept_nodes]),
+            np.concatenate([self.path_lengths[start:], new_trees.path_lengths]),
+            np.concatenate([self.roots[count:] - start, new_trees.roots + kept_nodes]),
+            max(self.max_depth, new_trees.max_depth), self.max_samples, self.offset,
+            self.weight, self.bias)
+
+    def score_samples(self, X, chunk_size=1024):
+        """Same as IsolationForest.score_samples on the scaled features"""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        scores = np.empty(len(X))
+        for start in range(0, len(X), chunk_size):
+            scores[start:start + chunk_size] = self._score_chunk(X[start:start + chunk_size])
+        return scores
+
+    def decision_function(self, X):
+        """Negative for anomalies, like IsolationForest.decision_function"""
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        """-1 for anomalies and 1 for normal accesses"""
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def _score_chunk(self, X):
+        # sklearn's trees compare float32 copies of the inputs against the thresholds
+        X_scaled = (X * self.weight + self.bias).astype(np.float32).ravel()
+        row_starts = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.tile(self.roots, (len(X), 1))
+        for _ in range(self.max_depth):
+            go_left = X_scaled[row_starts + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_left]
+        depths = self.path_lengths[nodes].sum(axis=1)
+        if self.denominator == 0:
+            return -np.ones(len(X))
+        return -(2.0 ** (-depths / self.denominator))
+
+    def arrays(self):
+        """Arrays needed to rebuild the forest, keyed for np.savez"""
+        return {
+            'forest_feature': self.feature.astype(np.int32),
+            'forest_threshold': self.threshold,
+            'forest_left': self.left.astype(np.int32),
+            'forest_right': self.right.astype(np.int32),
+            'forest_path_lengths': self.path_lengths,
+            'forest_roots': self.roots.astype(np.int32),
+            'forest_weight': self.weight,
+            'forest_bias': self.bias
+        }
+
+def save_runtime(path, forest, incident_predictor, incident_scaler, backup_optimizer, metadata=None):
+    """Write the compiled models to an .npz file (atomically)"""
+    meta = dict(metadata or {})
+    meta.update({
+        'format_version': RUNTIME_FORMAT_VERSION,
+        'forest_max_depth': forest.max_depth,
+        'forest_max_samples': forest.max_samples,
+        'forest_offset': forest.offset,
+        'incident_bias': float(incident_predictor['bias']),
+        'incident_threshold': float(incident_predictor['threshold']),
+        'backup_optimizer': backup_optimizer
+    })
+
+    arrays = forest.arrays()
+    arrays.update({
+        'incident_weights': np.asarray(incident_predictor['weights'], dtype=float),
+        'incident_mean': incident_scaler.mean_,
+        'incident_scale': incident_scaler.scale_,
+        'metadata': np.array(json.dumps(meta, default=str))
+    })
+
+    path = Path(path)
+    tmp_path = path.with_suffix('.npz.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_runtime(path):
+    """Read a compiled runtime file back into models, scalers and metadata"""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['metadata']))
+        if meta.get('format_version') != RUNTIME_FORMAT_VERSION:
+            raise ValueError(f"runtime format version {meta.get('format_version')} is not supported")
+
+        forest = CompiledForest(
+            data['forest_feature'], data['forest_threshold'],
+            data['forest_left'], data['forest_right'],
+            data['forest_path_lengths'], data['forest_roots'],
+            meta['forest_max_depth'], meta['forest_max_samples'],
+            meta['forest_offset'], data['forest_weight'], data['forest_bias'])
+        models = {
+            'anomaly_detector': forest,
+            'incident_predictor': {
+                'weights': data['incident_weights'].copy(),
+                'bias': meta['incident_bias'],
+                'threshold': meta['incident_threshold']
+            },
+            'backup_optimizer': meta['backup_optimizer'],
+            'behavior_analyzer': None
+        }
+        scalers = {
+            # Folded into the compiled forest
+            'access_patterns': None,
+            'incident_features': AffineScaler(data['incident_mean'], data['incident_scale'])
+        }
+    return models, scalers, meta
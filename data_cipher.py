@@ -0,0 +1,169 @@
+# Data Ciphers for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Pluggable ciphers behind SecurityManager.encrypt_data()/decrypt_data()
+
+import os
+import sys
+import json
+import time
+import base64
+import string
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # Only the 'aesgcm' cipher needs it
+    AESGCM = None
+
+class Rot13Cipher:
+    """ROT13 over ASCII letters (educational demo only - not secret).
+
+    Works on the UTF-8 bytes with one 256-entry ``bytes.translate`` table,
+    so the whole payload is rotated in C. Bytes of multi-byte characters
+    are all >= 0x80 and pass through untouched.
+    """
+
+    name = 'rot13'
+    prefix = 'ENCRYPTED:'
+
+    _TABLE = bytes.maketrans(
+        (string.ascii_lowercase + string.ascii_uppercase).encode(),
+        (string.ascii_lowercase[13:] + string.ascii_lowercase[:13] +
+         string.ascii_uppercase[13:] + string.ascii_uppercase[:13]).encode()
+    )
+
+    def encrypt(self, text):
+        return self.prefix + self._rotate(text)
+
+    def decrypt(self, text):
+        return self._rotate(text[len(self.prefix):])
+
+    def _rotate(self, text):
+        # ROT13 is its own inverse
+        return text.encode('utf-8', 'surrogatepass').translate(self._TABLE).decode('utf-8', 'surrogatepass')
+
+class AESGCMCipher:
+    """AES-GCM authenticated encryption from the ``cryptography`` package.
+
+    Output is ``AESGCM:`` + base64(12-byte random nonce + ciphertext + tag),
+    so it still fits a TEXT column and a tampered row fails to decrypt
+    instead of returning garbage. ``key`` is 16, 24 or 32 bytes.
+    """
+
+    name = 'aesgcm'
+    prefix = 'AESGCM:'
+
+    def __init__(self, key, associated_data=b'smartscan'):
+        if AESGCM is None:
+            raise RuntimeError("The 'aesgcm' cipher needs the cryptography package: pip install cryptography")
+        self._aead = AESGCM(key)
+        self.associated_data = associated_data
+
+    def encrypt(self, text):
+        nonce = os.urandom(12)
+        sealed = self._aead.encrypt(nonce, text.encode('utf-8', 'surrogatepass'), self.associated_data)
+        return self.prefix + base64.b64encode(nonce + sealed).decode('ascii')
+
+    def decrypt(self, text):
+        raw = base64.b64decode(text[len(self.prefix):])
+        try:
+            plain = self._aead.decrypt(raw[:12], raw[12:], self.associated_data)
+        except InvalidTag:
+            raise ValueError("Encrypted data failed authentication (wrong key or tampered)")
+        return plain.decode('utf-8', 'surrogatepass')
+
+# Rows written before a cipher change keep their own prefix and stay readable
+LEGACY_CIPHERS = (Rot13Cipher(),)
+
+def create_cipher(name='rot13', key=None):
+    """Build the cipher named by ``name`` ('rot13' or 'aesgcm', which needs ``key``)"""
+    if name == 'rot13':
+        return Rot13Cipher()
+    if name == 'aesgcm':
+        if key is None:
+            raise ValueError("The 'aesgcm' cipher needs a key")
+        return AESGCMCipher(key)
+    raise ValueError(f"Unknown cipher: {name}")
+
+def decrypt_with(cipher, text):
+    """Decrypt ``text`` with whichever known cipher wrote it; plain text comes back as is"""
+    for candidate in (cipher,) + LEGACY_CIPHERS:
+        if text.startswith(candidate.prefix):
+            return candidate.decrypt(text)
+    return text
+
+def _sample_payload(size):
+    # Shaped like the JSON details enhanced_log_access_attempt() audits
+    event = {
+        'student_id': 'SLU/2023/0412', 'card_id': 'CARD-000412', 'location_id': 7,
+        'access_type': 'entry', 'granted': True, 'risk_score': 0.27,
+        'ai_analysis': {'is_anomaly': False, 'anomaly_score': 0.0913,
+                        'explanation': 'Normal access pattern for this student at Main Library'}
+    }
+    chunk = json.dumps(event)
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+def _char_loop_rot13(data):
+    # The per-character loop encrypt_data() used before, for comparison
+    encrypted = ""
+    for char in str(data):
+        if char.isalpha():
+            ascii_offset = ord('a') if char.islower() else ord('A')
+            encrypted += chr((ord(char) - ascii_offset + 13) % 26 + ascii_offset)
+        else:
+            encrypted += char
+    return f"ENCRYPTED:{encrypted}"
+
+def benchmark(sizes=(1024, 65536), min_seconds=0.5):
+    """Microseconds per row to encrypt and decrypt payloads of each size"""
+    rot13 = Rot13Cipher()
+    ciphers = [('char-loop', _char_loop_rot13, None), ('rot13', rot13.encrypt, rot13.decrypt)]
+    if AESGCM is not None:
+        aead = AESGCMCipher(os.urandom(32))
+        ciphers.append(('aesgcm', aead.encrypt, aead.decrypt))
+
+    results = []
+    for size in sizes:
+        payload = _sample_payload(size)
+        for name, encrypt, decrypt in ciphers:
+            row = {'cipher': name, 'bytes': size,
+                   'encrypt_us': _time_per_call(encrypt, payload, min_seconds)}
+            if decrypt is not None:
+                sealed = encrypt(payload)
+                assert decrypt(sealed) == payload
+                row['decrypt_us'] = _time_per_call(decrypt, sealed, min_seconds)
+                row['stored_bytes'] = len(sealed)
+            results.append(row)
+    return results
+
+def _time_per_call(func, arg, min_seconds):
+    calls, elapsed = 0, 0.0
+    started = time.perf_counter()
+    while elapsed < min_seconds:
+        func(arg)
+        calls += 1
+        elapsed = time.perf_counter() - started
+    return elapsed / calls * 1e6
+
+def main(argv=None):
+    """Command line entry point: ``python data_cipher.py [--sizes 1024 65536]``"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the audit detail ciphers")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 65536],
+                        help="payload sizes in bytes")
+    parser.add_argument('--seconds', type=float, default=0.5,
+                        help="minimum time spent timing each cipher and size")
+    args = parser.parse_args(argv)
+
+    if AESGCM is None:
+        print("⚠️ cryptography is not installed - skipping aesgcm")
+    print(f"{'cipher':<10} {'bytes':>7} {'encrypt us/row':>15} {'decrypt us/row':>15} {'stored bytes':>13}")
+    for row in benchmark(args.sizes, args.seconds):
+        decrypt_us = f"{row['decrypt_us']:.1f}" if 'decrypt_us' in row else '-'
+        print(f"{row['cipher']:<10} {row['bytes']:>7} {row['encrypt_us']:>15.1f} {decrypt_us:>15} "
+              f"{row.get('stored_bytes', '-'):>13}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
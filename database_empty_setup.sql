@@ -67,7 +67,9 @@ CREATE TABLE students (
     photo_url VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     card_issued_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    card_expiry_date DATE
+    card_expiry_date DATE,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_last_updated (last_updated)
 );
 
 -- Enhanced access logs table with risk assessment
@@ -242,13 +244,27 @@ CREATE TABLE security_audit_log (
     event_details TEXT,
     user_id INT,
     ip_address VARCHAR(45),
+    user_agent TEXT,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     severity ENUM('low', 'medium', 'high', 'critical') DEFAULT 'medium',
+    risk_level ENUM('low', 'medium', 'high', 'critical') DEFAULT 'low',
+    category VARCHAR(32),  -- First filter preset the event matches; NULL until indexed
     source_system VARCHAR(50) DEFAULT 'campus_security',
     FOREIGN KEY (user_id) REFERENCES system_users(user_id),
     INDEX idx_timestamp (timestamp),
     INDEX idx_event_type (event_type),
-    INDEX idx_severity (severity)
+    INDEX idx_severity (severity),
+    INDEX idx_risk_level (risk_level),
+    INDEX idx_category (category)  -- InnoDB appends log_id: reindex's NULL scan in log_id order
+);
+
+-- Keyword index of security_audit_log (event_details are encrypted), written with each event
+CREATE TABLE security_audit_keywords (
+    keyword VARCHAR(64) NOT NULL,  -- HMAC of 'preset:<name>', 'type:<event_type>' or a word of the details
+    log_id INT NOT NULL,
+    PRIMARY KEY (keyword, log_id),
+    INDEX idx_log_id (log_id),
+    FOREIGN KEY (log_id) REFERENCES security_audit_log(log_id) ON DELETE CASCADE
 );
 
 -- Create useful views for common queries
@@ -24,7 +24,8 @@ CREATE TABLE students (
     card_expiry_date DATE,
     status ENUM('active', 'suspended', 'graduated', 'inactive') DEFAULT 'active',
     date_registered TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_last_updated (last_updated)
 );
 
 -- Campus locations/entry points
@@ -152,15 +153,26 @@ CREATE TABLE security_audit_log (
     user_agent TEXT,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     risk_level ENUM('low', 'medium', 'high', 'critical') DEFAULT 'low',
+    category VARCHAR(32),  -- First filter preset the event matches; NULL until indexed
     FOREIGN KEY (user_id) REFERENCES system_users(user_id) ON DELETE SET NULL,
     FOREIGN KEY (student_id) REFERENCES students(student_id) ON DELETE SET NULL,
     INDEX idx_event_type (event_type),
     INDEX idx_timestamp (timestamp),
     INDEX idx_user_id (user_id),
     INDEX idx_risk_level (risk_level),
+    INDEX idx_category (category),  -- InnoDB appends log_id: reindex's NULL scan in log_id order
     INDEX idx_security_audit_timestamp_type (timestamp, event_type)
 );
 
+-- Keyword index of security_audit_log (event_details are encrypted), written with each event
+CREATE TABLE security_audit_keywords (
+    keyword VARCHAR(64) NOT NULL,  -- HMAC of 'preset:<name>', 'type:<event_type>' or a word of the details
+    log_id INT NOT NULL,
+    PRIMARY KEY (keyword, log_id),
+    INDEX idx_log_id (log_id),
+    FOREIGN KEY (log_id) REFERENCES security_audit_log(log_id) ON DELETE CASCADE
+);
+
 -- User sessions tracking
 CREATE TABLE user_sessions (
     session_id VARCHAR(255) PRIMARY KEY,
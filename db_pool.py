@@ -0,0 +1,238 @@
+# Database Connection Pool for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Pooled MySQL connections with health checks and lifetime recycling
+
+import threading
+import time
+import weakref
+import logging
+from collections import deque
+import mysql.connector
+from mysql.connector import errors
+from flask import g, has_app_context
+
+logger = logging.getLogger(__name__)
+
+class _PoolEntry:
+    """A raw MySQL connection plus the bookkeeping the pool needs"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class PooledConnection:
+    """Connection handle returned to callers.
+
+    Behaves like a mysql.connector connection. ``close()`` hands the
+    connection back to the pool instead of tearing down the socket; handles
+    borrowed inside a request are released when the request ends.
+    """
+
+    def __init__(self, pool, entry, request_scoped=False):
+        self._entry = entry
+        self._request_scoped = request_scoped
+        if request_scoped:
+            self._finalizer = None
+        else:
+            # Also covers handles that are dropped without close()
+            self._finalizer = weakref.finalize(self, pool.release, entry)
+
+    def __getattr__(self, name):
+        return getattr(self._entry.raw, name)
+
+    def close(self):
+        """Return the connection to the pool (no-op for request-scoped handles)"""
+        if self._finalizer is not None:
+            self._finalizer()
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool"""
+
+    def __init__(self, db_config, pool_size=10, checkout_timeout=5,
+                 max_lifetime=1800, health_check_interval=30):
+        self.db_config = dict(db_config)
+        # Buffered cursors let several cursors share one connection per request
+        self.db_config.setdefault('buffered', True)
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'failed_health_checks': 0,
+            'checkout_timeouts': 0
+        }
+        self._in_use = 0
+
+    def acquire(self):
+        """Check out a healthy connection, waiting up to checkout_timeout seconds"""
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['checkout_timeouts'] += 1
+            raise errors.PoolError(
+                f"Connection pool exhausted ({self.pool_size} connections in use)")
+
+        try:
+            entry = self._take_idle()
+            if entry is None:
+                entry = self._create_entry()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+        entry.last_used = time.monotonic()
+        return entry
+
+    def release(self, entry):
+        """Return a checked-out connection to the pool"""
+        try:
+            if entry.raw.is_connected() and entry.raw.in_transaction:
+                entry.raw.rollback()
+            entry.last_used = time.monotonic()
+            if entry.raw.is_connected():
+                with self._lock:
+                    self._idle.append(entry)
+            else:
+                self._discard(entry)
+        except mysql.connector.Error as err:
+            logger.warning(f"Discarding pooled connection on release: {err}")
+            self._discard(entry)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Return pool usage counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle)
+            })
+        return stats
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones close on release)"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._discard(entry)
+
+    def _take_idle(self):
+        """Pop idle connections until one passes lifetime and health checks"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                entry = self._idle.pop()
+
+            now = time.monotonic()
+            if now - entry.created_at > self.max_lifetime:
+                with self._lock:
+                    self._stats['connections_recycled'] += 1
+                self._discard(entry)
+                continue
+
+            if now - entry.last_used > self.health_check_interval:
+                try:
+                    entry.raw.ping(reconnect=False)
+                except mysql.connector.Error:
+                    with self._lock:
+                        self._stats['failed_health_checks'] += 1
+                    self._discard(entry)
+                    continue
+
+            return entry
+
+    def _create_entry(self):
+        raw = mysql.connector.connect(**self.db_config)
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return _PoolEntry(raw)
+
+    def _discard(self, entry):
+        try:
+            entry.raw.close()
+        except mysql.connector.Error:
+            pass
+
+# Global pool, configured once by the application
+_pool = None
+_pool_lock = threading.Lock()
+
+def init_pool(db_config, **pool_config):
+    """Create the global pool if it does not exist yet and return it"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(db_config, **pool_config)
+            logger.info(f"Database connection pool initialised (size {_pool.pool_size})")
+    return _pool
+
+def get_pool():
+    """Get the global connection pool"""
+    return _pool
+
+# Connections reserved for the write-behind flushers (access log ingestor,
+# audit writer). Request threads block on those flushes while holding their
+# own connection, so sharing one pool could leave a flush with no slot.
+_background_pool = None
+
+def init_background_pool(db_config, **pool_config):
+    """Create the background writers' pool if it does not exist yet and return it"""
+    global _background_pool
+    with _pool_lock:
+        if _background_pool is None:
+            _background_pool = ConnectionPool(db_config, **pool_config)
+            logger.info(f"Background writer connection pool initialised (size {_background_pool.pool_size})")
+    return _background_pool
+
+def get_background_pool():
+    """Get the background writers' pool"""
+    return _background_pool
+
+def get_background_connection():
+    """Check out a connection from the background writers' pool (never request-scoped)"""
+    if _background_pool is None:
+        raise errors.PoolError("Background connection pool has not been initialised")
+    return PooledConnection(_background_pool, _background_pool.acquire())
+
+def get_connection():
+    """Check out a pooled connection.
+
+    Inside a Flask app context the same connection is reused for the whole
+    request and returned to the pool by ``release_request_connection``.
+    """
+    if _pool is None:
+        raise errors.PoolError("Connection pool has not been initialised")
+
+    if has_app_context():
+        entry = g.get('_db_pool_entry')
+        if entry is None:
+            entry = _pool.acquire()
+            g._db_pool_entry = entry
+        return PooledConnection(_pool, entry, request_scoped=True)
+
+    return PooledConnection(_pool, _pool.acquire())
+
+def release_request_connection(exc=None):
+    """Return the request's connection to the pool (Flask teardown hook)"""
+    entry = g.pop('_db_pool_entry', None)
+    if entry is not None and _pool is not None:
+        _pool.release(entry)
+
+def init_app(app):
+    """Register the per-request release hook on a Flask app"""
+    app.teardown_appcontext(release_request_connection)
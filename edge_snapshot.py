@@ -0,0 +1,429 @@
+# Edge Decision Snapshots for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Compact binary export of the reference data card readers need to decide offline
+
+import os
+import sys
+import glob
+import mmap
+import time
+import struct
+import logging
+from datetime import date
+from pathlib import Path
+import numpy as np
+import mysql.connector
+from card_directory import card_key
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are only serialised within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# File layout:
+#   64-byte header (HEADER, zero padded)
+#   card records      n_cards x card dtype, sorted by card_id
+#   card deletes      n_card_deletes x S<card_id_size>, sorted (deltas only)
+#   location records  n_locations x LOCATION_DTYPE, sorted by location_id
+#   location deletes  n_location_deletes x <u4, sorted (deltas only)
+# Every integer is little-endian and every section is a packed NumPy array,
+# so a reader can mmap the file and binary-search it in place.
+MAGIC = b'SCEDGE\x00\x01'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHHQQqIIIIHH')
+HEADER_SIZE = 64
+KIND_FULL, KIND_DELTA = 0, 1
+
+STATUSES = ('active', 'inactive', 'graduated', 'suspended')
+ACCESS_LEVELS = ('public', 'restricted', 'staff_only', 'admin_only')
+FLAG_REVOKED = 0x01
+FLAG_LOCATION_ACTIVE = 0x01
+NO_EXPIRY = 2 ** 31 - 1  # expiry_day for cards without an expiry date
+
+LOCATION_DTYPE = np.dtype([('location_id', '<u4'), ('access_level', 'u1'), ('flags', 'u1')])
+
+def card_dtype(card_id_size, student_id_size):
+    """Fixed-width card record; widths are the longest ids in the snapshot"""
+    return np.dtype([('card_id', f'S{card_id_size}'), ('student_id', f'S{student_id_size}'),
+                     ('status', 'u1'), ('flags', 'u1'), ('expiry_day', '<i4')])
+
+class EdgeSnapshot:
+    """Read-only view of a snapshot (or delta) file.
+
+    Built over any buffer - ``bytes`` from the API or an ``mmap`` of a
+    file on the reader - without copying the record arrays. ``decide()``
+    applies the same checks as ``scan_card`` with two binary searches, so
+    a reader that lost its uplink keeps deciding locally and replays its
+    taps to ``/scan_cards/bulk`` once it is back online.
+    """
+
+    def __init__(self, buffer):
+        (magic, format_version, self.kind, self.version, self.base_version, self.built_at,
+         n_cards, n_card_deletes, n_locations, n_location_deletes,
+         card_id_size, student_id_size) = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("not an edge snapshot")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"snapshot format version {format_version} is not supported")
+
+        self.buffer = buffer
+        self.card_id_size = card_id_size
+        self.student_id_size = student_id_size
+        dtype = card_dtype(card_id_size, student_id_size)
+        offset = HEADER_SIZE
+        self.cards = np.frombuffer(buffer, dtype, n_cards, offset)
+        offset += n_cards * dtype.itemsize
+        self.card_deletes = np.frombuffer(buffer, f'S{card_id_size}', n_card_deletes, offset)
+        offset += n_card_deletes * card_id_size
+        self.locations = np.frombuffer(buffer, LOCATION_DTYPE, n_locations, offset)
+        offset += n_locations * LOCATION_DTYPE.itemsize
+        self.location_deletes = np.frombuffer(buffer, '<u4', n_location_deletes, offset)
+        self._card_ids = self.cards['card_id']
+        self._location_ids = self.locations['location_id']
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a snapshot file"""
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def is_delta(self):
+        return self.kind == KIND_DELTA
+
+    def card(self, card_id):
+        """Card record for ``card_id`` (a NumPy void), or None"""
+        key = card_id.encode('utf-8') if isinstance(card_id, str) else bytes(card_id)
+        if len(key) > self.card_id_size:
+            return None
+        index = np.searchsorted(self._card_ids, key)
+        if index < len(self._card_ids) and self._card_ids[index] == key:
+            return self.cards[index]
+        return None
+
+    def location(self, location_id):
+        """Location record for ``location_id``, or None"""
+        location_id = int(location_id)
+        index = np.searchsorted(self._location_ids, location_id)
+        if index < len(self._location_ids) and self._location_ids[index] == location_id:
+            return self.locations[index]
+        return None
+
+    def decide(self, card_id, location_id, today=None):
+        """``(granted, denial_reason)`` for a tap, using only the snapshot.
+
+        Same checks as ``scan_card`` except the AI risk scoring, plus the
+        card expiry date, which an offline reader enforces itself.
+        """
+        if self.is_delta:
+            raise ValueError("apply a delta to a full snapshot before deciding with it")
+        card = self.card(card_id)
+        if card is None:
+            return False, 'Unknown card'
+        location = self.location(location_id)
+        if location is None:
+            return False, 'Invalid location'
+        status = STATUSES[card['status']]
+        if status != 'active':
+            return False, f'Student status: {status}'
+        if card['flags'] & FLAG_REVOKED:
+            return False, 'Card reported as lost/stolen'
+        today = (today or date.today()).toordinal() - _EPOCH_ORDINAL
+        if card['expiry_day'] < today:
+            return False, 'Card expired'
+        if ACCESS_LEVELS[location['access_level']] == 'staff_only':
+            return False, 'Insufficient access level - staff only'
+        return True, None
+
+    def apply_delta(self, delta):
+        """New full snapshot: this one with ``delta`` applied"""
+        if self.is_delta or not delta.is_delta:
+            raise ValueError("apply_delta() takes a full snapshot and a delta")
+        if delta.base_version != self.version:
+            raise ValueError(f"delta is based on version {delta.base_version}, "
+                             f"not {self.version}")
+
+        dtype = card_dtype(max(self.card_id_size, delta.card_id_size),
+                           max(self.student_id_size, delta.student_id_size))
+        cards = self.cards.astype(dtype)
+        upserts = delta.cards.astype(dtype)
+        removed = np.concatenate([delta.card_deletes.astype(dtype['card_id']), upserts['card_id']])
+        cards = np.concatenate([cards[~np.isin(cards['card_id'], removed)], upserts])
+
+        locations = self.locations
+        removed = np.concatenate([delta.location_deletes, delta.locations['location_id']])
+        locations = np.concatenate([locations[~np.isin(locations['location_id'], removed)],
+                                    delta.locations])
+
+        return EdgeSnapshot(encode_snapshot(cards, locations, delta.version, delta.built_at))
+
+    def info(self):
+        """Header fields and section sizes"""
+        return {
+            'kind': 'delta' if self.is_delta else 'full',
+            'version': self.version,
+            'base_version': self.base_version if self.is_delta else None,
+            'built_at': self.built_at,
+            'cards': len(self.cards),
+            'revoked_cards': int(np.count_nonzero(self.cards['flags'] & FLAG_REVOKED)),
+            'card_deletes': len(self.card_deletes),
+            'locations': len(self.locations),
+            'location_deletes': len(self.location_deletes),
+            'bytes': len(self.buffer)
+        }
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def encode_snapshot(cards, locations, version, built_at, kind=KIND_FULL, base_version=0,
+                    card_deletes=None, location_deletes=None):
+    """Serialise record arrays (sorting them) into snapshot file bytes"""
+    card_id_size = cards.dtype['card_id'].itemsize
+    student_id_size = cards.dtype['student_id'].itemsize
+    if card_deletes is None:
+        card_deletes = np.empty(0, f'S{card_id_size}')
+    card_deletes = np.sort(card_deletes.astype(f'S{card_id_size}'))
+    if location_deletes is None:
+        location_deletes = np.empty(0, '<u4')
+    location_deletes = np.sort(location_deletes.astype('<u4'))
+    cards = cards[np.argsort(cards['card_id'], kind='stable')]
+    locations = locations[np.argsort(locations['location_id'], kind='stable')].astype(LOCATION_DTYPE)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, kind, version, base_version, built_at,
+                         len(cards), len(card_deletes), len(locations), len(location_deletes),
+                         card_id_size, student_id_size).ljust(HEADER_SIZE, b'\x00')
+    return b''.join([header, cards.tobytes(), card_deletes.tobytes(),
+                     locations.tobytes(), location_deletes.tobytes()])
+
+def load_records(cursor):
+    """Card and location record arrays from the database (plain, non-dictionary cursor)"""
+    cursor.execute("SELECT DISTINCT card_id FROM lost_stolen_cards WHERE status = 'active'")
+    revoked = {card_key(row[0]) for row in cursor.fetchall()}
+
+    cursor.execute("SELECT card_id, student_id, status, card_expiry_date FROM students")
+    rows = cursor.fetchall()
+    card_ids = np.array([row[0].encode('utf-8') for row in rows], dtype=bytes)
+    student_ids = np.array([row[1].encode('utf-8') for row in rows], dtype=bytes)
+    status_codes = {status: code for code, status in enumerate(STATUSES)}
+    # Unknown statuses are stored as 'inactive' so readers deny them
+    statuses = np.array([status_codes.get(row[2], 1) for row in rows], dtype=np.uint8)
+    expiry = np.array([row[3] for row in rows], dtype='datetime64[D]')
+
+    cards = np.zeros(len(rows), card_dtype(max(card_ids.itemsize, 1), max(student_ids.itemsize, 1)))
+    cards['card_id'] = card_ids
+    cards['student_id'] = student_ids
+    cards['status'] = statuses
+    if len(revoked):
+        # Compared the way the database matches card ids, not byte for byte
+        cards['flags'] = [FLAG_REVOKED if card_key(row[0]) in revoked else 0 for row in rows]
+    cards['expiry_day'] = np.where(np.isnat(expiry), NO_EXPIRY, expiry.astype(np.int64))
+
+    cursor.execute("SELECT location_id, access_level, is_active FROM campus_locations")
+    rows = cursor.fetchall()
+    level_codes = {level: code for code, level in enumerate(ACCESS_LEVELS)}
+    locations = np.zeros(len(rows), LOCATION_DTYPE)
+    locations['location_id'] = [row[0] for row in rows]
+    # Unknown access levels are treated as staff only
+    locations['access_level'] = [level_codes.get(row[1], level_codes['staff_only']) for row in rows]
+    locations['flags'] = [FLAG_LOCATION_ACTIVE if row[2] else 0 for row in rows]
+    return cards, locations
+
+def diff_snapshots(old, new):
+    """Delta file bytes that turn snapshot ``old`` into snapshot ``new``"""
+    dtype = card_dtype(max(old.card_id_size, new.card_id_size),
+                       max(old.student_id_size, new.student_id_size))
+    old_cards, new_cards = old.cards.astype(dtype), new.cards.astype(dtype)
+    changed = ~_matching_rows(old_cards, new_cards, 'card_id')
+    card_deletes = old_cards['card_id'][~np.isin(old_cards['card_id'], new_cards['card_id'])]
+
+    changed_locations = ~_matching_rows(old.locations, new.locations, 'location_id')
+    location_deletes = old.locations['location_id'][
+        ~np.isin(old.locations['location_id'], new.locations['location_id'])]
+
+    return encode_snapshot(new_cards[changed], new.locations[changed_locations],
+                           new.version, new.built_at, KIND_DELTA, old.version,
+                           card_deletes, location_deletes)
+
+def _matching_rows(old, new, key):
+    """Mask of ``new`` records that appear unchanged in ``old`` (both sorted by key)"""
+    if len(old) == 0:
+        return np.zeros(len(new), dtype=bool)
+    index = np.minimum(np.searchsorted(old[key], new[key]), len(old) - 1)
+    return old[index] == new
+
+class EdgeSnapshotStore:
+    """Versioned snapshot files shared by every worker process.
+
+    ``refresh()`` rebuilds the snapshot from the database at most every
+    ``min_rebuild_interval`` seconds; a new version is written only when
+    the content changed. Versions are build times in milliseconds, so they
+    only ever increase. The last ``keep_versions`` files are kept, so a
+    reader that is at most that many versions behind gets a delta instead
+    of the full snapshot.
+    """
+
+    def __init__(self, directory='edge_snapshots', keep_versions=48, min_rebuild_interval=30):
+        self.directory = Path(directory)
+        self.keep_versions = keep_versions
+        self.min_rebuild_interval = min_rebuild_interval
+        self._last_build = {}
+
+    def refresh(self, conn):
+        """Make sure the latest snapshot is recent; returns its version"""
+        latest = self.latest_version()
+        if latest is not None and time.time() - self._path(latest).stat().st_mtime < self.min_rebuild_interval:
+            return latest
+        return self.build(conn)
+
+    def build(self, conn):
+        """Rebuild from the database; returns the (possibly unchanged) latest version"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_file = self._acquire_lock()
+        try:
+            started = time.perf_counter()
+            cursor = conn.cursor()
+            try:
+                cards, locations = load_records(cursor)
+            finally:
+                cursor.close()
+
+            latest = self.latest_version()
+            version = max(int(time.time() * 1000), (latest or 0) + 1)
+            data = encode_snapshot(cards, locations, version, int(time.time()))
+            if latest is not None and _same_records(self.read(latest), data):
+                os.utime(self._path(latest))  # Still current; restart the rebuild timer
+                return latest
+
+            tmp_path = self._path(version).with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(version))
+            self._prune()
+
+            build_ms = (time.perf_counter() - started) * 1000
+            self._last_build = {'version': version, 'cards': len(cards),
+                                'locations': len(locations), 'bytes': len(data),
+                                'build_ms': round(build_ms, 1)}
+            logger.info(f"Edge snapshot {version} built: {len(cards)} cards, "
+                        f"{len(locations)} locations, {len(data)} bytes in {build_ms:.0f} ms")
+            return version
+        finally:
+            self._release_lock(lock_file)
+
+    def versions(self):
+        """Retained versions, oldest first"""
+        versions = []
+        for path in glob.glob(str(self.directory / 'snapshot-*.bin')):
+            try:
+                versions.append(int(Path(path).stem[len('snapshot-'):]))
+            except ValueError:
+                continue
+        return sorted(versions)
+
+    def latest_version(self):
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def read(self, version):
+        """Full snapshot bytes for a retained version"""
+        return self._path(version).read_bytes()
+
+    def delta(self, since_version, version=None):
+        """Delta bytes from ``since_version`` to ``version`` (default latest), or None if not retained"""
+        version = version or self.latest_version()
+        if version is None or since_version not in self.versions() or since_version >= version:
+            return None
+        return diff_snapshots(EdgeSnapshot.open(self._path(since_version)),
+                              EdgeSnapshot.open(self._path(version)))
+
+    def metrics(self):
+        """Retained versions and the last build this process ran"""
+        versions = self.versions()
+        return {
+            'latest_version': versions[-1] if versions else None,
+            'retained_versions': len(versions),
+            'last_build': dict(self._last_build),
+            'config': {
+                'keep_versions': self.keep_versions,
+                'min_rebuild_interval': self.min_rebuild_interval
+            }
+        }
+
+    def _path(self, version):
+        return self.directory / f'snapshot-{version:015d}.bin'
+
+    def _prune(self):
+        for version in self.versions()[:-self.keep_versions]:
+            try:
+                self._path(version).unlink()
+            except OSError:
+                pass
+
+    def _acquire_lock(self):
+        if fcntl is None:
+            return None
+        lock_file = open(self.directory / '.build.lock', 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    @staticmethod
+    def _release_lock(lock_file):
+        if lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+def _same_records(a, b):
+    """True if two encoded snapshots hold the same records (sections are canonical:
+    sorted, fixed width), whatever their version and build time"""
+    return a[_COUNTS_OFFSET:] == b[_COUNTS_OFFSET:]
+
+# Header bytes before the record counts (magic, format, kind, versions, build time)
+_COUNTS_OFFSET = struct.calcsize('<8sHHQQq')
+
+def main(argv=None):
+    """Command line entry point: ``python edge_snapshot.py {build,info,decide} ...``"""
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Build and inspect edge decision snapshots")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="build a snapshot from the database")
+    build_parser.add_argument('--dir', default='edge_snapshots')
+    build_parser.add_argument('--output', help="also copy the snapshot to this file")
+    info_parser = subparsers.add_parser('info', help="show a snapshot file's header")
+    info_parser.add_argument('path')
+    decide_parser = subparsers.add_parser('decide', help="decide a tap from a snapshot file")
+    decide_parser.add_argument('path')
+    decide_parser.add_argument('card_id')
+    decide_parser.add_argument('location_id', type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'build':
+        from app import DB_CONFIG
+        store = EdgeSnapshotStore(args.dir)
+        try:
+            conn = mysql.connector.connect(**DB_CONFIG)
+        except mysql.connector.Error as err:
+            logger.error(f"Database connection error: {err}")
+            return 1
+        try:
+            version = store.build(conn)
+        finally:
+            conn.close()
+        if args.output:
+            Path(args.output).write_bytes(store.read(version))
+        print(json.dumps(EdgeSnapshot(store.read(version)).info(), indent=2))
+    elif args.command == 'info':
+        print(json.dumps(EdgeSnapshot.open(args.path).info(), indent=2))
+    else:
+        started = time.perf_counter()
+        granted, reason = EdgeSnapshot.open(args.path).decide(args.card_id, args.location_id)
+        print(json.dumps({'granted': granted, 'denial_reason': reason,
+                          'decision_us': round((time.perf_counter() - started) * 1e6, 1)}))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
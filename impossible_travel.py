@@ -0,0 +1,277 @@
+# Impossible Travel Detection for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Location transit-time matrix plus per-card last-seen positions
+
+import re
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+class TransitMatrix:
+    """Fastest plausible walking time between every pair of locations.
+
+    Built once from ``campus_locations`` into a square float32 array:
+    moving within a building costs ``same_building_seconds`` plus
+    ``floor_seconds`` per floor climbed, moving between buildings costs
+    ``between_buildings_seconds`` unless ``building_seconds`` gives the pair
+    (either order) its own time. A lookup is two dict probes and one array
+    read.
+    """
+
+    def __init__(self, same_building_seconds=30, floor_seconds=20, between_buildings_seconds=180,
+                 building_seconds=None):
+        self.same_building_seconds = same_building_seconds
+        self.floor_seconds = floor_seconds
+        self.between_buildings_seconds = between_buildings_seconds
+        self.building_seconds = {frozenset(pair): seconds
+                                 for pair, seconds in (building_seconds or {}).items()}
+        self._index = {}  # location_id -> row/column
+        self._names = []
+        self._seconds = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._index)
+
+    def load(self, cursor):
+        """(Re)build the matrix from every location (dictionary cursor)"""
+        cursor.execute("""
+            SELECT location_id, location_name, building, floor_level
+            FROM campus_locations
+            ORDER BY location_id
+        """)
+        rows = cursor.fetchall()
+        buildings = np.array([(row['building'] or '').strip().lower() for row in rows], dtype=object)
+        floors = np.array([self.parse_floor(row['floor_level']) for row in rows], dtype=np.float32)
+
+        same_building = buildings[:, None] == buildings[None, :]
+        seconds = np.where(same_building,
+                           self.same_building_seconds + self.floor_seconds * np.abs(floors[:, None] - floors[None, :]),
+                           self.between_buildings_seconds).astype(np.float32)
+        for i, j in zip(*np.nonzero(~same_building)):
+            override = self.building_seconds.get(frozenset((rows[i]['building'], rows[j]['building'])))
+            if override is not None:
+                seconds[i, j] = override
+        np.fill_diagonal(seconds, 0)
+
+        self._seconds = seconds
+        self._index = {str(row['location_id']): index for index, row in enumerate(rows)}
+        self._names = [row['location_name'] for row in rows]
+
+    def index_of(self, location_id):
+        """Matrix row of a location, or None if it is unknown"""
+        return self._index.get(str(location_id))
+
+    def seconds(self, from_index, to_index):
+        return float(self._seconds[from_index, to_index])
+
+    def name(self, index):
+        return self._names[index]
+
+    def max_seconds(self):
+        return float(self._seconds.max()) if self._seconds.size else 0.0
+
+    @staticmethod
+    def parse_floor(floor_level):
+        """'Ground' -> 0, '2nd Floor' -> 2, 'Basement' -> -1; unknown counts as ground"""
+        text = (floor_level or '').strip().lower()
+        if text.startswith('basement'):
+            return -1
+        match = re.search(r'-?\d+', text)
+        return int(match.group()) if match else 0
+
+class ImpossibleTravelDetector:
+    """Answers "could this card physically be here yet?" in O(1) per scan.
+
+    Keeps the last location and time each card was tapped. A tap is an
+    impossible trip when the card was last seen somewhere else more
+    recently than the ``TransitMatrix`` says the walk takes (scaled by
+    ``tolerance``) - the usual sign of a cloned card. ``record()`` is
+    called as each access is logged; taps logged by other worker
+    processes are pulled in with a ``log_id > last seen`` query every
+    ``refresh_interval`` seconds, and the matrix is rebuilt every
+    ``reload_interval`` seconds. Cursors must be dictionary cursors.
+    """
+
+    def __init__(self, transit=None, tolerance=0.8, refresh_interval=5, reload_interval=300):
+        self.transit = transit if transit is not None else TransitMatrix()
+        self.tolerance = tolerance
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self._last_seen = {}  # card_id -> (location_id as str, timestamp)
+        self._max_log_id = 0
+        self._warm = False
+        self._last_refresh = 0.0
+        self._last_reload = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'checks': 0, 'impossible': 0}
+
+    @property
+    def is_warm(self):
+        return self._warm
+
+    def ensure_fresh(self, cursor):
+        """Warm on first use, then pull other workers' taps and reload the matrix when due"""
+        now = time.monotonic()
+        try:
+            if not self._warm:
+                self.warm(cursor)
+            else:
+                if now - self._last_reload >= self.reload_interval:
+                    self._reload(cursor)
+                if now - self._last_refresh >= self.refresh_interval:
+                    self.refresh(cursor)
+        except mysql.connector.Error as err:
+            logger.error(f"Impossible travel state refresh failed: {err}")
+        return self._warm
+
+    def warm(self, cursor):
+        """Load the matrix and every card seen within the longest transit time"""
+        self._reload(cursor)
+        cursor.execute("SELECT COALESCE(MAX(log_id), 0) AS max_log_id FROM access_logs")
+        max_log_id = cursor.fetchone()['max_log_id']
+        cursor.execute("""
+            SELECT log_id, card_id, location_id, access_time
+            FROM access_logs
+            WHERE access_time >= %s AND card_id IS NOT NULL
+            ORDER BY access_time
+        """, (datetime.now() - timedelta(seconds=self._horizon()),))
+        rows = cursor.fetchall()
+
+        with self._lock:
+            self._last_seen = {}
+            for row in rows:
+                self._record_locked(row['card_id'], row['location_id'], row['access_time'].timestamp())
+            self._max_log_id = max(self._max_log_id, max_log_id)
+            self._warm = True
+            self._last_refresh = time.monotonic()
+        logger.info(f"Impossible travel detector warmed with {len(self.transit)} locations "
+                    f"and {len(self._last_seen)} recently seen cards")
+
+    def refresh(self, cursor, batch_size=5000):
+        """Fold in taps logged since the last warm/refresh, dropping stale cards"""
+        while True:
+            cursor.execute("""
+                SELECT log_id, card_id, location_id, access_time
+                FROM access_logs
+                WHERE log_id > %s
+                ORDER BY log_id
+                LIMIT %s
+            """, (self._max_log_id, batch_size))
+            rows = cursor.fetchall()
+            with self._lock:
+                for row in rows:
+                    if row['card_id'] and row['access_time']:
+                        self._record_locked(row['card_id'], row['location_id'], row['access_time'].timestamp())
+                    self._max_log_id = max(self._max_log_id, row['log_id'])
+            if len(rows) < batch_size:
+                break
+
+        cutoff = time.time() - self._horizon()
+        with self._lock:
+            # A card last seen longer ago than any walk takes can be anywhere
+            for card_id in [card for card, (_, ts) in self._last_seen.items() if ts < cutoff]:
+                del self._last_seen[card_id]
+            self._last_refresh = time.monotonic()
+
+    def record(self, card_id, location_id, access_time=None):
+        """Record a tap as it is logged"""
+        if not card_id:
+            return
+        access_time = access_time or datetime.now()
+        with self._lock:
+            self._record_locked(card_id, location_id, access_time.timestamp())
+
+    def check(self, card_id, location_id, when=None, pending=None):
+        """Details of the impossible trip this tap implies, or None if it is possible.
+
+        ``pending`` is a ``(location_id, timestamp)`` sighting not recorded
+        yet (see ``PendingTravel``); the newer of it and the recorded one counts.
+        """
+        to_index = self.transit.index_of(location_id)
+        with self._lock:
+            self._stats['checks'] += 1
+            last_seen = self._last_seen.get(card_id)
+        if pending is not None and (last_seen is None or pending[1] >= last_seen[1]):
+            last_seen = pending
+        if last_seen is None or to_index is None:
+            return None
+
+        last_location, last_ts = last_seen
+        from_index = self.transit.index_of(last_location)
+        if from_index is None:
+            return None
+        elapsed = (when or datetime.now()).timestamp() - last_ts
+        required = self.transit.seconds(from_index, to_index) * self.tolerance
+        # A replayed tap older than the last sighting says nothing about travel
+        if from_index == to_index or elapsed < 0 or elapsed >= required:
+            return None
+
+        with self._lock:
+            self._stats['impossible'] += 1
+        return {
+            'from_location': self.transit.name(from_index),
+            'to_location': self.transit.name(to_index),
+            'elapsed_seconds': round(elapsed, 1),
+            'required_seconds': round(self.transit.seconds(from_index, to_index), 1)
+        }
+
+    def pending(self):
+        """A ``PendingTravel`` for a batch of taps not committed yet"""
+        return PendingTravel(self)
+
+    def stats(self):
+        """Check counters and state size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'warm': self._warm,
+                'locations': len(self.transit),
+                'cards_tracked': len(self._last_seen),
+                'max_log_id': self._max_log_id
+            })
+        return stats
+
+    def _reload(self, cursor):
+        self.transit.load(cursor)
+        self._last_reload = time.monotonic()
+
+    def _horizon(self):
+        return self.transit.max_seconds() * self.tolerance
+
+    def _record_locked(self, card_id, location_id, ts):
+        if location_id is None:
+            return
+        last_seen = self._last_seen.get(card_id)
+        if last_seen is None or ts >= last_seen[1]:
+            self._last_seen[card_id] = (str(location_id), ts)
+
+class PendingTravel:
+    """A bulk batch's own taps layered over an ``ImpossibleTravelDetector``.
+
+    Each tap in a batch is checked against the ones before it, but the
+    detector only records them once the batch has committed.
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self._last_seen = {}  # card_id -> (location_id as str, timestamp)
+
+    def ensure_fresh(self, cursor):
+        return self.detector.ensure_fresh(cursor)
+
+    def record(self, card_id, location_id, access_time=None):
+        """Record a tap of this batch"""
+        if not card_id or location_id is None:
+            return
+        ts = (access_time or datetime.now()).timestamp()
+        last_seen = self._last_seen.get(card_id)
+        if last_seen is None or ts >= last_seen[1]:
+            self._last_seen[card_id] = (str(location_id), ts)
+
+    def check(self, card_id, location_id, when=None):
+        return self.detector.check(card_id, location_id, when, pending=self._last_seen.get(card_id))
@@ -0,0 +1,619 @@
+# Model Retraining for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Retrains the AI models from real access history in a separate process
+
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import mysql.connector
+
+try:
+    import fcntl
+except ImportError:  # Windows: retraining is only serialised within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Exit codes of the training process
+TRAINED, FAILED, NOT_ENOUGH_DATA = 0, 1, 2
+
+class AccessHistoryFeatures:
+    """Turns access_logs rows into the feature rows the AI engine trains on.
+
+    Rows must arrive in time order. Only the last ``window_seconds`` of
+    accesses are kept per student, so memory stays flat however much
+    history is streamed through. The features are computed the way the
+    scan pipeline computes them at decision time (from earlier accesses
+    only), so the models train on what they will be asked to score.
+    An access counts as an incident if it was denied or flagged for review.
+    """
+
+    def __init__(self, location_levels, window_seconds=3600):
+        self.location_levels = location_levels  # location_id -> access_level
+        self.window_seconds = window_seconds
+        self._students = {}  # student_id -> (last access ts, deque of recent accesses)
+
+    def transform(self, rows):
+        """Return (access_X, normal_mask, incident_X, incident_y) for a chunk of rows"""
+        access_rows, normal, incident_rows, incidents = [], [], [], []
+        for row in rows:
+            student_id = row['student_id']
+            access_time = row['access_time']
+            if not student_id or access_time is None:
+                continue
+
+            ts = access_time.timestamp()
+            last_ts, recent = self._students.get(student_id, (None, None))
+            if recent is None:
+                recent = deque()
+            while recent and recent[0][0] <= ts - self.window_seconds:
+                recent.popleft()
+
+            hour = access_time.hour
+            day_of_week = access_time.weekday()
+            is_weekend = int(day_of_week >= 5)
+            denied = not row['access_granted']
+            flagged = bool(row['requires_review'])
+            off_hours = hour >= 22 or hour <= 6
+            minutes_since_last = int((ts - last_ts) / 60) if last_ts is not None else 120
+            locations = len({entry[1] for entry in recent})
+            access_level = self.location_levels.get(row['location_id'], 'public')
+
+            access_rows.append([hour, day_of_week, is_weekend, locations,
+                                minutes_since_last, row['risk_score'] or 0])
+            normal.append(not (denied or flagged))
+            incident_rows.append([
+                hour, day_of_week, is_weekend,
+                sum(1 for entry in recent if entry[2]),
+                min(sum(1 for entry in recent if entry[3]), 5),
+                min(sum(1 for entry in recent if entry[4]), 3),
+                locations,
+                int(access_level == 'staff_only'),
+                int(access_level == 'restricted')
+            ])
+            incidents.append(denied or flagged)
+
+            recent.append((ts, row['location_id'], denied, flagged, off_hours))
+            self._students[student_id] = (ts if last_ts is None else max(ts, last_ts), recent)
+
+        return (np.array(access_rows, dtype=float).reshape(-1, 6), np.array(normal, dtype=bool),
+                np.array(incident_rows, dtype=float).reshape(-1, 9), np.array(incidents, dtype=float))
+
+class Reservoir:
+    """Fixed-size uniform sample of a stream of feature rows"""
+
+    def __init__(self, capacity, n_columns, seed=42):
+        self.capacity = capacity
+        self.rows = np.empty((capacity, n_columns))
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, rows):
+        if not len(rows):
+            return
+        positions = self.seen + np.arange(len(rows))
+        # Row t of the stream replaces a random slot with probability capacity / (t + 1)
+        slots = np.where(positions < self.capacity, positions,
+                         self._rng.integers(0, positions + 1))
+        keep = slots < self.capacity
+        self.rows[slots[keep]] = rows[keep]
+        self.seen += len(rows)
+
+    def sample(self):
+        return self.rows[:min(self.seen, self.capacity)]
+
+def collect_training_features(cursor, lookback_days=180, chunk_size=5000, max_training_rows=200000):
+    """Stream access history through the featurizer into bounded samples.
+
+    Reads ``access_logs`` by primary key in ``chunk_size`` pages starting at
+    the first row inside the lookback window, so neither the server nor this
+    process ever holds more than one page. Returns two reservoirs: access
+    features plus a normal flag, and incident features plus the label.
+    """
+    cursor.execute("SELECT location_id, access_level FROM campus_locations")
+    location_levels = {row['location_id']: row['access_level'] for row in cursor.fetchall()}
+
+    cursor.execute("SELECT MIN(log_id) AS first_id FROM access_logs WHERE access_time >= %s",
+                   (datetime.now() - timedelta(days=lookback_days),))
+    first_id = cursor.fetchone()['first_id']
+
+    features = AccessHistoryFeatures(location_levels)
+    access_sample = Reservoir(max_training_rows, 7)
+    incident_sample = Reservoir(max_training_rows, 10)
+    last_id = (first_id or 1) - 1
+
+    while first_id is not None:
+        cursor.execute("""
+            SELECT log_id, student_id, location_id, access_time, access_granted,
+                   risk_score, requires_review
+            FROM access_logs
+            WHERE log_id > %s
+            ORDER BY log_id
+            LIMIT %s
+        """, (last_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]['log_id']
+
+        access_X, normal, incident_X, incident_y = features.transform(rows)
+        access_sample.add(np.column_stack([access_X, normal]))
+        incident_sample.add(np.column_stack([incident_X, incident_y]))
+
+        if len(rows) < chunk_size:
+            break
+
+    logger.info(f"Streamed {access_sample.seen} accesses from the last {lookback_days} days "
+                f"(sampled {len(access_sample.sample())})")
+    return access_sample, incident_sample
+
+def train_from_history(db_config, model_dir='models', lookback_days=180, chunk_size=5000,
+                       max_training_rows=200000, min_training_rows=1000):
+    """Collect features from the database, train and save the models.
+
+    Meant to run in its own process (see ``ModelRetrainer``); the new
+    artifacts are written atomically to ``model_dir`` and picked up by
+    every worker through ``SecurityAIEngine.reload_if_changed()``.
+    Returns one of TRAINED, FAILED or NOT_ENOUGH_DATA.
+    """
+    from ai_engine import SecurityAIEngine
+
+    try:
+        conn = mysql.connector.connect(**db_config)
+    except mysql.connector.Error as err:
+        logger.error(f"Retraining could not connect to the database: {err}")
+        return FAILED
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        access_sample, incident_sample = collect_training_features(
+            cursor, lookback_days, chunk_size, max_training_rows)
+    except mysql.connector.Error as err:
+        logger.error(f"Reading access history failed: {err}")
+        return FAILED
+    finally:
+        if conn.is_connected():
+            cursor.close()
+            conn.close()
+
+    access_rows = access_sample.sample()
+    incident_rows = incident_sample.sample()
+    if len(access_rows) < min_training_rows:
+        logger.warning(f"Only {len(access_rows)} accesses in the last {lookback_days} days; "
+                       f"need {min_training_rows} to retrain")
+        return NOT_ENOUGH_DATA
+
+    engine = SecurityAIEngine()
+    engine.model_dir = Path(model_dir)
+    trained = engine.train_from_features(access_rows[:, :6], access_rows[:, 6].astype(bool),
+                                         incident_rows[:, :9], incident_rows[:, 9])
+    return TRAINED if trained else FAILED
+
+class OnlineModelUpdater:
+    """Keeps the saved models fresh between full retrains.
+
+    Each ``update()`` reads the ``access_logs`` rows written since the last
+    one (``log_id`` above a watermark) through the same featurizer as the
+    full retrain, then:
+
+    * takes one pass of mini-batch SGD over the newly labelled rows
+      (denied or flagged = incident) on the incident predictor;
+    * adds the access features to a rolling window of the last
+      ``window_rows`` accesses, replaces the oldest ``trees_per_update``
+      trees of the compiled Isolation Forest with trees grown on that
+      window, and re-derives the anomaly threshold from it.
+
+    The result is written to ``ai_runtime.npz``, which every worker
+    hot-swaps in. The scalers stay those of the last full retrain.
+    """
+
+    def __init__(self, window_rows=20000, trees_per_update=10, min_new_rows=200,
+                 learning_rate=0.01, batch_size=256, contamination=0.2,
+                 chunk_size=5000, max_rows_per_update=100000, seed=None):
+        self.window_rows = window_rows
+        self.trees_per_update = trees_per_update
+        self.min_new_rows = min_new_rows
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.contamination = contamination
+        self.chunk_size = chunk_size
+        self.max_rows_per_update = max_rows_per_update
+        self._rng = np.random.default_rng(seed)
+        self._features = None
+        self._watermark = None
+        self._window = np.empty((window_rows, 6))
+        self._window_size = 0
+        self._window_pos = 0
+        self._pending = []  # (incident_X, incident_y) not yet applied
+        self._stats = {'updates': 0, 'rows': 0, 'last_update': None, 'last_duration_ms': None}
+
+    @property
+    def is_warm(self):
+        return self._watermark is not None
+
+    def warm(self, cursor):
+        """Start from the newest rows: fill the window and the featurizer's per-student state"""
+        cursor.execute("SELECT location_id, access_level FROM campus_locations")
+        self._features = AccessHistoryFeatures({row['location_id']: row['access_level']
+                                                for row in cursor.fetchall()})
+        cursor.execute("""
+            SELECT log_id, student_id, location_id, access_time, access_granted,
+                   risk_score, requires_review
+            FROM access_logs
+            ORDER BY log_id DESC
+            LIMIT %s
+        """, (self.window_rows,))
+        rows = cursor.fetchall()[::-1]
+        self._watermark = rows[-1]['log_id'] if rows else 0
+        self._add_to_window(self._features.transform(rows)[0])
+        logger.info(f"Online model updates warmed with {self._window_size} recent accesses")
+
+    def update(self, cursor, runtime_file):
+        """Fold in rows written since the last call; True if the models were rewritten"""
+        if not Path(runtime_file).exists():
+            return False
+        if not self.is_warm:
+            self.warm(cursor)
+            return False
+
+        started = time.perf_counter()
+        new_rows = 0
+        while new_rows < self.max_rows_per_update:
+            cursor.execute("""
+                SELECT log_id, student_id, location_id, access_time, access_granted,
+                       risk_score, requires_review
+                FROM access_logs
+                WHERE log_id > %s
+                ORDER BY log_id
+                LIMIT %s
+            """, (self._watermark, self.chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            self._watermark = rows[-1]['log_id']
+            new_rows += len(rows)
+            access_X, _, incident_X, incident_y = self._features.transform(rows)
+            self._add_to_window(access_X)
+            self._pending.append((incident_X, incident_y))
+            if len(rows) < self.chunk_size:
+                break
+
+        pending_rows = sum(len(y) for _, y in self._pending)
+        if pending_rows < self.min_new_rows:
+            return False
+
+        from compiled_forest import CompiledForest, load_runtime, save_runtime
+        models, scalers, meta = load_runtime(runtime_file)
+        forest = models['anomaly_detector']
+        predictor = models['incident_predictor']
+
+        incident_X = np.vstack([X for X, _ in self._pending])
+        incident_y = np.concatenate([y for _, y in self._pending])
+        self._sgd(predictor, scalers['incident_features'].transform(incident_X), incident_y)
+        self._pending = []
+
+        window = self._window[:self._window_size]
+        if len(window) >= forest.max_samples:
+            new_trees = CompiledForest.grow(window, self.trees_per_update, forest.max_samples,
+                                            forest.weight, forest.bias, rng=self._rng)
+            forest = forest.replace_oldest_trees(new_trees)
+            forest.offset = float(np.percentile(forest.score_samples(window), 100 * self.contamination))
+
+        meta.update({
+            'online_updates': meta.get('online_updates', 0) + 1,
+            'online_rows': meta.get('online_rows', 0) + pending_rows,
+            'online_updated_at': datetime.now().isoformat(),
+            'online_last_log_id': self._watermark
+        })
+        save_runtime(runtime_file, forest, predictor, scalers['incident_features'],
+                     models['backup_optimizer'], meta)
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        self._stats.update({
+            'updates': self._stats['updates'] + 1,
+            'rows': self._stats['rows'] + pending_rows,
+            'last_update': datetime.now().isoformat(),
+            'last_duration_ms': round(duration_ms, 1)
+        })
+        logger.info(f"Online model update from {pending_rows} new accesses in {duration_ms:.0f} ms")
+        return True
+
+    def stats(self):
+        """Update counters and the rolling window size"""
+        stats = dict(self._stats)
+        stats.update({'watermark': self._watermark, 'window_rows': self._window_size})
+        return stats
+
+    def _sgd(self, predictor, X_scaled, y):
+        """One pass of mini-batch gradient steps, same loss as the full fit"""
+        order = self._rng.permutation(len(y))
+        weights = np.array(predictor['weights'], dtype=float)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            predictions = 1 / (1 + np.exp(-np.clip(X_scaled[batch] @ weights + predictor['bias'], -500, 500)))
+            weights -= self.learning_rate * X_scaled[batch].T @ (predictions - y[batch]) / len(batch)
+        predictor['weights'] = weights
+
+    def _add_to_window(self, rows):
+        """Append rows to the ring buffer, overwriting the oldest"""
+        rows = rows[-self.window_rows:]
+        positions = (self._window_pos + np.arange(len(rows))) % self.window_rows
+        self._window[positions] = rows
+        self._window_pos = (self._window_pos + len(rows)) % self.window_rows
+        self._window_size = min(self._window_size + len(rows), self.window_rows)
+
+class ModelRetrainer:
+    """Periodically retrains the AI models from real access history.
+
+    A daemon thread in each worker checks every ``check_interval`` seconds
+    whether the saved artifact is older than ``interval_hours`` (only when
+    ``enabled``; ``trigger()`` always works). If so it runs
+    ``python model_training.py`` as a child process, so fitting never holds
+    the GIL or the memory of a request worker, and then hot-swaps the new
+    models into the live engine. A lock file stops several workers from
+    training at once; the others pick up the result when they notice the
+    artifact has changed.
+
+    With ``online_interval`` set, one worker (whichever holds the
+    ``.online.lock`` file) also runs an ``OnlineModelUpdater`` every
+    ``online_interval`` seconds, so the models follow new access history
+    between the full retrains.
+
+    Shadow mode is opt-in: with ``shadow_candidate_dir`` set, the loop
+    keeps shadow scoring in step with that directory (a candidate artifact
+    placed there is scored beside the live models in every worker until it
+    is promoted or removed), and full retrains write their models there
+    instead of going live, so a new model reaches ``model_dir`` only
+    through ``promote_shadow()``. Online updates keep refreshing the live
+    models either way.
+    """
+
+    def __init__(self, engine_provider, db_config, interval_hours=24, lookback_days=180,
+                 chunk_size=5000, max_training_rows=200000, min_training_rows=1000,
+                 check_interval=60, enabled=True, model_dir='models', online_interval=0,
+                 online_window_rows=20000, online_trees_per_update=10, online_min_new_rows=200,
+                 shadow_candidate_dir=None):
+        self.engine_provider = engine_provider
+        self.db_config = db_config
+        self.model_dir = Path(model_dir)
+        self.interval_hours = interval_hours
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self.training_options = {
+            'lookback_days': lookback_days,
+            'chunk_size': chunk_size,
+            'max_training_rows': max_training_rows,
+            'min_training_rows': min_training_rows
+        }
+        self.online_interval = online_interval
+        self.shadow_candidate_dir = shadow_candidate_dir
+        self._online = OnlineModelUpdater(
+            window_rows=online_window_rows, trees_per_update=online_trees_per_update,
+            min_new_rows=online_min_new_rows) if online_interval else None
+        self._online_leader = None
+        self._last_online_update = 0.0
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._force = False
+        self._last_attempt = 0.0
+        self._status = {
+            'running': False,
+            'last_started': None,
+            'last_finished': None,
+            'last_result': None,
+            'last_duration_s': None,
+            'runs': 0
+        }
+
+    def init_app(self, app):
+        """Start the retraining thread with the first request of each worker"""
+        app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='ai-model-retraining', daemon=True)
+                self._worker.start()
+
+    def trigger(self):
+        """Ask for a retrain now; returns False if one is already running"""
+        if self._status['running']:
+            return False
+        self._force = True
+        self.ensure_started()
+        self._wake.set()
+        return True
+
+    def status(self):
+        """Return the state of the last retraining run"""
+        status = dict(self._status)
+        status.update({
+            'enabled': self.enabled,
+            'interval_hours': self.interval_hours,
+            'artifact_age_hours': self._artifact_age_hours(),
+            'online': dict(self._online.stats(), leader=bool(self._online_leader),
+                           interval_s=self.online_interval) if self._online else None
+        })
+        return status
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            try:
+                engine = self.engine_provider()
+                # Another worker may have retrained since we last looked
+                if engine.reload_if_changed():
+                    logger.info("Picked up AI models retrained by another worker")
+                if self.shadow_candidate_dir:
+                    engine.sync_shadow(self.shadow_candidate_dir)
+                if self._force or self._is_due():
+                    self._force = False
+                    self._retrain(engine)
+                elif self._online and time.time() - self._last_online_update >= self.online_interval:
+                    self._update_online(engine)
+            except Exception as e:
+                logger.error(f"Model retraining loop error: {e}")
+
+    @property
+    def output_dir(self):
+        """Where full retrains write: the shadow candidate directory in shadow mode"""
+        return Path(self.shadow_candidate_dir) if self.shadow_candidate_dir else self.model_dir
+
+    def _install(self, engine, what):
+        """Load freshly written models: live, or as the shadow candidate"""
+        if self.shadow_candidate_dir:
+            if engine.sync_shadow(self.shadow_candidate_dir):
+                logger.info(f"{what} AI models are being shadow scored in {self.shadow_candidate_dir}")
+        elif engine.reload_if_changed():
+            logger.info(f"{what} AI models installed")
+
+    def _is_due(self):
+        if not self.enabled:
+            return False
+        interval = self.interval_hours * 3600
+        if time.time() - self._last_attempt < interval:
+            return False
+        age = self._artifact_age_hours()
+        return age is None or age * 3600 >= interval
+
+    def _artifact_age_hours(self):
+        # Online updates rewrite ai_runtime.npz; only full retrains write the .pkl.
+        # A retrain waiting in the candidate directory counts as done
+        for name in ('ai_models.pkl', 'ai_runtime.npz'):
+            mtimes = []
+            for directory in {self.model_dir, self.output_dir}:
+                try:
+                    mtimes.append((directory / name).stat().st_mtime)
+                except OSError:
+                    pass
+            if mtimes:
+                return round((time.time() - max(mtimes)) / 3600, 2)
+        return None
+
+    def _retrain(self, engine):
+        lock_file = self._acquire_lock(self.model_dir)
+        if lock_file is False:
+            logger.info("Retraining already running in another worker")
+            return
+
+        self._last_attempt = time.time()
+        started = time.monotonic()
+        self._status.update({'running': True, 'last_started': datetime.now().isoformat()})
+        outcome = 'failed'
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            config = dict(self.training_options, db_config=self.db_config,
+                          model_dir=str(self.output_dir))
+            # Credentials go over stdin rather than the command line
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--config-stdin'],
+                input=json.dumps(config), text=True
+            )
+            outcome = {TRAINED: 'trained', NOT_ENOUGH_DATA: 'not_enough_data'}.get(result.returncode, 'failed')
+            if result.returncode == TRAINED:
+                self._install(engine, "Retrained")
+            else:
+                logger.warning(f"Model retraining finished without new models ({outcome})")
+        except OSError as e:
+            logger.error(f"Could not start model retraining: {e}")
+        finally:
+            self._status.update({
+                'running': False,
+                'last_finished': datetime.now().isoformat(),
+                'last_result': outcome,
+                'last_duration_s': round(time.monotonic() - started, 1),
+                'runs': self._status['runs'] + 1
+            })
+            self._release_lock(lock_file)
+
+    def _update_online(self, engine):
+        self._last_online_update = time.time()
+        if not self._online_leader:
+            # Held for the life of the process: one worker applies each batch of rows
+            self._online_leader = self._acquire_lock(self.model_dir, '.online.lock')
+            if self._online_leader is False:
+                return
+
+        lock_file = self._acquire_lock(self.model_dir)
+        if lock_file is False:
+            return  # A full retrain is writing the models
+        conn = None
+        try:
+            conn = mysql.connector.connect(**self.db_config)
+            cursor = conn.cursor(dictionary=True)
+            # Always the live models: shadow mode only gates full retrains
+            if self._online.update(cursor, self.model_dir / 'ai_runtime.npz') and engine.reload_if_changed():
+                logger.info("Online-updated AI models installed")
+            cursor.close()
+        except mysql.connector.Error as err:
+            logger.error(f"Online model update failed: {err}")
+        finally:
+            if conn is not None and conn.is_connected():
+                conn.close()
+            self._release_lock(lock_file)
+
+    @staticmethod
+    def _acquire_lock(model_dir, name='.retrain.lock'):
+        """Lock file handle, None if locking is unavailable, False if held elsewhere"""
+        if fcntl is None:
+            return None
+        lock_file = open(Path(model_dir) / name, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
+
+    @staticmethod
+    def _release_lock(lock_file):
+        if lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+def main(argv=None):
+    """Command line entry point: ``python model_training.py [options]``"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Retrain the Smart Campus AI models from access history")
+    parser.add_argument('--lookback-days', type=int, default=180)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--max-training-rows', type=int, default=200000)
+    parser.add_argument('--min-training-rows', type=int, default=1000)
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--config-stdin', action='store_true',
+                        help="read the database config and options as JSON from stdin")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.config_stdin:
+        options = json.load(sys.stdin)
+        db_config = options.pop('db_config')
+    else:
+        from app import DB_CONFIG as db_config
+        options = {
+            'model_dir': args.model_dir,
+            'lookback_days': args.lookback_days,
+            'chunk_size': args.chunk_size,
+            'max_training_rows': args.max_training_rows,
+            'min_training_rows': args.min_training_rows
+        }
+
+    return train_from_history(db_config, **options)
+
+if __name__ == '__main__':
+    sys.exit(main())
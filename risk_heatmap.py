@@ -0,0 +1,134 @@
+# Campus Risk Heatmap for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Incident risk for every active location from one query and one model call
+
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class CampusRiskHeatmap:
+    """Per-location incident risk, rebuilt at most every ``cache_seconds``.
+
+    One query joins every active location to its ``access_logs`` rows of the
+    last ``window_minutes`` and aggregates the incident predictor's inputs
+    (failed attempts, flagged accesses, off-hours accesses and how widely
+    the visiting students roamed). The resulting condition matrix is scored
+    with a single ``predict_incident_risks()`` call. Concurrent requests
+    for a stale map wait for one rebuild instead of each running it.
+    """
+
+    QUERY = """
+        SELECT l.location_id, l.location_name, l.building, l.access_level,
+               COUNT(a.log_id) AS accesses,
+               COALESCE(SUM(a.access_granted = FALSE), 0) AS failed_attempts,
+               COALESCE(SUM(a.requires_review = TRUE), 0) AS flagged_accesses,
+               COALESCE(SUM(HOUR(a.access_time) >= 22 OR HOUR(a.access_time) < 6), 0) AS off_hours_accesses,
+               COUNT(DISTINCT a.student_id) AS students,
+               COALESCE(MAX(roaming.locations), 0) AS max_locations_per_student,
+               MAX(a.access_time) AS last_access
+        FROM campus_locations l
+        LEFT JOIN access_logs a
+               ON a.location_id = l.location_id AND a.access_time >= %s
+        LEFT JOIN (
+            SELECT student_id, COUNT(DISTINCT location_id) AS locations
+            FROM access_logs
+            WHERE access_time >= %s AND student_id IS NOT NULL
+            GROUP BY student_id
+        ) roaming ON roaming.student_id = a.student_id
+        WHERE l.is_active = TRUE
+        GROUP BY l.location_id, l.location_name, l.building, l.access_level
+        ORDER BY l.location_id
+    """
+
+    def __init__(self, engine_provider, window_minutes=60, cache_seconds=60):
+        self.engine_provider = engine_provider
+        self.window_minutes = window_minutes
+        self.cache_seconds = cache_seconds
+        self._cached = None
+        self._expires_at = 0.0
+        self._build_lock = threading.Lock()
+        self._stats = {'builds': 0, 'cache_hits': 0, 'last_build_ms': None}
+
+    def get(self, cursor, refresh=False):
+        """The current heatmap (dictionary cursor), rebuilt if it is stale"""
+        cached = self._cached
+        if not refresh and cached is not None and time.monotonic() < self._expires_at:
+            self._stats['cache_hits'] += 1
+            return cached
+        with self._build_lock:
+            # Another request may have rebuilt it while this one waited
+            if not refresh and self._cached is not None and time.monotonic() < self._expires_at:
+                self._stats['cache_hits'] += 1
+                return self._cached
+            heatmap = self.build(cursor)
+            self._cached = heatmap
+            self._expires_at = time.monotonic() + self.cache_seconds
+            return heatmap
+
+    def invalidate(self):
+        """Force the next get() to rebuild"""
+        self._expires_at = 0.0
+
+    def build(self, cursor):
+        """Query the aggregates and score every location"""
+        started = time.perf_counter()
+        now = datetime.now()
+        since = now - timedelta(minutes=self.window_minutes)
+        cursor.execute(self.QUERY, (since, since))
+        rows = cursor.fetchall()
+
+        conditions = [{
+            'hour': now.hour,
+            'day_of_week': now.weekday(),
+            'is_weekend': now.weekday() >= 5,
+            'failed_attempts_recent': int(row['failed_attempts']),
+            'unusual_patterns_detected': int(row['flagged_accesses']),
+            'off_hours_activity': int(row['off_hours_accesses']),
+            'multiple_locations_accessed': int(row['max_locations_per_student']),
+            'location_security_level': row['access_level']
+        } for row in rows]
+        results = self.engine_provider().predict_incident_risks(conditions)
+
+        locations = []
+        for index, row in enumerate(rows):
+            locations.append({
+                'location_id': row['location_id'],
+                'location_name': row['location_name'],
+                'building': row['building'],
+                'access_level': row['access_level'],
+                'accesses': int(row['accesses']),
+                'students': int(row['students']),
+                'failed_attempts': int(row['failed_attempts']),
+                'flagged_accesses': int(row['flagged_accesses']),
+                'off_hours_accesses': int(row['off_hours_accesses']),
+                'last_access': row['last_access'].isoformat() if row['last_access'] else None,
+                'incident_probability': round(float(results['incident_probability'][index]), 4),
+                'risk_level': str(results['risk_level'][index]),
+                'confidence': round(float(results['confidence'][index]), 1),
+                'factors': results['factors'][index]
+            })
+
+        summary = {level: 0 for level in ('low', 'medium', 'high', 'critical')}
+        for location in locations:
+            summary[location['risk_level']] = summary.get(location['risk_level'], 0) + 1
+
+        build_ms = (time.perf_counter() - started) * 1000
+        self._stats['builds'] += 1
+        self._stats['last_build_ms'] = round(build_ms, 2)
+        logger.info(f"Risk heatmap built for {len(locations)} locations in {build_ms:.1f} ms")
+        return {
+            'generated_at': now.isoformat(),
+            'window_minutes': self.window_minutes,
+            'cache_seconds': self.cache_seconds,
+            'summary': summary,
+            'locations': locations
+        }
+
+    def stats(self):
+        """Build and cache-hit counters"""
+        stats = dict(self._stats)
+        stats['cached'] = self._cached is not None and time.monotonic() < self._expires_at
+        return stats
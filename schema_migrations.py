@@ -0,0 +1,137 @@
+# Schema Migrations for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Idempotent upgrades for databases created from an older setup script
+
+import logging
+import threading
+import time
+import mysql.connector
+from mysql.connector import errorcode
+
+logger = logging.getLogger(__name__)
+
+# Columns, indexes and tables newer code relies on, in the order they are added.
+# database_setup.sql / database_empty_setup.sql create all of them already.
+COLUMNS = [
+    ('students', 'last_updated', "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+    ('security_audit_log', 'user_agent', "TEXT"),
+    ('security_audit_log', 'risk_level', "ENUM('low', 'medium', 'high', 'critical') DEFAULT 'low'"),
+    ('security_audit_log', 'category', "VARCHAR(32)")
+]
+INDEXES = [
+    ('students', 'idx_last_updated', "(last_updated)"),
+    ('security_audit_log', 'idx_risk_level', "(risk_level)"),
+    ('security_audit_log', 'idx_category', "(category)")
+]
+TABLES = [
+    ('security_audit_keywords', """
+        CREATE TABLE IF NOT EXISTS security_audit_keywords (
+            keyword VARCHAR(64) NOT NULL,
+            log_id INT NOT NULL,
+            PRIMARY KEY (keyword, log_id),
+            INDEX idx_log_id (log_id),
+            FOREIGN KEY (log_id) REFERENCES security_audit_log(log_id) ON DELETE CASCADE
+        )
+    """)
+]
+
+# Another worker applied the same step between our check and our ALTER
+_ALREADY_APPLIED = (errorcode.ER_DUP_FIELDNAME, errorcode.ER_DUP_KEYNAME, errorcode.ER_TABLE_EXISTS_ERROR)
+
+def pending_migrations(cursor):
+    """``(description, statement)`` for every step this database still needs"""
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+    """)
+    columns = {tuple(row) for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+    """)
+    indexes = {tuple(row) for row in cursor.fetchall()}
+    tables = {table for table, _ in columns}
+
+    pending = []
+    for table, column, definition in COLUMNS:
+        if table in tables and (table, column) not in columns:
+            pending.append((f"add {table}.{column}", f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    for table, index, key in INDEXES:
+        if table in tables and (table, index) not in indexes:
+            pending.append((f"add index {table}.{index}", f"ALTER TABLE {table} ADD INDEX {index} {key}"))
+    for table, statement in TABLES:
+        if tables and table not in tables:
+            pending.append((f"create table {table}", statement))
+    return pending
+
+def migrate(conn, lock_timeout=60):
+    """Apply the pending steps; returns the descriptions of those applied.
+
+    A named lock keeps workers starting together from running the same
+    ALTERs side by side, and a step another process got to first is
+    skipped. If the lock is not granted within ``lock_timeout`` seconds
+    nothing is altered and ``OperationalError`` is raised. Tables missing
+    altogether are left for the setup scripts.
+    """
+    cursor = conn.cursor()
+    applied = []
+    try:
+        cursor.execute("SELECT GET_LOCK('smartscan_schema_migrations', %s) AS granted", (lock_timeout,))
+        rows = cursor.fetchall()
+        granted = (rows[0]['granted'] if isinstance(rows[0], dict) else rows[0][0]) if rows else None
+        if granted != 1:
+            # 0: another process held it the whole time, NULL: the server refused it
+            raise mysql.connector.errors.OperationalError(
+                f"Schema migration lock not granted within {lock_timeout}s")
+        try:
+            for description, statement in pending_migrations(cursor):
+                try:
+                    cursor.execute(statement)
+                except mysql.connector.Error as err:
+                    if err.errno not in _ALREADY_APPLIED:
+                        raise
+                    continue
+                applied.append(description)
+                logger.info(f"Schema migration applied: {description}")
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('smartscan_schema_migrations')")
+            cursor.fetchall()
+    finally:
+        cursor.close()
+    return applied
+
+def run_migrations(db_config):
+    """Migrate the database in ``db_config``; False if it could not be reached or upgraded"""
+    try:
+        conn = mysql.connector.connect(**db_config)
+    except mysql.connector.Error as err:
+        logger.error(f"Schema migrations skipped, database unavailable: {err}")
+        return False
+    try:
+        migrate(conn)
+        return True
+    except mysql.connector.Error as err:
+        logger.error(f"Schema migration failed: {err}")
+        return False
+    finally:
+        conn.close()
+
+_migrated = False
+_next_attempt = 0.0
+_migrate_lock = threading.Lock()
+
+def ensure_migrated(db_config, retry_interval=60):
+    """Run ``run_migrations()`` once per process, retrying every ``retry_interval`` seconds until it succeeds.
+
+    Called from a request hook rather than at import, so command line tools
+    that import the app do not alter tables and no worker blocks on the
+    migration lock before it serves anything.
+    """
+    global _migrated, _next_attempt
+    if _migrated:
+        return True
+    with _migrate_lock:
+        if not _migrated and time.monotonic() >= _next_attempt:
+            _migrated = run_migrations(db_config)
+            _next_attempt = time.monotonic() + retry_interval
+    return _migrated
@@ -0,0 +1,151 @@
+# Micro-batching Scoring Queue for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Coalesces concurrent anomaly-scoring requests into vectorised model calls
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class AnomalyScoringBatcher:
+    """Queue in front of ``SecurityAIEngine.detect_anomalies``.
+
+    Request threads call ``score()``; their feature dicts are queued and a
+    single worker thread flushes them through one vectorised model call as
+    soon as ``max_batch_size`` items are waiting or the oldest item has
+    waited ``max_wait_ms``. Each caller then gets its own result back.
+    Batching only pays off when several request threads score at once
+    (threaded or async workers); with one request at a time a batch is
+    flushed after at most ``max_wait_ms``.
+    """
+
+    def __init__(self, engine_provider, max_batch_size=64, max_wait_ms=3,
+                 max_queue_size=10000, result_timeout=1.0):
+        self.engine_provider = engine_provider
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.result_timeout = result_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'batches': 0,
+            'items': 0,
+            'max_batch': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'total_score_ms': 0.0,
+            'queue_full_fallbacks': 0,
+            'errors': 0
+        }
+
+    def submit(self, access_data):
+        """Queue one access for scoring and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((access_data, future, time.perf_counter()))
+        except queue.Full:
+            # Never make a scan wait on a saturated queue; score it inline
+            with self._metrics_lock:
+                self._metrics['queue_full_fallbacks'] += 1
+            future.set_result(self.engine_provider().detect_anomaly(access_data))
+        return future
+
+    def score(self, access_data):
+        """Score one access through the batcher, blocking until it is done"""
+        return self.submit(access_data).result(timeout=self.result_timeout)
+
+    def stop(self, timeout=1.0):
+        """Stop the worker after it drains what is already queued"""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def metrics(self):
+        """Batch-fill and wait-time metrics"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        batches = m['batches'] or 1
+        return {
+            'batches': m['batches'],
+            'items': m['items'],
+            'queued': self._queue.qsize(),
+            'avg_batch_size': round(m['items'] / batches, 2),
+            'max_batch_size_seen': m['max_batch'],
+            'avg_batch_fill_pct': round(100.0 * m['items'] / batches / self.max_batch_size, 1),
+            'avg_wait_ms': round(m['total_wait_ms'] / (m['items'] or 1), 3),
+            'max_wait_ms': round(m['max_wait_ms'], 3),
+            'avg_score_ms_per_batch': round(m['total_score_ms'] / batches, 3),
+            'queue_full_fallbacks': m['queue_full_fallbacks'],
+            'errors': m['errors'],
+            'config': {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms
+            }
+        }
+
+    def _ensure_worker(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                # Load the engine here so the first results don't time out on model loading
+                self.engine_provider()
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='anomaly-scoring-batcher', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = first[2] + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        flushed_at = time.perf_counter()
+        try:
+            engine = self.engine_provider()
+            results = engine.split_anomaly_results(engine.detect_anomalies([item[0] for item in batch]))
+            score_ms = (time.perf_counter() - flushed_at) * 1000
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            logger.error(f"Batched anomaly scoring failed: {e}")
+            score_ms = (time.perf_counter() - flushed_at) * 1000
+            with self._metrics_lock:
+                self._metrics['errors'] += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+        waits = [(flushed_at - enqueued_at) * 1000 for _, _, enqueued_at in batch]
+        with self._metrics_lock:
+            m = self._metrics
+            m['batches'] += 1
+            m['items'] += len(batch)
+            m['max_batch'] = max(m['max_batch'], len(batch))
+            m['total_wait_ms'] += sum(waits)
+            m['max_wait_ms'] = max(m['max_wait_ms'], max(waits))
+            m['total_score_ms'] += score_ms
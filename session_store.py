@@ -0,0 +1,402 @@
+# Session and Lockout Store for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Pluggable backends for SecurityManager's sessions and failed login attempts
+
+import os
+import json
+import time
+import sqlite3
+import secrets
+import threading
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+class FailedAttemptTracker:
+    """Sliding-window failure counts in fixed memory.
+
+    Each identifier keeps a ring of its last ``attempts_per_key`` failure
+    times, so counting the attempts inside a window reads at most that many
+    floats and counts saturate at ``attempts_per_key``. Identifiers are
+    kept in order of their latest failure: at most ``max_keys`` are held
+    (the longest idle ones are evicted first, which a credential-stuffing
+    run with random usernames cannot push an account it keeps hitting out
+    of), and a daemon thread drops those with no failure inside the longest
+    window seen every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, max_keys=100000, attempts_per_key=10, sweep_interval=30):
+        self.max_keys = max_keys
+        self.attempts_per_key = attempts_per_key
+        self.sweep_interval = sweep_interval
+        self._rings = OrderedDict()  # identifier -> deque of timestamps, least recent failure first
+        self._retention = 0.0
+        self._lock = threading.Lock()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats = {'recorded': 0, 'evicted': 0, 'expired': 0, 'sweeps': 0}
+
+    def add(self, identifier, window):
+        """Record a failure; returns the failures inside ``window`` seconds"""
+        self._ensure_worker()
+        now = time.time()
+        with self._lock:
+            self._retention = max(self._retention, window)
+            ring = self._rings.get(identifier)
+            if ring is None:
+                if len(self._rings) >= self.max_keys:
+                    self._rings.popitem(last=False)
+                    self._stats['evicted'] += 1
+                ring = self._rings[identifier] = deque(maxlen=self.attempts_per_key)
+            else:
+                self._rings.move_to_end(identifier)
+            ring.append(now)
+            self._stats['recorded'] += 1
+            return self._count_locked(ring, now - window)
+
+    def count(self, identifier, window):
+        with self._lock:
+            ring = self._rings.get(identifier)
+            return self._count_locked(ring, time.time() - window) if ring else 0
+
+    def clear(self, identifier):
+        with self._lock:
+            self._rings.pop(identifier, None)
+
+    def sweep(self):
+        """Drop identifiers whose latest failure is older than every window"""
+        cutoff = time.time() - self._retention
+        expired = 0
+        with self._lock:
+            # Ordered by latest failure, so stop at the first live one
+            while self._rings:
+                identifier, ring = next(iter(self._rings.items()))
+                if ring[-1] > cutoff:
+                    break
+                del self._rings[identifier]
+                expired += 1
+            self._stats['expired'] += expired
+            self._stats['sweeps'] += 1
+        return expired
+
+    def stats(self):
+        """Tracked identifiers and eviction counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'identifiers': len(self._rings),
+                'max_identifiers': self.max_keys,
+                'attempts_per_identifier': self.attempts_per_key
+            })
+        return stats
+
+    @staticmethod
+    def _count_locked(ring, since):
+        count = 0
+        for ts in reversed(ring):
+            if ts <= since:
+                break
+            count += 1
+        return count
+
+    def _ensure_worker(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='failed-attempt-sweeper', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Failed attempt sweep error: {e}")
+
+class MemorySessionStore:
+    """Sessions and failed attempts in this process only.
+
+    Fine for a single worker; with several, a token issued by one is not
+    known to the others. Sessions have a TTL and expired ones are dropped
+    as they are read; failed attempts go to a ``FailedAttemptTracker``.
+    """
+
+    def __init__(self, max_attempt_keys=100000, attempts_per_key=10, sweep_interval=30):
+        self._sessions = {}  # user_id -> (data, expires_at)
+        self._attempts = FailedAttemptTracker(max_attempt_keys, attempts_per_key, sweep_interval)
+        self._lock = threading.Lock()
+
+    def put_session(self, user_id, data, ttl):
+        with self._lock:
+            self._sessions[str(user_id)] = (dict(data), time.time() + ttl)
+
+    def get_session(self, user_id):
+        """Session data, or None if there is none or it expired"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._sessions[key]
+                return None
+            return dict(entry[0])
+
+    def touch_session(self, user_id, ttl, **updates):
+        """Extend a live session and update fields; False if it is gone"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None or entry[1] <= time.time():
+                return False
+            self._sessions[key] = (dict(entry[0], **updates), time.time() + ttl)
+            return True
+
+    def delete_session(self, user_id):
+        with self._lock:
+            self._sessions.pop(str(user_id), None)
+
+    def add_attempt(self, identifier, window):
+        """Record a failed attempt; returns the attempts inside ``window`` seconds"""
+        return self._attempts.add(identifier, window)
+
+    def count_attempts(self, identifier, window):
+        return self._attempts.count(identifier, window)
+
+    def clear_attempts(self, identifier):
+        self._attempts.clear(identifier)
+
+    def attempt_stats(self):
+        return self._attempts.stats()
+
+class SQLiteSessionStore:
+    """Sessions and failed attempts in a SQLite file shared by every worker.
+
+    All gunicorn workers on a node open the same file (WAL mode, so
+    readers do not block the writer), which makes tokens and lockouts valid
+    across processes without sticky sessions. Rows carry an expiry time and
+    reads ignore expired rows.
+
+    Failed attempts are bounded the way ``FailedAttemptTracker`` bounds
+    them: each identifier keeps only its newest ``attempts_per_key`` rows,
+    so a count reads at most that many index entries, and
+    ``failed_attempt_keys`` orders identifiers by their latest failure. A
+    daemon thread purges every ``purge_interval`` seconds: expired
+    sessions, identifiers idle for ``attempt_retention`` seconds, then the
+    least recently failed identifiers beyond ``max_attempt_keys``, so a
+    username spray cannot evict an account it keeps hitting.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS failed_attempts (
+            identifier TEXT NOT NULL,
+            attempted_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_failed_attempts ON failed_attempts (identifier, attempted_at);
+        CREATE TABLE IF NOT EXISTS failed_attempt_keys (
+            identifier TEXT PRIMARY KEY,
+            last_attempt REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_failed_attempt_keys ON failed_attempt_keys (last_attempt);
+    """
+
+    def __init__(self, path='instance/sessions.db', purge_interval=60, timeout=5.0, attempt_retention=86400,
+                 max_attempt_keys=100000, attempts_per_key=10):
+        self.path = path
+        self.purge_interval = purge_interval
+        self.timeout = timeout
+        self.attempt_retention = attempt_retention
+        self.max_attempt_keys = max_attempt_keys
+        self.attempts_per_key = attempts_per_key
+        self._local = threading.local()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats = {'evicted': 0, 'expired': 0, 'purges': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        with conn:
+            if conn.execute("SELECT 1 FROM failed_attempt_keys LIMIT 1").fetchone() is None:
+                # Attempts recorded before identifiers were tracked
+                conn.execute("INSERT OR IGNORE INTO failed_attempt_keys (identifier, last_attempt) "
+                             "SELECT identifier, MAX(attempted_at) FROM failed_attempts GROUP BY identifier")
+
+    def put_session(self, user_id, data, ttl):
+        self._ensure_worker()
+        self._execute("INSERT OR REPLACE INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)",
+                      (str(user_id), json.dumps(data, default=str), time.time() + ttl))
+
+    def get_session(self, user_id):
+        """Session data, or None if there is none or it expired"""
+        row = self._execute("SELECT data FROM sessions WHERE user_id = ? AND expires_at > ?",
+                            (str(user_id), time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def touch_session(self, user_id, ttl, **updates):
+        """Extend a live session and update fields; False if it is gone"""
+        now = time.time()
+        data, params = 'data', []
+        for field, value in updates.items():
+            # One UPDATE, so two workers touching the same session cannot interleave
+            data = f"json_set({data}, ?, json(?))"
+            params += [f'$.{field}', json.dumps(value, default=str)]
+        cursor = self._execute(f"UPDATE sessions SET data = {data}, expires_at = ? "
+                               f"WHERE user_id = ? AND expires_at > ?",
+                               params + [now + ttl, str(user_id), now])
+        return cursor.rowcount > 0
+
+    def delete_session(self, user_id):
+        self._execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+
+    def add_attempt(self, identifier, window):
+        """Record a failed attempt; returns the attempts inside ``window`` seconds"""
+        self._ensure_worker()
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT INTO failed_attempts (identifier, attempted_at) VALUES (?, ?)",
+                         (identifier, now))
+            conn.execute("INSERT OR REPLACE INTO failed_attempt_keys (identifier, last_attempt) VALUES (?, ?)",
+                         (identifier, now))
+            # Only this identifier's newest rows are kept
+            conn.execute("""
+                DELETE FROM failed_attempts WHERE identifier = ? AND rowid NOT IN (
+                    SELECT rowid FROM failed_attempts WHERE identifier = ?
+                    ORDER BY attempted_at DESC LIMIT ?)
+            """, (identifier, identifier, self.attempts_per_key))
+            count = self._count(conn, identifier, now - window)
+        return count
+
+    def count_attempts(self, identifier, window):
+        return self._count(self._connection(), identifier, time.time() - window)
+
+    def clear_attempts(self, identifier):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM failed_attempts WHERE identifier = ?", (identifier,))
+            conn.execute("DELETE FROM failed_attempt_keys WHERE identifier = ?", (identifier,))
+
+    def attempt_stats(self):
+        stats = dict(self._stats)
+        stats.update({
+            'identifiers': self._execute("SELECT COUNT(*) FROM failed_attempt_keys").fetchone()[0],
+            'max_identifiers': self.max_attempt_keys,
+            'attempts_per_identifier': self.attempts_per_key
+        })
+        return stats
+
+    def purge(self):
+        """Delete expired sessions and idle or excess failed-attempt identifiers"""
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            expired = self._drop_keys(conn, "SELECT identifier FROM failed_attempt_keys WHERE last_attempt <= ?",
+                                      (now - self.attempt_retention,))
+            excess = conn.execute("SELECT COUNT(*) FROM failed_attempt_keys").fetchone()[0] - self.max_attempt_keys
+            evicted = 0
+            if excess > 0:
+                evicted = self._drop_keys(conn, "SELECT identifier FROM failed_attempt_keys "
+                                                "ORDER BY last_attempt LIMIT ?", (excess,))
+        self._stats['expired'] += expired
+        self._stats['evicted'] += evicted
+        self._stats['purges'] += 1
+
+    @staticmethod
+    def _drop_keys(conn, select, params):
+        """Delete the identifiers ``select`` returns with their attempts; returns how many"""
+        conn.execute(f"DELETE FROM failed_attempts WHERE identifier IN ({select})", params)
+        return conn.execute(f"DELETE FROM failed_attempt_keys WHERE identifier IN ({select})", params).rowcount
+
+    @staticmethod
+    def _count(conn, identifier, since):
+        return conn.execute("SELECT COUNT(*) FROM failed_attempts WHERE identifier = ? AND attempted_at > ?",
+                            (identifier, since)).fetchone()[0]
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _execute(self, query, params=()):
+        return self._connection().execute(query, params)
+
+    def _ensure_worker(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='session-store-purge', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                self.purge()
+            except sqlite3.Error as e:
+                logger.warning(f"Session store purge failed: {e}")
+
+def create_session_store(backend='memory', **options):
+    """Build the session store named by ``backend`` ('memory' or 'sqlite')
+
+    ``options`` are passed to that backend's constructor.
+    """
+    if backend == 'memory':
+        return MemorySessionStore(**options)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(**options)
+    raise ValueError(f"Unknown session store backend: {backend}")
+
+def session_store_from_config(config):
+    """Build the store named by ``config['backend']`` with that backend's section of ``config``"""
+    backend = config.get('backend', 'memory')
+    return create_session_store(backend, **config.get(backend, {}))
+
+def load_secret_key(path, env_var='SMARTSCAN_SECRET_KEY'):
+    """Signing secret shared by every worker: ``env_var`` if set, else the key file.
+
+    The file is created with a random key the first time (mode 0600). The
+    exclusive create means concurrently starting workers all end up with
+    the key of whichever wrote it first.
+    """
+    if os.environ.get(env_var):
+        return os.environ[env_var]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        logger.info(f"Generated a new secret key in {path}")
+
+    # A worker that lost the race may read before the winner has written
+    for _ in range(50):
+        with open(path) as f:
+            key = f.read().strip()
+        if key:
+            return key
+        time.sleep(0.01)
+    raise RuntimeError(f"Secret key file {path} is empty")
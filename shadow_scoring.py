@@ -0,0 +1,170 @@
+# Shadow Scoring for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Scores live traffic with a candidate model off the request path and reports how it differs
+
+import queue
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class ShadowScorer:
+    """Runs a candidate ``SecurityAIEngine`` beside the live one.
+
+    ``SecurityAIEngine.detect_anomalies()`` hands every scored batch - the
+    access dicts, the live results and how long the live call took - to
+    ``submit()``, which only does a non-blocking queue put (batches are
+    dropped, and counted, if the queue is full). A daemon thread scores
+    the same batches with the candidate and records where the two models
+    disagree. ``report()`` compares anomaly rates, score distributions
+    (over the last ``sample_size`` accesses) and per-access latency.
+    """
+
+    def __init__(self, candidate, source=None, max_queue_size=1000, sample_size=5000,
+                 max_disagreements=100):
+        self.candidate = candidate
+        self.source = source
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._scores = deque(maxlen=sample_size)  # (live score, candidate score)
+        self._disagreements = deque(maxlen=max_disagreements)
+        self._started_at = datetime.now().isoformat()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'batches': 0,
+            'accesses': 0,
+            'dropped_batches': 0,
+            'live_anomalies': 0,
+            'candidate_anomalies': 0,
+            'live_only': 0,
+            'candidate_only': 0,
+            'live_ms': 0.0,
+            'candidate_ms': 0.0,
+            'errors': 0
+        }
+
+    def submit(self, batch, live_results, live_ms):
+        """Queue a batch the live model scored; never blocks"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((batch, live_results, live_ms))
+        except queue.Full:
+            with self._metrics_lock:
+                self._metrics['dropped_batches'] += 1
+
+    def stop(self, timeout=1.0):
+        """Stop the worker after it drains what is already queued"""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def report(self):
+        """How the candidate compares with the live model so far"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+            scores = np.array(self._scores, dtype=float).reshape(-1, 2)
+            disagreements = list(self._disagreements)
+        accesses = m['accesses'] or 1
+        bins = np.linspace(-0.5, 0.5, 21)
+        return {
+            'source': self.source,
+            'started_at': self._started_at,
+            'batches': m['batches'],
+            'accesses': m['accesses'],
+            'queued': self._queue.qsize(),
+            'dropped_batches': m['dropped_batches'],
+            'errors': m['errors'],
+            'live': self._model_summary(scores[:, 0], m['live_anomalies'], accesses, m['live_ms'], bins),
+            'candidate': self._model_summary(scores[:, 1], m['candidate_anomalies'], accesses,
+                                             m['candidate_ms'], bins),
+            'histogram_bins': [round(float(edge), 2) for edge in bins],
+            'disagreements': {
+                'total': m['live_only'] + m['candidate_only'],
+                'rate': round((m['live_only'] + m['candidate_only']) / accesses, 4),
+                'live_only': m['live_only'],
+                'candidate_only': m['candidate_only'],
+                'recent': disagreements
+            },
+            'added_latency_ms_per_access': round((m['candidate_ms'] - m['live_ms']) / accesses, 4),
+            'score_correlation': (round(float(np.corrcoef(scores[:, 0], scores[:, 1])[0, 1]), 4)
+                                  if len(scores) > 1 and scores.std(axis=0).all() else None)
+        }
+
+    @staticmethod
+    def _model_summary(scores, anomalies, accesses, total_ms, bins):
+        summary = {
+            'anomaly_rate': round(anomalies / accesses, 4),
+            'ms_per_access': round(total_ms / accesses, 4)
+        }
+        if len(scores):
+            p5, p50, p95 = np.percentile(scores, [5, 50, 95])
+            summary.update({
+                'mean_score': round(float(scores.mean()), 4),
+                'p5_score': round(float(p5), 4),
+                'p50_score': round(float(p50), 4),
+                'p95_score': round(float(p95), 4),
+                'histogram': np.histogram(np.clip(scores, bins[0], bins[-1]), bins)[0].tolist()
+            })
+        return summary
+
+    def _ensure_worker(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='shadow-scoring', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch, live, live_ms = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                started = time.perf_counter()
+                shadow = self.candidate.detect_anomalies(batch)
+                candidate_ms = (time.perf_counter() - started) * 1000
+                self._compare(batch, live, live_ms, shadow, candidate_ms)
+            except Exception as e:
+                logger.error(f"Shadow scoring error: {e}")
+                with self._metrics_lock:
+                    self._metrics['errors'] += 1
+
+    def _compare(self, batch, live, live_ms, shadow, candidate_ms):
+        live_flags = np.asarray(live['is_anomaly'], dtype=bool)
+        shadow_flags = np.asarray(shadow['is_anomaly'], dtype=bool)
+        live_scores = np.asarray(live['anomaly_score'], dtype=float)
+        shadow_scores = np.asarray(shadow['anomaly_score'], dtype=float)
+        differ = np.flatnonzero(live_flags != shadow_flags)
+
+        with self._metrics_lock:
+            m = self._metrics
+            m['batches'] += 1
+            m['accesses'] += len(batch)
+            m['live_anomalies'] += int(live_flags.sum())
+            m['candidate_anomalies'] += int(shadow_flags.sum())
+            m['live_only'] += int((live_flags & ~shadow_flags).sum())
+            m['candidate_only'] += int((shadow_flags & ~live_flags).sum())
+            m['live_ms'] += live_ms
+            m['candidate_ms'] += candidate_ms
+            self._scores.extend(zip(live_scores.tolist(), shadow_scores.tolist()))
+            for index in differ:
+                access_data = batch[index]
+                self._disagreements.append({
+                    'at': datetime.now().isoformat(),
+                    'student_id': access_data.get('student_id'),
+                    'location_id': access_data.get('location_id'),
+                    'features': self.candidate._access_feature_matrix([access_data])[0].tolist(),
+                    'live': {'is_anomaly': bool(live_flags[index]), 'score': round(float(live_scores[index]), 4)},
+                    'candidate': {'is_anomaly': bool(shadow_flags[index]),
+                                  'score': round(float(shadow_scores[index]), 4)}
+                })
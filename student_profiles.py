@@ -0,0 +1,262 @@
+# Student Baseline Profiles for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# Per-student behavioural baselines kept in NumPy arrays by a background aggregator
+
+import math
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+
+class StudentProfileStore:
+    """What is normal for each student, answered in O(1) per scan.
+
+    Every student owns one row of a set of NumPy arrays:
+
+    * an hour-of-week histogram (168 counters, Monday 00:00 first);
+    * their ``top_locations`` most used locations, kept with the
+      space-saving heavy-hitters algorithm so the row never grows;
+    * a running mean/variance of log(minutes between accesses).
+
+    A daemon thread folds in ``access_logs`` rows by ``log_id``: first the
+    last ``lookback_days`` of history, then whatever was written since, every
+    ``refresh_interval`` seconds. Scans never query history for it;
+    ``deviation()`` reads one row. Profiles with fewer than ``min_accesses``
+    accesses are not established and are not scored.
+    """
+
+    # Share of the deviation score from the hour, location and gap checks
+    WEIGHTS = {'hour': 0.4, 'location': 0.4, 'gap': 0.2}
+
+    def __init__(self, connection_factory, lookback_days=30, refresh_interval=10,
+                 min_accesses=20, top_locations=8, chunk_size=5000, initial_capacity=1024):
+        self.connection_factory = connection_factory
+        self.lookback_days = lookback_days
+        self.refresh_interval = refresh_interval
+        self.min_accesses = min_accesses
+        self.top_locations = top_locations
+        self.chunk_size = chunk_size
+        self._rows = {}  # student_id -> row in the arrays
+        self._allocate(initial_capacity)
+        self._max_log_id = None
+        self._warm = False
+        self._lock = threading.Lock()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats = {'rows_folded': 0, 'refreshes': 0, 'last_refresh_ms': None, 'errors': 0}
+
+    @property
+    def is_warm(self):
+        return self._warm
+
+    def init_app(self, app):
+        """Start the aggregator with the first request of each worker"""
+        app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        # Started lazily so forked worker processes each get their own thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='student-profiles', daemon=True)
+                self._worker.start()
+
+    def deviation(self, student_id, location_id, when=None):
+        """How far an access departs from the student's baseline.
+
+        Returns None until the profile is established, otherwise a dict with
+        'score' (0 = typical, 1 = nothing like their history), the 'hour',
+        'location' and 'gap' parts and human-readable 'factors'.
+        """
+        when = when or datetime.now()
+        location_id = _location_key(location_id)
+        with self._lock:
+            row = self._rows.get(student_id)
+            if row is None or self._totals[row] < self.min_accesses:
+                return None
+            hours = self._hour_counts[row]
+            slot = when.weekday() * 24 + when.hour
+            # Neighbouring hours count half, so 08:55 vs 09:05 is not a surprise
+            nearby = hours[slot] + 0.5 * (hours[slot - 1] + hours[(slot + 1) % HOURS_PER_WEEK])
+            peak = hours.max()
+            matches = self._location_ids[row] == location_id
+            location_count = float(self._location_counts[row][matches].sum())
+            top_count = float(self._location_counts[row].max())
+            last_access = self._last_access[row]
+            gap_n = int(self._gap_n[row])
+            gap_mean = self._gap_mean[row]
+            gap_std = math.sqrt(self._gap_m2[row] / (gap_n - 1)) if gap_n > 1 else 0.0
+
+        hour_part = 1.0 - min(1.0, float(nearby / peak)) if peak else 0.0
+        location_part = 1.0 - min(1.0, location_count / top_count) if top_count else 0.0
+        gap_part = 0.0
+        minutes = (when.timestamp() - last_access) / 60
+        if gap_n > 1 and minutes >= 0:
+            # Only unusually short gaps matter: a long absence is not suspicious
+            z = (math.log1p(minutes) - gap_mean) / max(gap_std, 0.25)
+            gap_part = min(1.0, max(0.0, -z / 3))
+
+        factors = []
+        if hour_part >= 0.9:
+            factors.append(f"unusual time for this student ({when.strftime('%a')} {when.hour}:00)")
+        if location_part >= 0.9:
+            factors.append("location outside this student's usual places")
+        if gap_part >= 0.5:
+            factors.append(f"much sooner after the previous access than usual ({int(minutes)} min)")
+
+        return {
+            'score': round(self.WEIGHTS['hour'] * hour_part + self.WEIGHTS['location'] * location_part +
+                           self.WEIGHTS['gap'] * gap_part, 4),
+            'hour': round(hour_part, 4),
+            'location': round(location_part, 4),
+            'gap': round(gap_part, 4),
+            'factors': factors
+        }
+
+    def fold(self, rows):
+        """Add access_logs rows (log_id order) to the profiles"""
+        with self._lock:
+            for row in rows:
+                student_id, access_time = row['student_id'], row['access_time']
+                if student_id and access_time is not None:
+                    self._fold_locked(student_id, _location_key(row['location_id']), access_time)
+                if self._max_log_id is None or row['log_id'] > self._max_log_id:
+                    self._max_log_id = row['log_id']
+        self._stats['rows_folded'] += len(rows)
+
+    def refresh(self, cursor):
+        """Fold in rows written since the last refresh (the lookback window first time round)"""
+        started = time.perf_counter()
+        if self._max_log_id is None:
+            cursor.execute("SELECT MIN(log_id) AS first_id FROM access_logs WHERE access_time >= %s",
+                           (datetime.now() - timedelta(days=self.lookback_days),))
+            first_id = cursor.fetchone()['first_id']
+            if first_id is None:
+                # Nothing inside the lookback: start from the newest row
+                cursor.execute("SELECT COALESCE(MAX(log_id), 0) AS max_log_id FROM access_logs")
+                start_id = cursor.fetchone()['max_log_id']
+            else:
+                start_id = first_id - 1
+            with self._lock:
+                self._max_log_id = start_id
+
+        while True:
+            cursor.execute("""
+                SELECT log_id, student_id, location_id, access_time
+                FROM access_logs
+                WHERE log_id > %s
+                ORDER BY log_id
+                LIMIT %s
+            """, (self._max_log_id, self.chunk_size))
+            rows = cursor.fetchall()
+            self.fold(rows)
+            if len(rows) < self.chunk_size:
+                break
+
+        if not self._warm:
+            logger.info(f"Student profiles built for {len(self._rows)} students "
+                        f"({self._stats['rows_folded']} accesses)")
+        self._warm = True
+        self._stats['refreshes'] += 1
+        self._stats['last_refresh_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    def stats(self):
+        """Profile counts, memory and aggregator progress"""
+        with self._lock:
+            established = int((self._totals[:len(self._rows)] >= self.min_accesses).sum())
+            memory = sum(array.nbytes for array in self._arrays())
+        stats = dict(self._stats)
+        stats.update({
+            'warm': self._warm,
+            'students': len(self._rows),
+            'established': established,
+            'max_log_id': self._max_log_id,
+            'memory_kb': round(memory / 1024, 1)
+        })
+        return stats
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = self.connection_factory()
+                if conn is not None:
+                    cursor = conn.cursor(dictionary=True)
+                    self.refresh(cursor)
+                    cursor.close()
+            except mysql.connector.Error as err:
+                self._stats['errors'] += 1
+                logger.error(f"Student profile refresh failed: {err}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(self.refresh_interval)
+
+    def _fold_locked(self, student_id, location_id, access_time):
+        row = self._rows.get(student_id)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self._totals):
+                self._grow()
+            self._rows[student_id] = row
+
+        self._hour_counts[row, access_time.weekday() * 24 + access_time.hour] += 1
+        self._totals[row] += 1
+
+        ts = access_time.timestamp()
+        last_access = self._last_access[row]
+        if ts > last_access:
+            if last_access > 0:
+                # Welford's running mean/variance of log(1 + minutes)
+                x = math.log1p((ts - last_access) / 60)
+                n = self._gap_n[row] + 1
+                delta = x - self._gap_mean[row]
+                self._gap_mean[row] += delta / n
+                self._gap_m2[row] += delta * (x - self._gap_mean[row])
+                self._gap_n[row] = n
+            self._last_access[row] = ts
+
+        # Space-saving top-k: a new location takes over the least used slot
+        ids, counts = self._location_ids[row], self._location_counts[row]
+        matches = np.flatnonzero(ids == location_id)
+        if len(matches):
+            counts[matches[0]] += 1
+        else:
+            slot = int(counts.argmin())
+            ids[slot] = location_id
+            counts[slot] += 1
+
+    def _allocate(self, capacity):
+        self._hour_counts = np.zeros((capacity, HOURS_PER_WEEK), dtype=np.uint32)
+        self._totals = np.zeros(capacity, dtype=np.uint32)
+        self._location_ids = np.full((capacity, self.top_locations), -1, dtype=np.int64)
+        self._location_counts = np.zeros((capacity, self.top_locations), dtype=np.float32)
+        self._last_access = np.zeros(capacity)
+        self._gap_n = np.zeros(capacity, dtype=np.uint32)
+        self._gap_mean = np.zeros(capacity)
+        self._gap_m2 = np.zeros(capacity)
+
+    def _arrays(self):
+        return (self._hour_counts, self._totals, self._location_ids, self._location_counts,
+                self._last_access, self._gap_n, self._gap_mean, self._gap_m2)
+
+    def _grow(self):
+        """Double the capacity, keeping every existing row"""
+        old = self._arrays()
+        self._allocate(len(self._totals) * 2)
+        for new_array, old_array in zip(self._arrays(), old):
+            new_array[:len(old_array)] = old_array
+
+def _location_key(location_id):
+    # Scans pass location ids as strings; the arrays hold integers
+    try:
+        return int(location_id)
+    except (TypeError, ValueError):
+        return -2
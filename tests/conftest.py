@@ -0,0 +1,102 @@
+# Test fixtures for Smart Campus Security System
+# St. Lawrence University - Cybersecurity Club
+# In-memory stand-ins for MySQL connections
+
+import os
+import sys
+import threading
+import pytest
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class FakeCursor:
+    """Records statements; INSERTs hand out consecutive ids like InnoDB"""
+
+    def __init__(self, conn, dictionary=False, **kwargs):
+        self.conn = conn
+        self.dictionary = dictionary
+        self.lastrowid = None
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        self.conn.statements.append((query, params))
+        self._rows = []
+        if query.startswith('INSERT'):
+            rows = query.count('), (') + 1
+            with self.conn.server.lock:
+                self.lastrowid = self.conn.server.next_id
+                self.conn.server.next_id += rows
+            self.rowcount = rows
+        elif '@@auto_increment_increment' in query:
+            self._rows = [(1,)]
+        else:
+            self._rows = list(self.conn.server.results.get(query.split(' FROM ')[0], []))
+
+    def executemany(self, query, seq):
+        for params in seq:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.statements = []
+        self.in_transaction = False
+        self.commits = 0
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self, **kwargs)
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        self.in_transaction = False
+        self.commits += 1
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        pass
+
+class FakeServer:
+    """What ``mysql.connector.connect`` returns connections to during a test"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.connections = []
+        self.results = {}  # SELECT clause -> rows returned for it
+
+    def connect(self, **kwargs):
+        conn = FakeConnection(self)
+        self.connections.append(conn)
+        return conn
+
+    def statements(self, prefix=''):
+        return [query for conn in self.connections for query, _ in conn.statements if query.startswith(prefix)]
+
+@pytest.fixture
+def fake_mysql(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(mysql.connector, 'connect', server.connect)
+    return server
@@ -0,0 +1,51 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from mysql.connector import errors
+import db_pool
+from access_ingest import AccessLogIngestor
+
+ACCESS_LOG = ('S1', 'C1', 1, 'entry', None, True, None, '127.0.0.1', 'test', 0.1, False)
+RISK_ROW = ('S1', 1, None, 0.1, 'low', '[]', 'allowed')
+
+def test_flush_succeeds_while_request_pool_is_saturated(fake_mysql):
+    request_pool = db_pool.ConnectionPool({}, pool_size=4, checkout_timeout=0.5)
+    background_pool = db_pool.ConnectionPool({}, pool_size=1, checkout_timeout=0.5)
+    ingestor = AccessLogIngestor(lambda: db_pool.PooledConnection(background_pool, background_pool.acquire()),
+                                 result_timeout=2.0)
+    held = [request_pool.acquire() for _ in range(request_pool.pool_size)]
+    try:
+        # Every request connection is checked out by a scan now waiting on its flush
+        with pytest.raises(errors.PoolError):
+            request_pool.acquire()
+        with ThreadPoolExecutor(max_workers=len(held)) as executor:
+            log_ids = list(executor.map(lambda _: ingestor.log(ACCESS_LOG, RISK_ROW), held))
+    finally:
+        for entry in held:
+            request_pool.release(entry)
+        ingestor.stop()
+
+    assert len(set(log_ids)) == len(held)
+    assert ingestor.metrics()['errors'] == 0
+
+def test_flush_fails_futures_when_no_connection():
+    ingestor = AccessLogIngestor(lambda: None, result_timeout=2.0)
+    try:
+        with pytest.raises(errors.InterfaceError):
+            ingestor.log(ACCESS_LOG, RISK_ROW)
+        # The flusher survived and still answers
+        with pytest.raises(errors.InterfaceError):
+            ingestor.log(ACCESS_LOG, RISK_ROW)
+    finally:
+        ingestor.stop()
+    assert ingestor.metrics()['errors'] == 2
+
+def test_flush_fails_futures_on_unexpected_errors():
+    def broken_factory():
+        raise RuntimeError("boom")
+
+    ingestor = AccessLogIngestor(broken_factory, result_timeout=2.0)
+    try:
+        with pytest.raises(errors.OperationalError, match='boom'):
+            ingestor.log(ACCESS_LOG, RISK_ROW)
+    finally:
+        ingestor.stop()
@@ -0,0 +1,49 @@
+import numpy as np
+from ai_engine import SecurityAIEngine, BASELINE_DEVIATION_THRESHOLD
+
+def test_baseline_deviation_threshold_is_inclusive():
+    deviations = [BASELINE_DEVIATION_THRESHOLD - 0.01, BASELINE_DEVIATION_THRESHOLD,
+                  BASELINE_DEVIATION_THRESHOLD + 0.01, 1.0]
+    scores = SecurityAIEngine._apply_behaviour_checks(
+        np.full(len(deviations), 0.2), [{'baseline_deviation': d} for d in deviations])
+    assert list(scores < 0) == [False, True, True, True]
+    # Further from the baseline scores lower
+    assert scores[1] > scores[2] > scores[3]
+
+def test_rule_based_fallback_flags_the_threshold_too():
+    engine = SecurityAIEngine.__new__(SecurityAIEngine)
+    result = engine._rule_based_anomaly_detection({'baseline_deviation': BASELINE_DEVIATION_THRESHOLD})
+    assert result['is_anomaly']
+
+class _Candidate:
+    """Stands in for the candidate engine a ShadowScorer runs"""
+
+    def __init__(self, source, reloaded_source):
+        self._runtime_source = source
+        self.reloaded_source = reloaded_source
+
+    def reload_if_changed(self):
+        self._runtime_source = self.reloaded_source
+        return True
+
+def _engine_with_shadow(tmp_path, candidate):
+    from shadow_scoring import ShadowScorer
+    candidate_dir = tmp_path / 'candidate'
+    candidate_dir.mkdir()
+    (candidate_dir / 'ai_runtime.npz').write_bytes(b'not a real artifact')
+    engine = SecurityAIEngine(tmp_path / 'live')
+    engine._shadow = ShadowScorer(candidate, source=str(candidate_dir))
+    engine._shadow_mtime = 0.0  # The candidate was rewritten since it was loaded
+    return engine, candidate_dir
+
+def test_online_refined_candidate_keeps_its_shadow_report(tmp_path):
+    engine, candidate_dir = _engine_with_shadow(tmp_path, _Candidate('2026-01-01T00:00', '2026-01-01T00:00'))
+    scorer = engine._shadow
+    assert engine.sync_shadow(candidate_dir)
+    assert engine._shadow is scorer
+
+def test_newly_trained_candidate_starts_a_new_shadow_report(tmp_path):
+    engine, candidate_dir = _engine_with_shadow(tmp_path, _Candidate('2026-01-01T00:00', '2026-02-01T00:00'))
+    scorer = engine._shadow
+    engine.sync_shadow(candidate_dir)
+    assert engine._shadow is not scorer
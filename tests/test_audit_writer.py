@@ -0,0 +1,99 @@
+import json
+from mysql.connector import errors
+from audit_writer import AuditLogWriter
+from conftest import FakeConnection, FakeCursor, FakeServer
+
+class _RejectingCursor(FakeCursor):
+    """Rejects any audit INSERT carrying an event type in ``server.rejected``"""
+
+    def execute(self, query, params=()):
+        if query.lstrip().startswith('INSERT INTO security_audit_log'):
+            if self.conn.server.down:
+                raise errors.OperationalError("Lost connection to MySQL server")
+            if any(value in self.conn.server.rejected for value in params or ()):
+                raise errors.DataError("Data too long for column 'event_type'")
+        super().execute(query, params)
+
+class _Connection(FakeConnection):
+    def cursor(self, **kwargs):
+        return _RejectingCursor(self, **kwargs)
+
+def _writer(tmp_path, **kwargs):
+    server = FakeServer()
+    server.rejected = {'BAD_EVENT'}
+    server.down = False
+
+    def connect():
+        conn = _Connection(server)
+        server.connections.append(conn)
+        return conn
+
+    writer = AuditLogWriter(connect, spool_dir=str(tmp_path), replay_interval=0, **kwargs)
+    return writer, server
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_rejected_event_is_dead_lettered_and_the_rest_written(tmp_path):
+    writer, server = _writer(tmp_path)
+    for event_type in ('LOGIN', 'BAD_EVENT', 'LOGOUT'):
+        writer.submit(event_type, 'details')
+    writer.stop()
+
+    metrics = writer.metrics()
+    assert metrics['written'] == 2
+    assert metrics['row_fallbacks'] == 1
+    assert metrics['dead_lettered'] == 1
+    assert metrics['spilled'] == 0
+    dead, = tmp_path.glob('dead-letter-*.jsonl')
+    assert [entry['event'][0] for entry in _lines(dead)] == ['BAD_EVENT']
+    assert not list(tmp_path.glob('audit-*.jsonl'))
+
+def test_events_are_spilled_while_the_database_is_down_then_replayed(tmp_path):
+    writer, server = _writer(tmp_path)
+    server.down = True
+    writer.submit('LOGIN', 'details')
+    writer.flush()
+    assert writer.metrics()['spilled'] == 1
+    assert writer.metrics()['dead_lettered'] == 0
+
+    server.down = False
+    writer.flush()
+    writer._maybe_replay()
+    writer.stop()
+    assert writer.metrics()['replayed'] == 1
+    assert not list(tmp_path.glob('audit-*'))
+
+def test_encode_failure_does_not_stop_the_flusher(tmp_path):
+    def encrypt(details):
+        if details == 'unencryptable':
+            raise ValueError("bad key")
+        return details
+
+    writer, server = _writer(tmp_path, encrypt=encrypt)
+    writer.submit('LOGIN', 'unencryptable')
+    writer.submit('LOGIN', 'details')
+    assert writer.flush()
+    writer.submit('LOGOUT', 'details')
+    writer.stop()
+
+    assert writer.metrics()['written'] == 2
+    dead, = tmp_path.glob('dead-letter-*.jsonl')
+    entry, = _lines(dead)
+    assert entry['event'][1] is None  # Never set aside in plain text
+
+def test_corrupt_spool_line_is_skipped_and_the_rest_replayed(tmp_path):
+    writer, server = _writer(tmp_path)
+    good = json.dumps(['LOGIN', 'details', None, 'system', 'system', '2026-01-01T08:00:00', 'auth', 'low', []])
+    # Left behind by a process that no longer exists
+    spool = tmp_path / 'audit-999999999.jsonl'
+    spool.write_text(good + '\n' + good[:20] + '\n')
+    writer._maybe_replay()
+    writer.stop()
+
+    metrics = writer.metrics()
+    assert metrics['replayed'] == 1
+    assert metrics['corrupt_spool_lines'] == 1
+    assert not spool.exists()
+    dead, = tmp_path.glob('dead-letter-*.jsonl')
+    assert _lines(dead)[0]['line'] == good[:20]
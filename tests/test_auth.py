@@ -0,0 +1,27 @@
+import logging
+import pytest
+from mysql.connector import errors
+from auth import log_security_event
+
+class _NoCursorConnection:
+    in_transaction = False
+
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self, **kwargs):
+        raise errors.OperationalError("Lost connection to MySQL server")
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+def test_failed_cursor_is_logged_and_reraised_to_the_transaction_owner(caplog):
+    conn = _NoCursorConnection()
+    with caplog.at_level(logging.ERROR, logger='auth'):
+        with pytest.raises(errors.OperationalError):
+            log_security_event('login_failed', 'bad password', conn=conn)
+    assert 'Lost connection' in caplog.text
+    assert not conn.closed  # Still the caller's connection
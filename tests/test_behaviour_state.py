@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from behaviour_state import AccessStateStore
+
+def _at(minute):
+    # Long before the wall clock, the way a reader's offline backlog arrives
+    return datetime(2020, 1, 1, 8, 0) + timedelta(minutes=minute)
+
+def test_backdated_taps_are_scored_against_their_own_window():
+    store = AccessStateStore(window_seconds=3600)
+    store.record('S1', 'library', _at(0))
+    store.record('S1', 'lab', _at(20))
+    store.record('S1', 'gym', _at(50))
+
+    # Window (08:10, 09:10] holds the lab and gym taps, not the library one
+    assert store.locations_in_window('S1', _at(70)) == 2
+    assert store.minutes_since_last_access('S1', _at(70)) == 20
+
+def test_out_of_order_tap_ignores_later_accesses():
+    store = AccessStateStore(window_seconds=3600)
+    store.record('S1', 'library', _at(0))
+    store.record('S1', 'lab', _at(20))
+    store.record('S1', 'gym', _at(90))
+
+    # A tap at 08:25 that reached the server after the 09:30 one
+    assert store.locations_in_window('S1', _at(25)) == 2
+    assert store.minutes_since_last_access('S1', _at(25)) == 5
+    store.record('S1', 'cafeteria', _at(25))
+    # Window (08:00, 09:00]: lab and cafeteria; the 09:30 gym tap is after it
+    assert store.locations_in_window('S1', _at(60)) == 2
+    assert store.minutes_since_last_access('S1', _at(60)) == 35
+
+def test_pending_taps_are_seen_by_the_batch_only():
+    store = AccessStateStore(window_seconds=3600)
+    store.record('S1', 'library', _at(0))
+    batch = store.pending()
+    batch.record('S1', 'lab', _at(30))
+
+    assert batch.minutes_since_last_access('S1', _at(40)) == 10
+    assert batch.locations_in_window('S1', _at(40)) == 2
+    # Nothing reaches the shared store until the batch is committed
+    assert store.minutes_since_last_access('S1', _at(40)) == 40
+    assert store.locations_in_window('S1', _at(40)) == 1
+    # A student the batch never saw reads straight through
+    store.record('S2', 'gym', _at(0))
+    assert batch.minutes_since_last_access('S2', _at(300)) == 300
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import mysql.connector
+from card_directory import CardDirectory, RevocationSet
+
+class StudentsTable:
+    """Just enough of students / lost_stolen_cards for CardDirectory's queries"""
+
+    def __init__(self):
+        self.now = datetime(2026, 1, 1, 8, 0, 0)
+        self.students = {}
+        self.reports = []
+        self.has_last_updated = True
+
+    def put(self, card_id, status='active'):
+        self.now += timedelta(seconds=1)
+        self.students[card_id] = {'student_id': f'S-{card_id}', 'card_id': card_id,
+                                  'status': status, 'last_updated': self.now}
+
+    def cursor(self):
+        return _Cursor(self)
+
+class _Cursor:
+    def __init__(self, table):
+        self.table = table
+        self.rows = []
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        table = self.table
+        if 'last_updated' in query and not table.has_last_updated:
+            raise mysql.connector.errors.ProgrammingError("Unknown column 'last_updated'")
+        if query.startswith('SELECT MAX(last_updated)'):
+            self.rows = [{'changed': max((s['last_updated'] for s in table.students.values()), default=None)}]
+        elif query.startswith('SELECT card_id, last_updated'):
+            self.rows = [s for s in table.students.values() if s['last_updated'] >= params[0]]
+        elif query.startswith('SELECT * FROM students WHERE card_id ='):
+            self.rows = [dict(s) for s in table.students.values() if _mysql_equal(s['card_id'], params[0])]
+        elif query.startswith('SELECT * FROM students WHERE card_id IN'):
+            self.rows = [dict(s) for s in table.students.values()
+                         if any(_mysql_equal(s['card_id'], card_id) for card_id in params)]
+        elif query.startswith('SELECT report_id, card_id FROM lost_stolen_cards'):
+            # None marks a report whose transaction has not committed yet
+            since = params[0] if 'report_id >' in query else 0
+            self.rows = [{'report_id': i + 1, 'card_id': c} for i, c in enumerate(table.reports)
+                         if c is not None and i + 1 > since]
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+def _mysql_equal(a, b):
+    # Default collations ignore case and trailing spaces
+    return str(a).rstrip(' ').lower() == str(b).rstrip(' ').lower()
+
+def _directory(**kwargs):
+    directory = CardDirectory(RevocationSet(), refresh_interval=0, **kwargs)
+    return directory
+
+def test_status_change_by_another_worker_is_seen_before_ttl():
+    table = StudentsTable()
+    table.put('C1')
+    worker_a, worker_b = _directory(), _directory()
+    assert worker_a.get_student_by_card(table.cursor(), 'C1')['status'] == 'active'
+    assert worker_b.get_student_by_card(table.cursor(), 'C1')['status'] == 'active'
+
+    # Worker A blocks the card; worker B was never told
+    table.put('C1', status='suspended')
+    worker_a.invalidate_card('C1')
+
+    assert worker_b.get_student_by_card(table.cursor(), 'C1')['status'] == 'suspended'
+
+def test_students_are_not_cached_without_a_change_feed():
+    table = StudentsTable()
+    table.has_last_updated = False
+    table.put('C1')
+    directory = _directory()
+    assert directory.get_student_by_card(table.cursor(), 'C1')['status'] == 'active'
+    table.students['C1']['status'] = 'suspended'
+    assert directory.get_student_by_card(table.cursor(), 'C1')['status'] == 'suspended'
+    assert directory.stats()['change_feed'] is False
+
+def test_reported_card_is_found_whatever_case_padding_or_type():
+    revocations = RevocationSet(refresh_interval=0)
+    table = StudentsTable()
+    table.reports = ['CARD-AB12 ', '4711']
+    revocations.load(table.cursor())
+    revocations.add('Card-Zz9')
+
+    for card_id in ('card-ab12', 'CARD-AB12', 'Card-Ab12  ', 4711, '4711 ', 'CARD-ZZ9'):
+        assert revocations.contains(table.cursor(), card_id), card_id
+    assert not revocations.contains(table.cursor(), 'CARD-AB13')
+
+def test_differently_written_card_ids_share_one_cache_entry():
+    table = StudentsTable()
+    table.put('CARD-AB12')
+    directory = _directory()
+    directory.prefetch(table.cursor(), ['card-ab12 '])
+    assert directory.get_student_by_card(table.cursor(), 'Card-AB12')['card_id'] == 'CARD-AB12'
+    assert directory.stats()['students'] == 1
+
+    table.put('CARD-AB12', status='suspended')
+    directory.invalidate_card('card-ab12')
+    assert directory.get_student_by_card(table.cursor(), 'CARD-AB12 ')['status'] == 'suspended'
+
+def test_report_committed_after_a_newer_one_is_picked_up():
+    revocations = RevocationSet(refresh_interval=0)
+    table = StudentsTable()
+    table.reports = ['CARD-1']
+    revocations.load(table.cursor())
+
+    # Report 2 is still in its transaction when report 3 commits and is seen
+    table.reports += [None, 'CARD-3']
+    assert revocations.contains(table.cursor(), 'CARD-3')
+    table.reports[1] = 'CARD-2'
+    assert revocations.contains(table.cursor(), 'CARD-2')
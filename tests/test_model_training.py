@@ -0,0 +1,68 @@
+from pathlib import Path
+import model_training
+from model_training import ModelRetrainer, TRAINED
+
+class _Engine:
+    def __init__(self):
+        self.reloads = 0
+        self.synced = []
+
+    def reload_if_changed(self):
+        self.reloads += 1
+        return True
+
+    def sync_shadow(self, candidate_dir):
+        self.synced.append(candidate_dir)
+        return True
+
+class _Result:
+    returncode = TRAINED
+
+def test_retrain_writes_to_the_shadow_candidate_not_the_live_models(tmp_path, monkeypatch):
+    live, candidate = tmp_path / 'models', tmp_path / 'models' / 'candidate'
+    live.mkdir()
+    configs = []
+    def fake_run(cmd, input, text):
+        configs.append(model_training.json.loads(input))
+        return _Result()
+    monkeypatch.setattr(model_training.subprocess, 'run', fake_run)
+
+    retrainer = ModelRetrainer(lambda: None, {}, model_dir=str(live), shadow_candidate_dir=str(candidate))
+    engine = _Engine()
+    retrainer._retrain(engine)
+
+    assert Path(configs[0]['model_dir']) == candidate
+    assert engine.reloads == 0 and engine.synced == [str(candidate)]
+
+def test_retrain_without_a_candidate_dir_installs_live(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_training.subprocess, 'run', lambda cmd, input, text: _Result())
+    retrainer = ModelRetrainer(lambda: None, {}, model_dir=str(tmp_path))
+    engine = _Engine()
+    retrainer._retrain(engine)
+    assert engine.reloads == 1 and engine.synced == []
+
+def test_online_updates_stay_live_in_shadow_mode(tmp_path, monkeypatch):
+    live, candidate = tmp_path / 'models', tmp_path / 'candidate'
+    live.mkdir()
+    retrainer = ModelRetrainer(lambda: None, {}, model_dir=str(live), online_interval=60,
+                               shadow_candidate_dir=str(candidate))
+    calls = []
+    monkeypatch.setattr(retrainer._online, 'update',
+                        lambda cursor, runtime_file: calls.append(runtime_file) or True)
+    monkeypatch.setattr(model_training.mysql.connector, 'connect', lambda **kwargs: _Connection())
+    engine = _Engine()
+    retrainer._update_online(engine)
+
+    assert calls == [live / 'ai_runtime.npz']
+    assert engine.reloads == 1 and engine.synced == []
+    assert not candidate.exists()
+
+class _Connection:
+    def cursor(self, **kwargs):
+        return self
+
+    def close(self):
+        pass
+
+    def is_connected(self):
+        return True
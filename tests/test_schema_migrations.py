@@ -0,0 +1,97 @@
+import re
+import pytest
+import mysql.connector
+from mysql.connector import errorcode
+import schema_migrations
+
+class Schema:
+    """information_schema for a database made by the original setup script"""
+
+    def __init__(self):
+        self.columns = {
+            'students': {'student_id', 'card_id', 'status'},
+            'security_audit_log': {'log_id', 'event_type', 'event_details', 'timestamp', 'severity'},
+        }
+        self.indexes = {'students': {'PRIMARY'}, 'security_audit_log': {'PRIMARY', 'idx_timestamp'}}
+        self.statements = []
+        self.racing_worker = None  # Applies this statement just before we do
+        self.lock_result = 1  # What GET_LOCK returns: 0 after a timeout
+
+    def cursor(self):
+        return _Cursor(self)
+
+class _Cursor:
+    def __init__(self, schema):
+        self.schema = schema
+        self.rows = []
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        schema = self.schema
+        self.rows = []
+        if 'information_schema.COLUMNS' in query:
+            self.rows = [(t, c) for t, cols in schema.columns.items() for c in cols]
+        elif 'information_schema.STATISTICS' in query:
+            self.rows = [(t, i) for t, idx in schema.indexes.items() for i in idx]
+        elif 'GET_LOCK(' in query:
+            self.rows = [(schema.lock_result,)]
+        elif 'RELEASE_LOCK(' in query:
+            self.rows = [(1,)]
+        else:
+            schema.statements.append(query)
+            if schema.racing_worker and query.startswith(schema.racing_worker):
+                self._apply(query)
+                raise mysql.connector.Error("Duplicate column name", errno=errorcode.ER_DUP_FIELDNAME)
+            self._apply(query)
+
+    def _apply(self, query):
+        schema = self.schema
+        if match := re.match(r'ALTER TABLE (\w+) ADD COLUMN (\w+)', query):
+            schema.columns[match[1]].add(match[2])
+        elif match := re.match(r'ALTER TABLE (\w+) ADD INDEX (\w+)', query):
+            schema.indexes[match[1]].add(match[2])
+        elif match := re.match(r'CREATE TABLE IF NOT EXISTS (\w+)', query):
+            schema.columns[match[1]] = {'keyword', 'log_id'}
+            schema.indexes[match[1]] = {'PRIMARY', 'idx_log_id'}
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+def test_upgrades_an_old_database_once():
+    schema = Schema()
+    applied = schema_migrations.migrate(schema)
+    assert applied == [
+        'add students.last_updated', 'add security_audit_log.user_agent', 'add security_audit_log.risk_level',
+        'add security_audit_log.category', 'add index students.idx_last_updated',
+        'add index security_audit_log.idx_risk_level', 'add index security_audit_log.idx_category',
+        'create table security_audit_keywords'
+    ]
+    assert {'category', 'risk_level', 'user_agent'} <= schema.columns['security_audit_log']
+
+    schema.statements.clear()
+    assert schema_migrations.migrate(schema) == []
+    assert schema.statements == []
+
+def test_step_applied_by_another_worker_is_skipped():
+    schema = Schema()
+    schema.racing_worker = 'ALTER TABLE security_audit_log ADD COLUMN category'
+    applied = schema_migrations.migrate(schema)
+    assert 'add security_audit_log.category' not in applied
+    assert 'create table security_audit_keywords' in applied
+
+def test_empty_database_is_left_to_the_setup_scripts():
+    schema = Schema()
+    schema.columns, schema.indexes = {}, {}
+    assert schema_migrations.migrate(schema) == []
+
+def test_nothing_is_altered_without_the_lock():
+    schema = Schema()
+    schema.lock_result = 0
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        schema_migrations.migrate(schema, lock_timeout=1)
+    assert schema.statements == []
+    assert 'category' not in schema.columns['security_audit_log']
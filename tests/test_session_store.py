@@ -0,0 +1,64 @@
+import ast
+import os
+import pytest
+from session_store import SQLiteSessionStore, MemorySessionStore, create_session_store, session_store_from_config
+
+LOCKOUT = 300
+
+def _store(tmp_path, **options):
+    return SQLiteSessionStore(str(tmp_path / 'sessions.db'), **options)
+
+def test_counts_saturate_at_attempts_per_key(tmp_path):
+    store = _store(tmp_path, attempts_per_key=5)
+    counts = [store.add_attempt('alice', LOCKOUT) for _ in range(8)]
+    assert counts == [1, 2, 3, 4, 5, 5, 5, 5]
+    assert store._execute("SELECT COUNT(*) FROM failed_attempts").fetchone()[0] == 5
+
+def test_username_spray_does_not_reset_a_targeted_lockout(tmp_path):
+    store = _store(tmp_path, max_attempt_keys=50, attempts_per_key=5)
+    for _ in range(3):
+        store.add_attempt('alice', LOCKOUT)
+    for index in range(200):
+        store.add_attempt(f'spray-{index}', LOCKOUT)
+        if index % 20 == 0:
+            store.add_attempt('alice', LOCKOUT)  # The attacker keeps hitting the target
+    store.purge()
+
+    assert store.count_attempts('alice', LOCKOUT) == 5
+    stats = store.attempt_stats()
+    assert stats['identifiers'] == 50
+    assert stats['evicted'] == 151
+
+def test_clear_attempts_forgets_the_identifier(tmp_path):
+    store = _store(tmp_path)
+    store.add_attempt('alice', LOCKOUT)
+    store.clear_attempts('alice')
+    assert store.count_attempts('alice', LOCKOUT) == 0
+    assert store.attempt_stats()['identifiers'] == 0
+
+def test_create_session_store_passes_options_through(tmp_path):
+    memory = create_session_store('memory', max_attempt_keys=7, attempts_per_key=3)
+    assert isinstance(memory, MemorySessionStore)
+    assert memory.attempt_stats()['max_identifiers'] == 7
+    assert memory.attempt_stats()['attempts_per_identifier'] == 3
+    with pytest.raises(TypeError):
+        create_session_store('memory', max_attempt_rows=10)
+
+def _shipped_config():
+    # Read from app.py rather than importing the whole app
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+    with open(path, encoding='utf-8') as f:
+        module = ast.parse(f.read())
+    for node in module.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'SESSION_STORE_CONFIG' for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise AssertionError("SESSION_STORE_CONFIG not found in app.py")
+
+@pytest.mark.parametrize('backend', ['sqlite', 'memory'])
+def test_shipped_config_builds_either_backend(tmp_path, backend):
+    config = _shipped_config()
+    config['backend'] = backend
+    if 'path' in config.get(backend, {}):
+        config[backend]['path'] = str(tmp_path / 'sessions.db')
+    store = session_store_from_config(config)
+    assert isinstance(store, {'sqlite': SQLiteSessionStore, 'memory': MemorySessionStore}[backend])
@@ -6,6 +6,7 @@ Smart Campus Security System - St. Lawrence University
 
 import mysql.connector
 import sys
+import schema_migrations
 from datetime import datetime
 
 # Database configuration (same as app.py)
@@ -48,6 +49,20 @@ def check_database_exists(cursor):
         print(f"❌ Error checking database: {err}")
         return False
 
+def apply_schema_migrations(conn):
+    """Add the columns, indexes and tables newer versions need to an older database"""
+    print("\n🔍 Checking schema migrations...")
+    try:
+        applied = schema_migrations.migrate(conn)
+    except mysql.connector.Error as err:
+        print(f"❌ Schema migration failed: {err}")
+        return False
+    for description in applied:
+        print(f"✅ Applied: {description}")
+    if not applied:
+        print("✅ Schema is up to date")
+    return True
+
 def check_tables(cursor):
     """Check if all required tables exist"""
     print("\n🔍 Checking required tables...")
@@ -58,7 +73,8 @@ def check_tables(cursor):
         'access_logs',
         'security_alerts',
         'system_users',
-        'security_audit_log'
+        'security_audit_log',
+        'security_audit_keywords'
     ]
     
     try:
@@ -225,6 +241,7 @@ def main():
     # Run all checks
     checks = [
         check_database_exists(cursor),
+        apply_schema_migrations(conn),
         check_tables(cursor),
         check_sample_data(cursor),
         test_queries(cursor),